@@ -4,9 +4,21 @@ import sys
 
 # --- Импорты и настройка пути ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
-from code.db_helpers import init_db, get_all_tags, search_public, get_image_as_base64, BASE_DIR
+from code.db_helpers import (
+    init_db, use_read_replica, get_all_tags, get_tag_facets, search_public_page, count_search_public,
+    get_path_children, get_path_records_page, count_path_records,
+)
+from code.image_server import start_image_server, thumbnail_url
+from code.api import start_api_server
+from code.replica import start_replica_publisher
+from code.thumbnails import prefetch_thumbnails
+from code.export import export_controls
+from code.similarity import find_similar_records
 from code.i18n import t, language_selector
-from code.auth import check_password, add_user
+from code.auth import check_password, add_user, restore_session
+from code.profiling import begin_run, begin_fragment_run, stage
+
+begin_run('Main_Page')
 
 # --- 1. Настройка, инициализация и CSS ---
 st.set_page_config(
@@ -15,7 +27,12 @@ st.set_page_config(
     layout="wide",
 )
 RECORDS_PER_PAGE = 30
-init_db()
+BROWSE_MAX_DIRS = 100
+with stage('init'):
+    init_db()
+    start_image_server()
+    start_api_server()
+    start_replica_publisher()
 
 st.markdown("""
 <style>
@@ -36,70 +53,188 @@ if 'main_search_query' not in st.session_state:
     st.session_state.main_search_query = ""
 if 'main_selected_tags' not in st.session_state:
     st.session_state.main_selected_tags = []
-if 'main_search_results' not in st.session_state:
-    st.session_state.main_search_results = []
+if 'main_search_total' not in st.session_state:
+    st.session_state.main_search_total = 0
 if 'main_current_page' not in st.session_state:
     st.session_state.main_current_page = 1
+if 'main_browse_dir' not in st.session_state:
+    st.session_state.main_browse_dir = ""
+if 'main_results_dir' not in st.session_state:
+    st.session_state.main_results_dir = None
 
 # --- 3. Боковая панель ---
+restore_session()
 language_selector()
 st.sidebar.divider()
 if st.session_state.get('authenticated'):
     st.sidebar.success(f"{t('logged_in_as_sidebar')} **{st.session_state.name}**")
 
 # --- 4. UI и логика главной страницы ---
+# Поиск только читает данные, поэтому в режиме реплики идет по снимку базы
+use_read_replica()
 st.title(t('app_title'))
 st.write(t('search_title'))
 
-all_tags = get_all_tags()
+with stage('load_tags'):
+    all_tags = get_all_tags()
+    # Количество записей с тегом среди результатов текущего поиска (без поиска — по всей базе)
+    tag_facets = get_tag_facets(st.session_state.main_search_query, st.session_state.main_selected_tags)
 c1, c2 = st.columns([2, 1])
 search_query = c1.text_input(t('search_by_path'), st.session_state.get('main_search_query', ''))
-selected_tags = c2.multiselect(t('filter_by_tags'), options=all_tags, default=st.session_state.get('main_selected_tags', []))
+selected_tags = c2.multiselect(
+    t('filter_by_tags'), options=all_tags, default=st.session_state.get('main_selected_tags', []),
+    format_func=lambda tag: f"{tag} ({tag_facets.get(tag, 0)})",
+)
 
 if st.button(t('find_button')):
     st.session_state.main_search_query = search_query
     st.session_state.main_selected_tags = selected_tags
     st.session_state.main_current_page = 1
-    with st.spinner(t('searching_spinner')):
-        st.session_state.main_search_results = search_public(text_query=search_query, tag_list=selected_tags)
+    st.session_state.main_similar_to = None
+    st.session_state.main_results_dir = None
+    with st.spinner(t('searching_spinner')), stage('count'):
+        # Общее количество считается один раз на поиск, страницы читаются по запросу
+        st.session_state.main_search_total = count_search_public(text_query=search_query, tag_list=selected_tags)
     st.rerun()
 
+# --- Просмотр по каталогам ---
+# Отдельный фрагмент: переход между каталогами перезапускает только его.
+# Подкаталоги со счетчиками читаются из path_tree по индексу; «Показать
+# записи» заменяет результаты поиска записями выбранного каталога.
+
+def open_dir(directory):
+    st.session_state.main_browse_dir = directory
+
+@st.fragment
+def folder_browser():
+    begin_fragment_run('Main_Page:browse')
+    use_read_replica()
+    current_dir = st.session_state.main_browse_dir
+    parts = current_dir.split('/') if current_dir else []
+    crumbs = st.columns(len(parts) + 1)
+    crumbs[0].button(t('browse_root'), key='browse_crumb_root', on_click=open_dir, args=("",), disabled=not parts)
+    for i, part in enumerate(parts):
+        crumbs[i + 1].button(part, key=f'browse_crumb_{i}', on_click=open_dir, args=("/".join(parts[:i + 1]),), disabled=i == len(parts) - 1)
+
+    if current_dir and st.button(t('browse_show_records'), key='browse_show_records'):
+        st.session_state.main_results_dir = current_dir
+        st.session_state.main_search_query = ""
+        st.session_state.main_selected_tags = []
+        st.session_state.main_current_page = 1
+        st.session_state.main_similar_to = None
+        st.session_state.main_search_total = count_path_records(current_dir)
+        st.rerun()
+
+    with stage('browse_children'):
+        children = get_path_children(current_dir)
+    if not children:
+        st.caption(t('browse_empty'))
+    for directory, records, photos in children[:BROWSE_MAX_DIRS]:
+        d1, d2 = st.columns([3, 2])
+        d1.button(f"📁 {directory.rpartition('/')[2]}", key=f'browse_dir_{directory}', on_click=open_dir, args=(directory,))
+        d2.caption(t('browse_counts', records=records, photos=photos))
+    if len(children) > BROWSE_MAX_DIRS:
+        st.caption(t('browse_more', count=len(children) - BROWSE_MAX_DIRS))
+
+with st.expander(t('browse_title'), expanded=bool(st.session_state.main_browse_dir)):
+    folder_browser()
+
 # --- Отображение результатов ---
-search_results = st.session_state.get('main_search_results', [])
-if search_results:
-    total_records = len(search_results)
-    total_pages = max(1, (total_records + RECORDS_PER_PAGE - 1) // RECORDS_PER_PAGE)
-    current_page = st.session_state.get('main_current_page', 1); current_page = min(current_page, total_pages); st.session_state.main_current_page = current_page
-    start_idx, end_idx = (current_page - 1) * RECORDS_PER_PAGE, current_page * RECORDS_PER_PAGE
-    records_to_display = search_results[start_idx:end_idx]
-    
-    st.write(f"{t('records_found')} {total_records}")
-    st.divider()
-
-    cols = st.columns([2, 4, 2, 3, 2, 2])
-    cols[0].subheader(t('table_header_table')); cols[1].subheader(t('table_header_path')); cols[2].subheader(t('table_header_subfile'))
-    cols[3].subheader(t('table_header_comment')); cols[4].subheader(t('table_header_photo')); cols[5].subheader(t('table_header_tags'))
-
-    for r in records_to_display:
-        row_cols = st.columns([2, 5, 1, 3, 2, 2])
-        row_cols[0].write(r['source_table'])
-        row_cols[1].markdown(f"`{r['Путь']}`")
-        row_cols[2].write(r['Подфайл'] or '')
-        row_cols[3].write(r['Комментарий'] or '')
-        if r['Фото'] and os.path.exists(os.path.join(BASE_DIR, r['Фото'])):
-            b64_image = get_image_as_base64(r['Фото'])
-            if b64_image:
-                row_cols[4].markdown(f'<div class="img-container"><img src="data:image/png;base64,{b64_image}"></div>', unsafe_allow_html=True)
+# Результаты — отдельный фрагмент: листание страниц и переход к похожим
+# перезапускают только его, без поля поиска, тегов и боковой панели. Строки
+# рисуются сразу с текстом, а ячейки фото заполняются после цикла, когда
+# фоновый пул подготовит миниатюры; затем пул заранее готовит следующую страницу.
+# Кнопки внутри фрагмента меняют состояние в on_click: нажатие уже перезапускает
+# фрагмент, а st.rerun(scope='fragment') при полном перезапуске недоступен.
+
+def fetch_results_page(page):
+    """Страница текущих результатов: записи выбранного каталога или поиска."""
+    if st.session_state.main_results_dir:
+        return get_path_records_page(st.session_state.main_results_dir, page=page, per_page=RECORDS_PER_PAGE)
+    return search_public_page(
+        text_query=st.session_state.main_search_query, tag_list=st.session_state.main_selected_tags,
+        page=page, per_page=RECORDS_PER_PAGE,
+    )
+
+def turn_page(delta):
+    st.session_state.main_current_page += delta
+
+def show_similar(similar_to):
+    st.session_state.main_similar_to = similar_to
+
+def render_image_cell(cell, r, thumb_key):
+    if not thumb_key:
+        cell.markdown('<div class="img-container">---</div>', unsafe_allow_html=True)
+        return
+    img_url = thumbnail_url(r['Фото'], thumb_key)
+    cell.markdown(f'<div class="img-container"><img src="{img_url}" loading="lazy"></div>', unsafe_allow_html=True)
+    cell.button(
+        t('similar_button'), key=f"similar_{r['source_table']}_{r['rowid']}",
+        on_click=show_similar, args=({'path': r['Фото'], 'key': (r['source_table'], r['rowid'])},),
+    )
+
+@st.fragment
+def results_grid():
+    begin_fragment_run('Main_Page:results')
+    use_read_replica()
+    # Режим «похожие изображения» заменяет результаты поиска, пока пользователь не вернется к ним
+    similar_to = st.session_state.get('main_similar_to')
+    total_records = st.session_state.get('main_search_total', 0)
+    records_to_display, total_pages = [], 0
+    if similar_to:
+        st.subheader(f"{t('similar_images_title')}: `{similar_to['path']}`")
+        st.button(t('similar_back_button'), on_click=show_similar, args=(None,))
+        with stage('similar'):
+            records_to_display = [record for record, _ in find_similar_records(similar_to['path'], limit=RECORDS_PER_PAGE, exclude=similar_to['key'])]
+        if not records_to_display:
+            st.info(t('no_similar_found'))
+    elif total_records:
+        total_pages = max(1, (total_records + RECORDS_PER_PAGE - 1) // RECORDS_PER_PAGE)
+        current_page = st.session_state.get('main_current_page', 1); current_page = min(current_page, total_pages); st.session_state.main_current_page = current_page
+        with stage('fetch_page'):
+            records_to_display = fetch_results_page(current_page)
+        r1, r2 = st.columns([4, 1])
+        if st.session_state.main_results_dir:
+            r1.write(f"{t('browse_records_in')} `{st.session_state.main_results_dir}`: {total_records}")
         else:
-            row_cols[4].markdown('<div class="img-container">---</div>', unsafe_allow_html=True)
-        row_cols[5].write(r['tags'] or '')
+            r1.write(f"{t('records_found')} {total_records}")
+            with r2:
+                export_controls(text_query=st.session_state.main_search_query, tag_list=st.session_state.main_selected_tags, key='main_export')
+    elif st.session_state.get('main_search_query') or st.session_state.get('main_selected_tags'):
+        st.info(t('no_records_found'))
+
+    if records_to_display:
+        thumbs = prefetch_thumbnails([r['Фото'] for r in records_to_display])
         st.divider()
 
-    p1, p2, p3 = st.columns([3, 1, 3])
-    if p1.button(t('pagination_prev'), disabled=(current_page <= 1)):
-        st.session_state.main_current_page -= 1; st.rerun()
-    p2.write(f"{t('pagination_page')} {current_page} {t('pagination_of')} {total_pages}")
-    if p3.button(t('pagination_next'), disabled=(current_page >= total_pages)):
-        st.session_state.main_current_page += 1; st.rerun()
-elif st.session_state.get('main_search_query') or st.session_state.get('main_selected_tags'):
-    st.info(t('no_records_found'))
+        cols = st.columns([2, 4, 2, 3, 2, 2])
+        cols[0].subheader(t('table_header_table')); cols[1].subheader(t('table_header_path')); cols[2].subheader(t('table_header_subfile'))
+        cols[3].subheader(t('table_header_comment')); cols[4].subheader(t('table_header_photo')); cols[5].subheader(t('table_header_tags'))
+
+        with stage('render_rows'):
+            image_cells = []
+            for r in records_to_display:
+                row_cols = st.columns([2, 5, 1, 3, 2, 2])
+                row_cols[0].write(r['source_table'])
+                row_cols[1].markdown(f"`{r['Путь']}`")
+                row_cols[2].write(r['Подфайл'] or '')
+                row_cols[3].write(r['Комментарий'] or '')
+                image_cells.append((row_cols[4].container(), r))
+                row_cols[5].write(r['tags'] or '')
+                st.divider()
+        with stage('render_images'):
+            for cell, r in image_cells:
+                render_image_cell(cell, r, thumbs[r['Фото']].result() if r['Фото'] else None)
+        # Следующая страница — после отрисовки текущей, чтобы не задерживать ее строки
+        if total_pages and current_page < total_pages:
+            with stage('prefetch_next'):
+                next_page = fetch_results_page(current_page + 1)
+                prefetch_thumbnails([r['Фото'] for r in next_page])
+
+    if total_pages and not similar_to:
+        p1, p2, p3 = st.columns([3, 1, 3])
+        p1.button(t('pagination_prev'), disabled=(current_page <= 1), on_click=turn_page, args=(-1,))
+        p2.write(f"{t('pagination_page')} {current_page} {t('pagination_of')} {total_pages}")
+        p3.button(t('pagination_next'), disabled=(current_page >= total_pages), on_click=turn_page, args=(1,))
+
+results_grid()
@@ -0,0 +1,391 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import urllib.request
+
+# Корень проекта должен идти раньше стандартной библиотеки: иначе пакет code
+# перекрывается одноименным модулем stdlib.
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from streamlit import logger as streamlit_logger
+# Вне `streamlit run` кэши Streamlit пишут предупреждение на каждый вызов
+streamlit_logger.set_log_level('error')
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+from code import db_helpers
+from code.auth import AUTH_COOKIE, add_user, issue_token
+from code.i18n import t
+from benchmarks.run import MAIN_PAGE, summarize, _git_commit
+from benchmarks.synthetic import generate_database, DEFAULT_PARAMS
+
+# --- Нагрузочный прогон страниц ---
+# Запуск: python -m benchmarks.load --sessions 1,10,25,50 --duration 30 --output load.json
+# Поднимает `streamlit run Main_Page.py` на синтетической (или скопированной
+# через --db) базе и подключает к нему сессии — headless-клиенты протокола
+# Streamlit поверх websocket, как вкладки браузера. Сессии выполняют сценарии
+# пользователей: поиск, фильтр по тегам, листание результатов; доля сессий —
+# администраторы (выбор таблицы, листание, правка комментария записи).
+# Для каждого уровня параллелизма считаются перезапуски скрипта в секунду,
+# p50/p95/p99 задержки от отправки действия до конца прогона и RSS сервера.
+# Потолок — наибольший уровень, на котором p95 укладывается в --p95-limit-ms.
+# AppTest для этого не подходит: он подменяет глобальный Runtime Streamlit
+# и не работает из нескольких потоков одного процесса.
+
+ADMIN_PAGE = 'Admin_Page'
+ADMIN_USER = 'load-admin'
+# Токен сессии привязан к User-Agent, поэтому все клиенты представляются одинаково
+USER_AGENT = 'entb-load'
+QUERIES = ['menu', 'head', 'cards', 'player', 'logo', 'screens', 'texlib', 'game', 'jersey', 'unpacked']
+EDIT_BUTTON_ID = re.compile(r'-edit_\d+$')
+SERVER_START_TIMEOUT_S = 60
+RSS_SAMPLE_INTERVAL_S = 0.25
+
+class SessionError(Exception):
+    pass
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def read_rss(pid):
+    """Текущий RSS процесса в байтах (Linux) или None."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def _mb(value):
+    return round(value / 2 ** 20, 1) if value is not None else None
+
+class Session:
+    """Одна вкладка браузера: websocket, значения виджетов и элементы последнего прогона."""
+
+    def __init__(self, base_url, page='', cookies=None):
+        self.url = base_url.replace('http', 'ws', 1) + '/_stcore/stream'
+        self.page = page
+        self.cookies = cookies or {}
+        self.page_hash = ''
+        self.elements = {}
+        self.widgets = {}
+        self.ws = None
+
+    async def connect(self):
+        headers = {'User-Agent': USER_AGENT}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        self.ws = await websocket_connect(HTTPRequest(self.url, headers=headers), subprotocols=['streamlit'], max_message_size=256 * 2 ** 20)
+
+    def close(self):
+        if self.ws: self.ws.close()
+
+    async def rerun(self, triggers=(), fragment_id=''):
+        """Отправляет перезапуск и ждет конца прогона. Возвращает задержку в мс."""
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.query_string = ''
+        state.page_name = self.page
+        state.page_script_hash = self.page_hash
+        state.fragment_id = fragment_id
+        for widget in [*self.widgets.values(), *triggers]:
+            state.widget_states.widgets.add().CopyFrom(widget)
+        if fragment_id:
+            self.elements = {path: item for path, item in self.elements.items() if item[0] != fragment_id}
+        else:
+            self.elements = {}
+        started = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        while True:
+            data = await self.ws.read_message()
+            if data is None:
+                raise SessionError("сервер закрыл соединение")
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':
+                self.page_hash = forward.new_session.page_script_hash
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                if element.WhichOneof('type') == 'exception':
+                    raise SessionError(element.exception.message)
+                self.elements[tuple(forward.metadata.delta_path)] = (forward.delta.fragment_id, element)
+            elif kind == 'script_finished' and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                if forward.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise SessionError("ошибка компиляции страницы")
+                break
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # Как и браузер, сессия помнит значения только видимых виджетов
+        visible = {self._widget(element).id for _, element in self.elements.values() if self._widget(element) is not None}
+        self.widgets = {widget_id: value for widget_id, value in self.widgets.items() if widget_id in visible}
+        return elapsed_ms
+
+    @staticmethod
+    def _widget(element):
+        kind = element.WhichOneof('type')
+        widget = getattr(element, kind)
+        return widget if hasattr(widget, 'id') and hasattr(widget, 'label') else None
+
+    def find(self, kind, label=None, match=None):
+        """Видимые виджеты типа kind в порядке отрисовки: [(фрагмент, виджет)]."""
+        found = []
+        for path in sorted(self.elements):
+            fragment_id, element = self.elements[path]
+            if element.WhichOneof('type') != kind: continue
+            widget = getattr(element, kind)
+            if label is not None and widget.label != label: continue
+            if match is not None and not match(widget): continue
+            found.append((fragment_id, widget))
+        return found
+
+    def set_value(self, widget, value):
+        state = WidgetState(id=widget.id)
+        if isinstance(value, list):
+            state.string_array_value.data.extend(value)
+        else:
+            state.string_value = value
+        self.widgets[widget.id] = state
+
+    async def click(self, found):
+        fragment_id, button = found
+        return await self.rerun([WidgetState(id=button.id, trigger_value=True)], fragment_id)
+
+class Scenario:
+    """Сценарий пользователя: последовательность действий с замером каждого перезапуска."""
+
+    def __init__(self, session, rng, think_s, record):
+        self.session = session
+        self.rng = rng
+        self.think_s = think_s
+        self.record = record
+
+    async def act(self, name, action):
+        if self.think_s:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think_s))
+        self.record(name, await action)
+
+    async def _next_pages(self, name, count):
+        for _ in range(count):
+            buttons = self.session.find('button', t('pagination_next'), lambda button: not button.disabled)
+            if not buttons: return
+            await self.act(name, self.session.click(buttons[0]))
+
+class PublicScenario(Scenario):
+    async def open(self):
+        await self.act('main.open', self.session.rerun())
+
+    async def step(self):
+        session = self.session
+        session.set_value(session.find('text_input', t('search_by_path'))[0][1], self.rng.choice(QUERIES))
+        tags = session.find('multiselect', t('filter_by_tags'))
+        if tags and tags[0][1].options and self.rng.random() < 0.5:
+            session.set_value(tags[0][1], self.rng.sample(list(tags[0][1].options), k=1))
+        elif tags:
+            session.set_value(tags[0][1], [])
+        await self.act('main.search', session.click(session.find('button', t('find_button'))[0]))
+        await self._next_pages('main.next_page', self.rng.randint(1, 3))
+        previous = session.find('button', t('pagination_prev'), lambda button: not button.disabled)
+        if previous:
+            await self.act('main.prev_page', session.click(previous[0]))
+
+class AdminScenario(Scenario):
+    async def open(self):
+        await self.act('admin.open', self.session.rerun())
+        if not self.session.find('selectbox', t('table_header_table')):
+            raise SessionError("администратор не вошел: нет выбора таблицы")
+
+    async def step(self):
+        session = self.session
+        table_select = session.find('selectbox', t('table_header_table'))[0][1]
+        tables = [option for option in table_select.options if option != t('all_tables')]
+        session.set_value(table_select, self.rng.choice(tables))
+        await self.act('admin.select_table', session.rerun())
+        await self._next_pages('admin.next_page', self.rng.randint(0, 2))
+        edit_buttons = session.find('button', match=lambda button: EDIT_BUTTON_ID.search(button.id))
+        if not edit_buttons: return
+        await self.act('admin.edit', session.click(self.rng.choice(edit_buttons)))
+        comment = session.find('text_area', t('edit_form_comment'))
+        save = session.find('button', t('save_button'), lambda button: button.is_form_submitter and button.form_id.startswith('edit_form_'))
+        if comment and save:
+            session.set_value(comment[0][1], f'load {self.rng.randrange(10 ** 6)}')
+            await self.act('admin.save', session.click(save[0]))
+
+async def _run_session(base_url, admin, admin_token, deadline, rng, think_s, record, errors):
+    session = Session(base_url, ADMIN_PAGE if admin else '', {AUTH_COOKIE: admin_token} if admin else None)
+    scenario = (AdminScenario if admin else PublicScenario)(session, rng, think_s, record)
+    try:
+        await session.connect()
+        await scenario.open()
+        while time.monotonic() < deadline:
+            await scenario.step()
+    except (SessionError, IndexError, OSError) as e:
+        errors.append(f'{type(e).__name__}: {e}')
+    finally:
+        session.close()
+
+async def _sample_rss(pid, samples, stop):
+    while not stop.is_set():
+        rss = read_rss(pid)
+        if rss is not None: samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_SAMPLE_INTERVAL_S)
+        except asyncio.TimeoutError:
+            pass
+
+async def run_level(base_url, server_pid, sessions, duration, admin_share, admin_token, think_s, seed):
+    """Один уровень параллелизма: sessions сессий в течение duration секунд."""
+    samples, errors = {}, []
+    def record(name, elapsed_ms):
+        samples.setdefault(name, []).append(elapsed_ms)
+    admins = round(sessions * admin_share)
+    rss_start = read_rss(server_pid)
+    rss_samples, stop = [], asyncio.Event()
+    sampler = asyncio.ensure_future(_sample_rss(server_pid, rss_samples, stop))
+    started = time.perf_counter()
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(
+        _run_session(base_url, i < admins, admin_token, deadline, random.Random(seed * 1000 + i), think_s, record, errors)
+        for i in range(sessions)
+    ))
+    elapsed_s = time.perf_counter() - started
+    stop.set()
+    await sampler
+    rss_end = read_rss(server_pid)
+    latencies = [value for values in samples.values() for value in values]
+    return {
+        'sessions': sessions,
+        'admin_sessions': admins,
+        'elapsed_s': round(elapsed_s, 3),
+        'reruns': len(latencies),
+        'reruns_per_s': round(len(latencies) / elapsed_s, 2),
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'latency': summarize(latencies) if latencies else None,
+        'actions': {name: summarize(values) for name, values in sorted(samples.items())},
+        'rss_start_mb': _mb(rss_start),
+        'rss_end_mb': _mb(rss_end),
+        'rss_peak_mb': _mb(max(rss_samples, default=None)),
+        'rss_growth_mb': _mb(rss_end - rss_start) if rss_start and rss_end else None,
+    }
+
+def start_server(db_path, port):
+    env = dict(os.environ, APP_DB_FILE=db_path, APP_PHOTO_SCAN='0')
+    server = subprocess.Popen([
+        sys.executable, '-m', 'streamlit', 'run', MAIN_PAGE,
+        '--server.headless', 'true', '--server.port', str(port), '--server.address', '127.0.0.1',
+        '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false',
+    ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"streamlit завершился с кодом {server.returncode}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1) as response:
+                if response.read() == b'ok': return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("streamlit не запустился")
+
+def find_ceiling(levels, p95_limit_ms):
+    """Наибольшее число сессий, при котором p95 не выше порога и нет ошибок."""
+    ceiling = None
+    for level in levels:
+        if level['errors'] or not level['latency'] or level['latency']['p95_ms'] > p95_limit_ms: break
+        ceiling = level['sessions']
+    return ceiling
+
+async def run_load(base_url, server_pid, levels, duration, admin_share, admin_token, think_s, seed):
+    # Прогрев: первый прогон страниц заполняет кэши и пул соединений сервера
+    await run_level(base_url, server_pid, 2, 0, 0.5 if admin_share else 0, admin_token, 0, seed)
+    results = []
+    for sessions in levels:
+        level = await run_level(base_url, server_pid, sessions, duration, admin_share, admin_token, think_s, seed)
+        results.append(level)
+        latency = level['latency'] or {}
+        print(f"{sessions:5d} сессий  {level['reruns_per_s']:8.2f} перезапусков/с  "
+              f"p50 {latency.get('median_ms', 0):9.1f}  p95 {latency.get('p95_ms', 0):9.1f}  p99 {latency.get('p99_ms', 0):9.1f} мс  "
+              f"RSS {level['rss_end_mb']} МБ (+{level['rss_growth_mb']})  ошибок {level['errors']}", flush=True)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон страниц через сервер Streamlit и headless-сессии.")
+    parser.add_argument('--sessions', default='1,10,25,50', help="Уровни параллелизма через запятую.")
+    parser.add_argument('--duration', type=float, default=30, help="Длительность каждого уровня, секунды.")
+    parser.add_argument('--admin-share', type=float, default=0.1, help="Доля сессий администратора.")
+    parser.add_argument('--think-ms', type=float, default=500, help="Средняя пауза пользователя между действиями.")
+    parser.add_argument('--p95-limit-ms', type=float, default=1000, help="Порог p95 для определения потолка.")
+    parser.add_argument('--output', default='load_results.json')
+    parser.add_argument('--db', default=None, help="Готовая база (копируется: сценарий администратора ее меняет).")
+    parser.add_argument('--workdir', default=None, help="Каталог для базы и изображений (по умолчанию временный).")
+    parser.add_argument('--force', action='store_true', help="Перезаписать app.db, уже лежащую в --workdir.")
+    parser.add_argument('--tables', type=int, default=DEFAULT_PARAMS['tables'])
+    parser.add_argument('--rows', type=int, default=DEFAULT_PARAMS['rows_per_table'])
+    parser.add_argument('--photo-ratio', type=float, default=DEFAULT_PARAMS['photo_ratio'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_PARAMS['seed'])
+    args = parser.parse_args(argv)
+    levels = [int(value) for value in args.sessions.split(',') if value.strip()]
+    if args.workdir and os.path.exists(os.path.join(args.workdir, 'app.db')) and not args.force:
+        parser.error(f"{os.path.join(args.workdir, 'app.db')} уже существует; --force перезапишет его")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='entb-load-')
+    server = None
+    try:
+        db_path = os.path.join(workdir, 'app.db')
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+            params = {'db': os.path.abspath(args.db)}
+        else:
+            params = generate_database(db_path, os.path.join(workdir, 'img'), tables=args.tables, rows_per_table=args.rows,
+                                       photo_ratio=args.photo_ratio, seed=args.seed, overwrite=args.force)
+        db_helpers.DB_FILE = db_path
+        db_helpers.init_db()
+        add_user(ADMIN_USER, os.urandom(16).hex(), 'Load test', 1)
+        admin_token = issue_token(ADMIN_USER, user_agent=USER_AGENT)
+
+        port = _free_port()
+        server = start_server(db_path, port)
+        base_url = f'http://127.0.0.1:{port}'
+        levels_results = asyncio.run(run_load(base_url, server.pid, levels, args.duration, args.admin_share, admin_token, args.think_ms / 1000, args.seed))
+        results = {
+            'commit': _git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': params,
+            'load': {'duration_s': args.duration, 'admin_share': args.admin_share, 'think_ms': args.think_ms, 'p95_limit_ms': args.p95_limit_ms},
+            'levels': levels_results,
+            'ceiling_sessions': find_ceiling(levels_results, args.p95_limit_ms),
+        }
+    finally:
+        if server:
+            server.terminate()
+            server.wait(10)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Потолок при p95 <= {args.p95_limit_ms:.0f} мс: {results['ceiling_sessions'] or 'не достигнут ни на одном уровне'} сессий")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Корень проекта должен идти раньше стандартной библиотеки: иначе пакет code
+# перекрывается одноименным модулем stdlib.
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from streamlit import logger as streamlit_logger
+# Вне `streamlit run` кэши Streamlit пишут предупреждение на каждый вызов
+streamlit_logger.set_log_level('error')
+from code import db_helpers, image_server, thumbnails
+from code.auth import add_user, check_password
+from code.i18n import t
+from code.api import create_api_server
+from benchmarks.synthetic import generate_database, DEFAULT_PARAMS
+
+# --- Бенчмарки горячих путей ---
+# Запуск: python -m benchmarks.run --output results.json [--compare baseline.json]
+# Генерирует синтетическую базу и изображения во временном каталоге, замеряет
+# поиск, списки записей, миниатюры и их отдачу по HTTP, проверку пароля и полный
+# рендер Main_Page.py через AppTest, а результаты сохраняет в JSON.
+
+MAIN_PAGE = os.path.join(ROOT, 'Main_Page.py')
+TEXT_QUERY = 'menu'
+TAG_QUERY = ['tag001']
+BOTH_TAGS = ['tag001', 'tag002']
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+def measure(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup: setup()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+def clear_result_cache():
+    db_helpers._result_cache.clear()
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _main_page_search(query, tags, next_page=False):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(MAIN_PAGE, default_timeout=60).run()
+    at.text_input[0].input(query)
+    if tags:
+        at.multiselect[0].set_value(tags)
+    at.button[0].click().run()
+    if next_page:
+        next_buttons = [button for button in at.button if button.label == t('pagination_next')]
+        if next_buttons: next_buttons[0].click().run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+def run_benchmarks(repeat, page_repeat):
+    results = {}
+    table = db_helpers.get_table_names()[0]
+
+    for name, args in (('text', (TEXT_QUERY, [])), ('tags', ('', TAG_QUERY)), ('text_and_tags', (TEXT_QUERY, BOTH_TAGS))):
+        results[f'search_public.{name}.cold'] = measure(lambda: db_helpers.search_public(*args), repeat, clear_result_cache)
+        results[f'search_public.{name}.warm'] = measure(lambda: db_helpers.search_public(*args), repeat)
+        results[f'search_public_page.{name}.cold'] = measure(lambda: db_helpers.search_public_page(*args, page=2), repeat, clear_result_cache)
+        results[f'search_public_page.{name}.warm'] = measure(lambda: db_helpers.search_public_page(*args, page=2), repeat)
+
+    results['get_records.table'] = measure(lambda: db_helpers.get_records(table), repeat, clear_result_cache)
+    results['get_records.search.cold'] = measure(lambda: db_helpers.get_records(table, TEXT_QUERY), repeat, clear_result_cache)
+    results['get_records_page.table'] = measure(lambda: db_helpers.get_records_page(table, page=5), repeat)
+    results['global_search_records.cold'] = measure(lambda: db_helpers.global_search_records(TEXT_QUERY), repeat, clear_result_cache)
+    results['global_search_records.warm'] = measure(lambda: db_helpers.global_search_records(TEXT_QUERY), repeat)
+
+    photo = next((row['Фото'] for row in db_helpers.get_records(table) if row['Фото']), None)
+    if photo:
+        results.update(_thumbnail_benchmarks(photo, repeat))
+
+    add_user('bench', 'bench-password', 'Bench', 1)
+    results['check_password'] = measure(lambda: check_password('bench', 'bench-password'), max(3, repeat // 10))
+
+    server = create_api_server('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f'http://127.0.0.1:{server.server_address[1]}/api'
+    try:
+        results['api.search'] = measure(lambda: _api_get(f'{api_url}/search?q={TEXT_QUERY}&page=2'), repeat)
+        results['api.search.not_modified'] = measure(lambda: _api_get(f'{api_url}/search?q={TEXT_QUERY}&page=2', etag=True), repeat)
+        results['api.tags'] = measure(lambda: _api_get(f'{api_url}/tags'), repeat)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    results['main_page.initial'] = measure(_run_main_page, page_repeat)
+    results['main_page.search'] = measure(lambda: _main_page_search(TEXT_QUERY, BOTH_TAGS[:1]), page_repeat, clear_result_cache)
+    results['main_page.search_next_page'] = measure(lambda: _main_page_search(TEXT_QUERY, [], next_page=True), page_repeat)
+    return results
+
+def _thumbnail_benchmarks(photo, repeat):
+    """Ссылка на миниатюру, как ее строит страница, и отдача миниатюры сервером изображений."""
+    from code.image_server import create_image_server, thumbnail_url
+    from code.thumbnails import prefetch_thumbnails, thumbnail_key, _thumbnail_file
+    results = {}
+    render = lambda: thumbnail_url(photo, prefetch_thumbnails([photo])[photo].result())
+    drop = lambda: os.path.exists(_thumbnail_file(thumbnail_key(photo))) and os.remove(_thumbnail_file(thumbnail_key(photo)))
+    results['thumbnail_url.cold'] = measure(render, repeat, drop)
+    results['thumbnail_url.warm'] = measure(render, repeat)
+
+    server = create_image_server('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/thumbs/300x200/{urllib.parse.quote(photo)}?v=1'
+    try:
+        results['image_server.thumb.cold'] = measure(lambda: _api_get(url), repeat, drop)
+        results['image_server.thumb.warm'] = measure(lambda: _api_get(url), repeat)
+        results['image_server.thumb.not_modified'] = measure(lambda: _api_get(url, etag=True), repeat)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+def _api_get(url, etag=False):
+    headers = {'Accept-Encoding': 'gzip'}
+    if etag:
+        with urllib.request.urlopen(url) as response: headers['If-None-Match'] = response.headers['ETag']
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response: return response.read()
+    except urllib.error.HTTPError as e:
+        if e.code != 304: raise
+
+def _run_main_page():
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(MAIN_PAGE, default_timeout=60).run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+def compare(results, baseline, threshold):
+    """Печатает отношение медиан к базовому прогону; возвращает список регрессий."""
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if not base or not base['median_ms']: continue
+        ratio = current['median_ms'] / base['median_ms']
+        mark = ' <-- регрессия' if ratio > threshold else ''
+        print(f"{name:45s} {base['median_ms']:10.3f} -> {current['median_ms']:10.3f} ms  x{ratio:5.2f}{mark}")
+        if ratio > threshold: regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки горячих путей на синтетической базе.")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', default=None, help="JSON предыдущего прогона для сравнения.")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Отношение медиан, считающееся регрессией.")
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--page-repeat', type=int, default=5, help="Повторы рендера страницы через AppTest.")
+    parser.add_argument('--workdir', default=None, help="Каталог для базы и изображений (по умолчанию временный).")
+    parser.add_argument('--force', action='store_true', help="Перезаписать app.db, уже лежащую в --workdir.")
+    parser.add_argument('--tables', type=int, default=DEFAULT_PARAMS['tables'])
+    parser.add_argument('--rows', type=int, default=DEFAULT_PARAMS['rows_per_table'])
+    parser.add_argument('--tags', type=int, default=DEFAULT_PARAMS['tag_count'])
+    parser.add_argument('--photo-ratio', type=float, default=DEFAULT_PARAMS['photo_ratio'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_PARAMS['seed'])
+    args = parser.parse_args(argv)
+
+    if args.workdir and os.path.exists(os.path.join(args.workdir, 'app.db')) and not args.force:
+        parser.error(f"{os.path.join(args.workdir, 'app.db')} уже существует; --force перезапишет его")
+    workdir = args.workdir or tempfile.mkdtemp(prefix='entb-bench-')
+    try:
+        db_path = os.path.join(workdir, 'app.db')
+        params = generate_database(
+            db_path, os.path.join(workdir, 'img'), tables=args.tables, rows_per_table=args.rows,
+            tag_count=args.tags, photo_ratio=args.photo_ratio, seed=args.seed, overwrite=args.force,
+        )
+        db_helpers.DB_FILE = db_path
+        os.environ['APP_DB_FILE'] = db_path
+        # Синтетическая база не должна сверяться с настоящим деревом img/
+        os.environ['APP_PHOTO_SCAN'] = '0'
+        db_helpers.init_db()
+        # Миниатюры и отдача фото — из рабочего каталога, а не из дерева проекта
+        thumbnails.THUMB_DIR = os.path.join(workdir, 'thumbs')
+        image_server.IMG_DIR = os.path.realpath(os.path.join(workdir, 'img'))
+
+        results = {
+            'commit': _git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': db_helpers.sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'params': params,
+            'benchmarks': run_benchmarks(args.repeat, args.page_repeat),
+        }
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    for name, summary in results['benchmarks'].items():
+        print(f"{name:45s} median {summary['median_ms']:10.3f} ms  p95 {summary['p95_ms']:10.3f} ms")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
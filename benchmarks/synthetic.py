@@ -0,0 +1,130 @@
+import os
+import sys
+import random
+import sqlite3
+import argparse
+from PIL import Image, ImageDraw
+
+# --- Генератор синтетической базы ---
+# Создает app.db с таблицами записей того же вида, что и рабочая база
+# ("Путь", "Подфайл", "Комментарий", "Фото", tags), пути в духе дерева img/
+# и, по желанию, набор изображений для записей с фото. Пути к синтетическим
+# фото записываются абсолютными, поэтому набор можно держать вне проекта.
+
+TOP_DIRS = [
+    ('boot', 'fe'), ('cache', 'fe'), ('cacheboot', 'fe'), ('cacheoverlay', 'fe'), ('cacherender', 'rendering'),
+    ('nocache', 'fe'), ('nocacherender', 'rendering'), ('patch', 'fe'), ('renderboot', 'rendering'),
+]
+FE_SEGMENTS = [
+    ['ion', 'artassets', 'createplayer', ['head', 'mask', 'blocker', 'skates', 'sticks']],
+    ['ion', 'artassets', ['playerheadssmall', 'teamnumbers', 'twittericonsteam', 'cards']],
+    ['ion', 'game', 'components', ['menu', 'nhltickerad', 'nhltickerbackground', 'nhlbackgroundmovieplayer']],
+    ['ion', 'game', 'screens', 'playnow', ['01_selectteams08', 'familyplay', 'injury_report', 'loadingscreen']],
+]
+RENDERING_KINDS = ['player', 'pant', 'logo', 'jersey', 'helmet', 'glove']
+DEFAULT_PARAMS = {
+    'tables': 6, 'rows_per_table': 3000, 'tag_count': 40, 'max_tags_per_record': 3,
+    'photo_ratio': 0.2, 'comment_ratio': 0.1, 'image_size': (640, 360), 'seed': 0,
+}
+
+def _fe_path(rng, top, second, index):
+    segments = []
+    for part in rng.choice(FE_SEGMENTS):
+        segments.append(rng.choice(part) if isinstance(part, list) else part)
+    segments.append(f'{segments[-1]}{rng.randint(1, 12000)}')
+    return f'{top}/{second}/' + '/'.join(segments) + f'/{index}_unpacked.png'
+
+def _rendering_path(rng, top, second, index):
+    kind = rng.choice(RENDERING_KINDS)
+    texlib = f'texlib_{rng.randint(1, 300)}_{rng.randint(0, 9)}'
+    return f'{top}/{second}/{kind}/{texlib}/{kind}_{index}_cm.Raster.png'
+
+def synthetic_path(rng, table_index, index):
+    top, second = TOP_DIRS[table_index % len(TOP_DIRS)]
+    if second == 'rendering':
+        return _rendering_path(rng, top, second, index)
+    return _fe_path(rng, top, second, index)
+
+def _write_image(path, size, rng):
+    """Рисует небольшую «текстуру» со случайными прямоугольниками, чтобы PNG не сжимался в ноль."""
+    img = Image.new('RGBA', size, tuple(rng.randrange(256) for _ in range(3)) + (255,))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randrange(1, size[0] // 2), y0 + rng.randrange(1, size[1] // 2)
+        draw.rectangle([x0, y0, x1, y1], fill=tuple(rng.randrange(256) for _ in range(4)))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    img.save(path)
+
+def generate_database(db_path, image_root=None, tables=6, rows_per_table=3000, tag_count=40, max_tags_per_record=3,
+                      photo_ratio=0.2, comment_ratio=0.1, image_size=(640, 360), seed=0, overwrite=False):
+    """Создает синтетическую базу (и изображения, если указан image_root). Возвращает параметры генерации.
+
+    Существующий файл db_path перезаписывается только при overwrite=True:
+    по ошибке указанный каталог проекта не должен стоить настоящей app.db.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(db_path):
+        if not overwrite:
+            raise FileExistsError(f"{db_path} уже существует")
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE users (username TEXT NOT NULL UNIQUE, password TEXT NOT NULL, name TEXT, admin INTEGER DEFAULT 0)')
+    conn.execute('CREATE TABLE tags (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, description TEXT)')
+    tag_names = [f'tag{i:03d}' for i in range(tag_count)]
+    conn.executemany('INSERT INTO tags (name, description) VALUES (?, ?)', [(name, '') for name in tag_names])
+
+    photos = []
+    table_names = []
+    for table_index in range(tables):
+        top, _ = TOP_DIRS[table_index % len(TOP_DIRS)]
+        table = top if table_index < len(TOP_DIRS) else f'{top}_{table_index}'
+        table_names.append(table)
+        conn.execute(f'CREATE TABLE "{table}" ("Путь" TEXT, "Подфайл" TEXT, "Комментарий" TEXT, "Фото" TEXT, tags TEXT)')
+        rows = []
+        for index in range(rows_per_table):
+            path = synthetic_path(rng, table_index, index)
+            photo = ''
+            if image_root and rng.random() < photo_ratio:
+                photo = os.path.join(os.path.abspath(image_root), path)
+                photos.append(photo)
+            tags = rng.sample(tag_names, rng.randint(0, min(max_tags_per_record, tag_count)))
+            comment = f'comment {index}' if rng.random() < comment_ratio else None
+            rows.append((path, str(index % 40), comment, photo, ",".join(tags)))
+        conn.executemany(f'INSERT INTO "{table}" VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+    for photo in photos:
+        if not os.path.exists(photo):
+            _write_image(photo, image_size, rng)
+
+    return {
+        'tables': table_names, 'rows_per_table': rows_per_table, 'tag_count': tag_count,
+        'max_tags_per_record': max_tags_per_record, 'photo_ratio': photo_ratio, 'photos': len(photos),
+        'image_size': list(image_size), 'seed': seed,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генерирует синтетическую app.db и набор изображений.")
+    parser.add_argument('db_path')
+    parser.add_argument('--images', default=None, help="Каталог для синтетических изображений.")
+    parser.add_argument('--tables', type=int, default=DEFAULT_PARAMS['tables'])
+    parser.add_argument('--rows', type=int, default=DEFAULT_PARAMS['rows_per_table'])
+    parser.add_argument('--tags', type=int, default=DEFAULT_PARAMS['tag_count'])
+    parser.add_argument('--max-tags-per-record', type=int, default=DEFAULT_PARAMS['max_tags_per_record'])
+    parser.add_argument('--photo-ratio', type=float, default=DEFAULT_PARAMS['photo_ratio'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_PARAMS['seed'])
+    parser.add_argument('--force', action='store_true', help="Перезаписать существующий db_path.")
+    args = parser.parse_args(argv)
+    if os.path.exists(args.db_path) and not args.force:
+        parser.error(f"{args.db_path} уже существует; --force перезапишет его")
+    params = generate_database(
+        args.db_path, args.images, tables=args.tables, rows_per_table=args.rows, tag_count=args.tags,
+        max_tags_per_record=args.max_tags_per_record, photo_ratio=args.photo_ratio, seed=args.seed, overwrite=args.force,
+    )
+    print(params)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import sys
+import gzip
+import json
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit, parse_qs
+import streamlit as st
+
+from code import db_helpers
+from code.db_helpers import RECORD_COLUMNS, use_read_replica, get_data_version, get_table_names, get_record_by_id, get_tag_counts, search_public_page, count_search_public
+
+# --- HTTP JSON API ---
+# Тот же публичный поиск, что и на главной странице, для скриптов и других
+# сервисов без Streamlit:
+#   GET /api/search?q=<текст>&tags=<тег>,<тег>&page=1&per_page=30
+#   GET /api/records/<таблица>/<rowid>
+#   GET /api/tags
+# Ответы помечены ETag по версии данных (поколение данных и версия схемы),
+# поэтому повторный запрос с If-None-Match получает 304 без обращения к базе.
+# Крупные ответы сжимаются gzip, запросы обрабатываются в отдельных потоках,
+# каждый со своим читающим соединением из пула (в режиме реплики — со снимком).
+# API не проверяет вход, поэтому по умолчанию не запускается: отдельно —
+# python -m code.api --port 8503 [--db app.db], вместе с приложением —
+# при APP_API_ENABLED=1.
+
+API_ENABLED = os.environ.get('APP_API_ENABLED', '0') == '1'
+API_HOST = os.environ.get('APP_API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('APP_API_PORT', '8503'))
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 200
+GZIP_MIN_BYTES = 1024
+PUBLIC_FIELDS = ('source_table', 'rowid', *RECORD_COLUMNS)
+
+logger = logging.getLogger(__name__)
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _record_json(row):
+    keys = row.keys()
+    return {field: row[field] for field in PUBLIC_FIELDS if field in keys}
+
+def _int_param(params, name, default, minimum=1, maximum=None):
+    value = params.get(name, [None])[0]
+    if value in (None, ''): return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(400, f"Параметр {name} должен быть целым числом")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ApiError(400, f"Параметр {name} вне допустимого диапазона")
+    return value
+
+def search(params):
+    text_query = params.get('q', [''])[0].strip()
+    tag_list = sorted({tag.strip() for value in params.get('tags', []) for tag in value.split(',') if tag.strip()})
+    page = _int_param(params, 'page', 1)
+    per_page = _int_param(params, 'per_page', DEFAULT_PER_PAGE, maximum=MAX_PER_PAGE)
+    return {
+        'query': text_query,
+        'tags': tag_list,
+        'page': page,
+        'per_page': per_page,
+        'total': count_search_public(text_query, tag_list),
+        'records': [_record_json(row) for row in search_public_page(text_query, tag_list, page, per_page)],
+    }
+
+def record(table_name, rowid):
+    # Имя таблицы из URL попадает в SQL, поэтому принимаются только существующие таблицы записей
+    if table_name not in get_table_names():
+        raise ApiError(404, "Таблица не найдена")
+    try:
+        rowid = int(rowid)
+    except ValueError:
+        raise ApiError(404, "Запись не найдена")
+    row = get_record_by_id(table_name, rowid)
+    if row is None:
+        raise ApiError(404, "Запись не найдена")
+    return _record_json(row)
+
+def tags():
+    return {'tags': [{'name': name, 'records': records} for name, records in sorted(get_tag_counts().items())]}
+
+def _route(path, params):
+    """Возвращает функцию, вычисляющую ответ по пути запроса."""
+    parts = [unquote(part) for part in path.strip('/').split('/')]
+    if parts[:1] != ['api']: raise ApiError(404, "Не найдено")
+    if parts[1:] == ['search']: return lambda: search(params)
+    if parts[1:] == ['tags']: return tags
+    if len(parts) == 4 and parts[1] == 'records': return lambda: record(parts[2], parts[3])
+    raise ApiError(404, "Не найдено")
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _serve(self, send_body):
+        url = urlsplit(self.path)
+        use_read_replica()
+        try:
+            compute = _route(url.path, parse_qs(url.query))
+            generation, schema_version = get_data_version()
+            # Ответ зависит только от данных и URL, поэтому слабый ETag — версия данных
+            etag = f'W/"{generation:x}-{schema_version:x}"'
+            if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+                return self._send(304, None, send_body, etag)
+            status, payload = 200, compute()
+        except ApiError as e:
+            status, payload, etag = e.status, {'error': str(e)}, None
+        except Exception:
+            logger.exception("Ошибка API при обработке %s", self.path)
+            status, payload, etag = 500, {'error': "Внутренняя ошибка"}, None
+        self._send(status, json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), send_body, etag)
+
+    def _send(self, status, body, send_body, etag):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if body is None:
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if len(body) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+def create_api_server(host=API_HOST, port=API_PORT):
+    server = ThreadingHTTPServer((host, port), ApiRequestHandler)
+    server.daemon_threads = True
+    return server
+
+@st.cache_resource
+def start_api_server():
+    """Запускает API в фоновом потоке один раз на процесс, если задан APP_API_ENABLED=1."""
+    if not API_ENABLED:
+        return None
+    try:
+        server = create_api_server()
+    except OSError as e:
+        # Порт уже занят — скорее всего, API запущен другим процессом приложения
+        logger.warning("API не запущен: %s", e)
+        return None
+    threading.Thread(target=server.serve_forever, name='api-server', daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP JSON API публичного поиска.")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--db', default=None, help="Файл базы (по умолчанию APP_DB_FILE или app.db).")
+    args = parser.parse_args(argv)
+    # Вне `streamlit run` кэши Streamlit пишут предупреждение на каждый вызов
+    from streamlit import logger as streamlit_logger
+    streamlit_logger.set_log_level('error')
+    if args.db:
+        db_helpers.DB_FILE = os.path.abspath(args.db)
+    db_helpers.init_db()
+    server = create_api_server(args.host, args.port)
+    print(f"API: http://{args.host}:{server.server_address[1]}/api/search")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
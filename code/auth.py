@@ -1,25 +1,117 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
-from code.db_helpers import get_db_connection, update_user as db_update_user, delete_user as db_delete_user, get_user_by_username
+import streamlit as st
+import extra_streamlit_components as stx
+from code.profiling import stage
+from code.db_helpers import get_db_connection, get_write_connection, get_meta_value, set_meta_value, update_user as db_update_user, delete_user as db_delete_user, get_user_by_username
+
+# --- Проверка паролей ---
+# bcrypt выполняется в отдельном ограниченном пуле потоков: одновременно
+# считается не больше AUTH_WORKERS хэшей, а при переполнении очереди попытка
+# входа сразу отклоняется, не занимая потоки сервера. Неудачные попытки
+# ограничиваются по имени пользователя и по IP-адресу клиента.
+
+AUTH_WORKERS = int(os.environ.get('APP_AUTH_WORKERS', 2))
+MAX_PENDING_CHECKS = 16
+MAX_FAILURES_PER_USER = 5
+MAX_FAILURES_PER_IP = 20
+FAILURE_WINDOW_S = 15 * 60
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix='bcrypt')
+_pending_checks = threading.BoundedSemaphore(MAX_PENDING_CHECKS)
+_failures = {}
+_failures_lock = threading.Lock()
+_dummy_hash = None
+
+class LoginThrottled(Exception):
+    """Попытка входа отклонена до проверки пароля; retry_after — через сколько секунд повторить."""
+    def __init__(self, retry_after):
+        super().__init__(f"Login throttled, retry after {retry_after} s")
+        self.retry_after = retry_after
+
+def _run_bcrypt(func, *args):
+    # Пул ограничивает число одновременных хэшей, но ждет результата поток
+    # скрипта Streamlit: на время bcrypt (~0.2 с) сессия занята, как и раньше.
+    # Защита от перегрузки здесь — отказ при полной очереди, а не асинхронность.
+    if not _pending_checks.acquire(blocking=False):
+        raise LoginThrottled(1)
+    future = _bcrypt_pool.submit(func, *args)
+    future.add_done_callback(lambda _: _pending_checks.release())
+    return future.result()
+
+def _throttle_keys(username, client_ip):
+    keys = [(('user', username), MAX_FAILURES_PER_USER)]
+    if client_ip:
+        keys.append((('ip', client_ip), MAX_FAILURES_PER_IP))
+    return keys
+
+def _retry_after(keys, now):
+    """Сколько секунд ждать до следующей попытки (0 — можно пробовать)."""
+    wait = 0
+    with _failures_lock:
+        for key, limit in keys:
+            failures = _failures.get(key)
+            if not failures: continue
+            while failures and failures[0] <= now - FAILURE_WINDOW_S:
+                failures.popleft()
+            if len(failures) >= limit:
+                wait = max(wait, failures[0] + FAILURE_WINDOW_S - now)
+            elif not failures:
+                del _failures[key]
+    return int(wait) + 1 if wait else 0
+
+def _record_failure(keys, now):
+    with _failures_lock:
+        for key, limit in keys:
+            _failures.setdefault(key, deque(maxlen=limit)).append(now)
+
+def _clear_failures(username):
+    with _failures_lock:
+        _failures.pop(('user', username), None)
 
 def hash_password(password):
-    """Хеширует пароль."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    """Хеширует пароль. Бросает LoginThrottled, если очередь bcrypt переполнена."""
+    with stage('bcrypt.hashpw'):
+        return _run_bcrypt(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def add_user(username, password, name="", admin=0):
     """Добавляет нового пользователя."""
-    with get_db_connection() as conn:
-        hashed_password = hash_password(password)
+    hashed_password = hash_password(password)
+    with get_write_connection() as conn:
         conn.cursor().execute("INSERT INTO users (username, password, name, admin) VALUES (?, ?, ?, ?)", (username, hashed_password, name, admin))
-        conn.commit()
 
-def check_password(username, password):
-    """Проверяет пароль пользователя."""
+def check_password(username, password, client_ip=None):
+    """Проверяет пароль пользователя.
+
+    Бросает LoginThrottled, если для имени или IP превышен лимит неудачных
+    попыток либо очередь проверок переполнена.
+    """
+    global _dummy_hash
+    keys = _throttle_keys(username, client_ip)
+    retry_after = _retry_after(keys, time.monotonic())
+    if retry_after:
+        raise LoginThrottled(retry_after)
     with get_db_connection() as conn:
         result = conn.cursor().execute("SELECT password, name, admin FROM users WHERE username = ?", (username,)).fetchone()
-    if result:
-        hashed_password_db, name, admin_status = result
-        if bcrypt.checkpw(password.encode('utf-8'), hashed_password_db.encode('utf-8')):
-            return True, name, bool(admin_status)
+    if result is None and _dummy_hash is None:
+        _dummy_hash = _run_bcrypt(bcrypt.hashpw, b'', bcrypt.gensalt())
+    # Для несуществующего имени тоже считаем bcrypt, чтобы время ответа не выдавало имена
+    hashed_password_db = result[0].encode('utf-8') if result else _dummy_hash
+    with stage('bcrypt.checkpw'):
+        is_valid = _run_bcrypt(bcrypt.checkpw, password.encode('utf-8'), hashed_password_db)
+    if result and is_valid:
+        _clear_failures(username)
+        return True, result[1], bool(result[2])
+    _record_failure(keys, time.monotonic())
     return False, None, False
 
 def update_user(username, new_name=None, new_admin_status=None, new_username=None, new_password=None):
@@ -30,3 +122,114 @@ def update_user(username, new_name=None, new_admin_status=None, new_username=Non
 def delete_user(username):
     """Удаляет пользователя."""
     db_delete_user(username)
+
+# --- Токены сессии ---
+# После входа в cookie браузера сохраняется подписанный токен с именем
+# пользователя и сроком действия. Когда сессия Streamlit начинается заново,
+# токен проверяется одной HMAC-подписью вместо bcrypt. Ключ подписи берется
+# из APP_AUTH_SECRET или создается один раз и хранится в app_meta.
+# Cookie пишет компонент в браузере, поэтому она не может быть HttpOnly
+# (Streamlit не дает странице задать заголовки ответа). Чтобы украденный
+# токен стоил меньше, он живет TOKEN_TTL_S (12 часов), действует только с тем
+# же User-Agent и отзывается сменой пароля или выходом: в подпись входят хэш
+# пароля и эпоха сессий пользователя, которую logout() меняет.
+
+AUTH_COOKIE = 'app_auth'
+TOKEN_TTL_S = int(os.environ.get('APP_AUTH_TOKEN_TTL', 12 * 3600))
+
+def _auth_secret():
+    secret = os.environ.get('APP_AUTH_SECRET') or get_meta_value('auth_secret', lambda: secrets.token_hex(32))
+    return secret.encode('utf-8')
+
+def _session_epoch(username):
+    return get_meta_value(f'auth_epoch:{username}', lambda: secrets.token_hex(8))
+
+def _sign(username, expires, password_hash, user_agent):
+    message = f"{username}\n{expires}\n{password_hash}\n{_session_epoch(username)}\n{user_agent or ''}".encode('utf-8')
+    return hmac.new(_auth_secret(), message, hashlib.sha256).hexdigest()
+
+def issue_token(username, ttl=TOKEN_TTL_S, user_agent=None):
+    """Выдает токен сессии для пользователя и браузера с user_agent или None, если пользователя нет."""
+    user = get_user_by_username(username)
+    if not user: return None
+    expires = int(time.time()) + ttl
+    encoded_name = base64.urlsafe_b64encode(username.encode('utf-8')).decode('ascii').rstrip('=')
+    return f"{encoded_name}.{expires}.{_sign(username, expires, user['password'], user_agent)}"
+
+def revoke_tokens(username):
+    """Отзывает все выданные пользователю токены сессии."""
+    set_meta_value(f'auth_epoch:{username}', secrets.token_hex(8))
+
+def verify_token(token, user_agent=None):
+    """Проверяет токен сессии, выданный браузеру с user_agent. Возвращает (username, name, is_admin) или None."""
+    try:
+        encoded_name, expires, signature = (token or '').split('.')
+        username = base64.urlsafe_b64decode(encoded_name + '=' * (-len(encoded_name) % 4)).decode('utf-8')
+        expires = int(expires)
+    except ValueError:
+        return None
+    if expires < time.time(): return None
+    user = get_user_by_username(username)
+    if not user or not hmac.compare_digest(signature.encode('utf-8'), _sign(username, expires, user['password'], user_agent).encode('utf-8')):
+        return None
+    return username, user['name'], bool(user['admin'])
+
+# --- Сессия Streamlit ---
+
+def client_ip():
+    """IP-адрес клиента текущей сессии (None вне сервера Streamlit)."""
+    try:
+        return st.context.ip_address
+    except Exception:
+        return None
+
+def _user_agent():
+    try:
+        return st.context.headers.get('User-Agent')
+    except Exception:
+        return None
+
+def _is_https():
+    """True, если страница открыта по HTTPS (в том числе за обратным прокси)."""
+    try:
+        if st.context.headers.get('X-Forwarded-Proto', '').split(',')[0].strip().lower() == 'https':
+            return True
+        return (st.context.url or '').startswith('https://')
+    except Exception:
+        return False
+
+def login(username, name, is_admin):
+    """Отмечает сессию вошедшей и планирует запись токена в cookie."""
+    st.session_state.update({'authenticated': True, 'username': username, 'name': name, 'is_admin': is_admin})
+    st.session_state.auth_cookie_pending = issue_token(username, user_agent=_user_agent())
+
+def logout():
+    """Сбрасывает вход в сессии, отзывает токены пользователя и планирует удаление cookie."""
+    if st.session_state.get('username'):
+        revoke_tokens(st.session_state.username)
+    st.session_state.update({'authenticated': False, 'username': None, 'name': None, 'is_admin': False})
+    st.session_state.auth_cookie_pending = ''
+
+def restore_session():
+    """Восстанавливает вход из cookie с токеном, если сессия еще не вошла."""
+    if st.session_state.get('authenticated') or 'auth_cookie_pending' in st.session_state:
+        return
+    token = st.context.cookies.get(AUTH_COOKIE)
+    user = verify_token(token, _user_agent()) if token else None
+    if user:
+        username, name, is_admin = user
+        st.session_state.update({'authenticated': True, 'username': username, 'name': name, 'is_admin': is_admin})
+
+def sync_auth_cookie():
+    """Записывает или удаляет cookie с токеном после login()/logout().
+
+    Cookie пишет компонент в браузере, поэтому вызывается без st.rerun() после
+    него — иначе компонент не успеет отрисоваться.
+    """
+    pending = st.session_state.get('auth_cookie_pending')
+    if pending is None: return
+    # Для удаления cookie перезаписывается пустым значением с истекшим сроком
+    expires_at = datetime.datetime.now() + datetime.timedelta(seconds=TOKEN_TTL_S) if pending else datetime.datetime(1970, 1, 1)
+    # По HTTPS cookie помечается secure, чтобы токен не ушел по незащищенному соединению
+    stx.CookieManager(key='auth_cookie_manager').set(AUTH_COOKIE, pending, key='auth_cookie_set', expires_at=expires_at, secure=_is_https(), same_site='strict')
+    st.session_state.auth_cookie_pending = None
@@ -1,20 +1,273 @@
 import sqlite3
 import os
-import streamlit as st
+import json
+import time
+import weakref
+import threading
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from contextlib import contextmanager
+
+from code.profiling import ProfiledConnection, count_cache
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
-DB_FILE = 'app.db'
+DB_FILE = os.environ.get('APP_DB_FILE', os.path.join(BASE_DIR, 'app.db'))
+
+# Настройки каждого соединения. journal_mode=WAL хранится в самом файле базы
+# и включается один раз пишущим соединением.
+CONNECTION_PRAGMAS = {
+    'busy_timeout': 5000,
+    'cache_size': -65536,      # 64 МБ на соединение
+    'mmap_size': 268435456,    # 256 МБ
+    'temp_store': 'MEMORY',
+    'synchronous': 'NORMAL',   # в режиме WAL не теряет целостность
+}
+MAX_IDLE_READERS = 16
+
+# Режим реплики: публичные страницы читают неизменяемый снимок базы, который
+# публикует code.replica, а записи по-прежнему идут в основную базу
+REPLICA_DIR = os.environ.get('APP_REPLICA_DIR', '')
+REPLICA_FILENAME = 'replica.db'
+REPLICA_FILE = os.path.join(REPLICA_DIR, REPLICA_FILENAME) if REPLICA_DIR else None
+REPLICA_MMAP_SIZE = 1 << 30    # 1 ГБ: снимок не меняется, читается через mmap
+
+# Служебные таблицы, которые не являются таблицами записей
+SEARCH_INDEX_TABLE = 'search_index'
+SEARCH_KEYS_TABLE = 'search_keys'
+RECORD_TAGS_TABLE = 'record_tags'
+IMPORT_MANIFEST_TABLE = 'import_manifest'
+APP_META_TABLE = 'app_meta'
+PHOTO_STORE_TABLE = 'photo_store'
+PHOTO_HASHES_TABLE = 'photo_hashes'
+TAG_COUNTS_TABLE = 'tag_counts'
+PATH_TREE_TABLE = 'path_tree'
+PHOTO_FILES_TABLE = 'photo_files'
+PHOTO_RECOMPRESS_TABLE = 'photo_recompress'
+SERVICE_TABLES = (
+    'users', 'tags', SEARCH_INDEX_TABLE, SEARCH_KEYS_TABLE, RECORD_TAGS_TABLE, IMPORT_MANIFEST_TABLE, APP_META_TABLE,
+    PHOTO_STORE_TABLE, PHOTO_HASHES_TABLE, TAG_COUNTS_TABLE, PATH_TREE_TABLE,
+    PHOTO_FILES_TABLE, PHOTO_RECOMPRESS_TABLE,
+)
+
+# --- Пул соединений ---
+# Каждый поток получает свое читающее соединение и держит его до завершения,
+# после чего соединение возвращается в пул и достается следующему потоку
+# (Streamlit выполняет каждый перезапуск скрипта в отдельном потоке).
+# Все записи идут через одно пишущее соединение под общей блокировкой, поэтому
+# внутри процесса писатели не конкурируют за блокировку файла, а читатели
+# в режиме WAL не ждут писателей.
+# В режиме реплики поток, вызвавший use_read_replica(), читает снимок базы
+# (immutable=1, без блокировок файла), поэтому читатели разных процессов
+# не конкурируют с писателями. Снимок подменяется целиком (os.replace):
+# открытые соединения дочитывают старый файл, новые открывают новый.
+
+class _ReaderLease:
+    """Привязка читающего соединения к потоку; при сборке объекта соединение возвращается в пул."""
+    def __init__(self, conn, release, *args):
+        self.conn = conn
+        self.args = args
+        weakref.finalize(self, release, conn, *args)
+
+def _file_identity(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+class ConnectionPool:
+    def __init__(self, db_file, replica_file=None):
+        self.db_file = db_file
+        self.replica_file = replica_file
+        self._idle_replicas = []
+        self._replica_identity = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._idle_readers = []
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._closed = False
+        self._stats = {
+            'readers_created': 0, 'reader_checkouts': 0, 'reader_reuses': 0, 'readers_in_use': 0,
+            'replica_checkouts': 0, 'replicas_opened': 0,
+            'writes': 0, 'write_wait_total_ms': 0.0, 'write_wait_max_ms': 0.0, 'write_time_total_ms': 0.0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, factory=ProfiledConnection)
+        conn.row_factory = sqlite3.Row
+        for name, value in CONNECTION_PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def reader(self):
+        """Возвращает читающее соединение текущего потока."""
+        if getattr(self._local, 'replica', False):
+            lease = getattr(self._local, 'replica_lease', None)
+            if lease is not None:
+                return lease.conn
+            conn = self._replica_reader()
+            if conn is not None:
+                return conn
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None:
+            return lease.conn
+        with self._lock:
+            conn = self._idle_readers.pop() if self._idle_readers else None
+            self._stats['reader_checkouts'] += 1
+            self._stats['readers_in_use'] += 1
+            if conn is None:
+                self._stats['readers_created'] += 1
+            else:
+                self._stats['reader_reuses'] += 1
+        if conn is None:
+            conn = self._connect()
+        self._local.lease = _ReaderLease(conn, self._release_reader)
+        return conn
+
+    def use_replica(self, enabled):
+        """Переключает чтение текущего потока на снимок; соединение со старым снимком отпускается."""
+        self._local.replica = bool(enabled) and self.replica_file is not None
+        lease = getattr(self._local, 'replica_lease', None)
+        if lease is not None and (not self._local.replica or lease.args[0] != _file_identity(self.replica_file)):
+            self._local.replica_lease = None
+
+    def _replica_reader(self):
+        """Соединение со снимком для текущего потока или None, если снимок еще не опубликован."""
+        identity = _file_identity(self.replica_file)
+        if identity is None:
+            return None
+        stale = []
+        with self._lock:
+            self._replica_identity = identity
+            conn = None
+            while self._idle_replicas and conn is None:
+                candidate, candidate_identity = self._idle_replicas.pop()
+                if candidate_identity == identity: conn = candidate
+                else: stale.append(candidate)
+            self._stats['replica_checkouts'] += 1
+            if conn is None:
+                self._stats['replicas_opened'] += 1
+        for old in stale:
+            old.close()
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.replica_file}?mode=ro&immutable=1', uri=True, check_same_thread=False, factory=ProfiledConnection)
+            conn.row_factory = sqlite3.Row
+            for name, value in dict(CONNECTION_PRAGMAS, mmap_size=REPLICA_MMAP_SIZE).items():
+                conn.execute(f'PRAGMA {name} = {value}')
+        self._local.replica_lease = _ReaderLease(conn, self._release_replica, identity)
+        return conn
+
+    def _release_replica(self, conn, identity):
+        with self._lock:
+            if not self._closed and identity == self._replica_identity and len(self._idle_replicas) < MAX_IDLE_READERS:
+                self._idle_replicas.append((conn, identity))
+                return
+        conn.close()
+
+    def _release_reader(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._stats['readers_in_use'] -= 1
+            if not self._closed and len(self._idle_readers) < MAX_IDLE_READERS:
+                self._idle_readers.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def writer(self):
+        """Захватывает единственное пишущее соединение; коммит — при выходе из самого внешнего блока."""
+        wait_started = time.perf_counter()
+        with self._write_lock:
+            waited_ms = (time.perf_counter() - wait_started) * 1000
+            started = time.perf_counter()
+            if self._writer is None:
+                self._writer = self._connect()
+                self._writer.execute('PRAGMA journal_mode = WAL')
+            self._write_depth += 1
+            try:
+                yield self._writer
+                if self._write_depth == 1:
+                    self._writer.commit()
+            except BaseException:
+                if self._write_depth == 1:
+                    self._writer.rollback()
+                raise
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    with self._lock:
+                        self._stats['writes'] += 1
+                        self._stats['write_wait_total_ms'] += waited_ms
+                        self._stats['write_wait_max_ms'] = max(self._stats['write_wait_max_ms'], waited_ms)
+                        self._stats['write_time_total_ms'] += (time.perf_counter() - started) * 1000
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, readers_idle=len(self._idle_readers), db_file=self.db_file, replica_file=self.replica_file)
+
+    def close(self):
+        """Закрывает свободные соединения; занятые закроются при возврате в пул."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle_readers = self._idle_readers, []
+            idle += [conn for conn, _ in self._idle_replicas]
+            self._idle_replicas = []
+        for conn in idle:
+            conn.close()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    if _pool is None or _pool.db_file != DB_FILE or _pool.replica_file != REPLICA_FILE:
+        with _pool_lock:
+            if _pool is None or _pool.db_file != DB_FILE or _pool.replica_file != REPLICA_FILE:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DB_FILE, REPLICA_FILE)
+    return _pool
 
 def get_db_connection():
-    """Возвращает соединение с базой данных с row_factory и поддержкой многопоточности."""
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Возвращает читающее соединение текущего потока из пула (row_factory = sqlite3.Row)."""
+    return _get_pool().reader()
+
+def get_write_connection():
+    """Контекстный менеджер пишущего соединения: записи выполняются по одной, коммит — при выходе."""
+    return _get_pool().writer()
+
+def use_read_replica(enabled=True):
+    """Текущий поток читает опубликованный снимок базы (в режиме реплики) или основную базу.
+
+    Вызывается в начале каждого запуска страницы: снимок, открытый прошлым
+    запуском в этом потоке, заменяется свежим.
+    """
+    _get_pool().use_replica(enabled)
+
+def get_pool_stats():
+    """Возвращает статистику пула соединений."""
+    return _get_pool().stats()
+
+_initialized_schema = None
 
 def init_db():
-    """Инициализирует базу данных и создает таблицы, если они не существуют."""
-    with get_db_connection() as conn:
+    """Инициализирует базу данных и создает таблицы, если они не существуют.
+
+    Повторный вызов ничего не делает, пока схема базы не изменилась.
+    """
+    global _initialized_schema
+    if _initialized_schema == (DB_FILE, _schema_version(get_db_connection())):
+        return
+    with get_write_connection() as conn:
         c = conn.cursor()
         c.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -30,87 +283,1024 @@ def init_db():
                 id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, description TEXT
             )
         ''')
+        c.execute(f'CREATE TABLE IF NOT EXISTS {APP_META_TABLE} (key TEXT PRIMARY KEY, value) WITHOUT ROWID')
         conn.commit()
+        sync_search_index(conn)
+        sync_record_tags(conn)
+        sync_tag_counts(conn)
+        sync_photo_store(conn)
+        sync_photo_files(conn)
+        sync_path_tree(conn)
+        _initialized_schema = (DB_FILE, _schema_version(conn))
+
+# --- Каталог схемы ---
+# Список таблиц записей, их колонки и готовые SQL-запросы кэшируются на процесс
+# и перестраиваются только при изменении PRAGMA schema_version. Таблицей
+# записей считается любая несистемная таблица с колонкой "Путь"; отсутствующие
+# необязательные колонки подставляются как NULL.
+
+RECORD_COLUMNS = ("Путь", "Подфайл", "Комментарий", "Фото", "tags")
+REQUIRED_RECORD_COLUMNS = ("Путь",)
+
+class SchemaCatalog:
+    def __init__(self, db_file, version, tables, columns, skipped):
+        self.db_file = db_file
+        self.version = version
+        self.tables = tables
+        self.columns = columns
+        self.skipped = skipped
+        self.public_columns = {}
+        self.full_columns = {}
+        self.public_select = {}
+        self.full_select = {}
+        self.full_page_select = {}
+        for table in tables:
+            present = columns[table]
+            missing = [f'NULL AS "{column}"' for column in RECORD_COLUMNS if column not in present]
+            public_columns = self.public_columns[table] = ", ".join([f'"{column}"' for column in RECORD_COLUMNS if column in present] + missing)
+            full_columns = self.full_columns[table] = ", ".join(["*"] + missing)
+            # Запросы по списку rowid (JSON-массив в единственном параметре) и постраничный без фильтра
+            by_rowids = 'WHERE rowid IN (SELECT value FROM json_each(?))'
+            self.public_select[table] = f'SELECT "{table}" as source_table, rowid, {public_columns} FROM "{table}" {by_rowids}'
+            self.full_select[table] = f'SELECT "{table}" as source_table, rowid, {full_columns} FROM "{table}" {by_rowids}'
+            self.full_page_select[table] = f'SELECT "{table}" as source_table, rowid, {full_columns} FROM "{table}" ORDER BY rowid LIMIT ? OFFSET ?'
+
+    def has_column(self, table, column):
+        return column in self.columns.get(table, ())
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def _schema_version(conn):
+    return conn.execute('PRAGMA schema_version').fetchone()[0]
+
+def is_service_table(name):
+    return name in SERVICE_TABLES or name.startswith(f'{SEARCH_INDEX_TABLE}_')
+
+def _load_schema_catalog(conn, version):
+    tables, columns, skipped = [], {}, []
+    for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall():
+        name = row[0]
+        if is_service_table(name): continue
+        table_columns = [info[1] for info in conn.execute(f'PRAGMA table_info("{name}")')]
+        if all(column in table_columns for column in REQUIRED_RECORD_COLUMNS):
+            tables.append(name); columns[name] = table_columns
+        else:
+            skipped.append(name)
+    return SchemaCatalog(DB_FILE, version, tables, columns, skipped)
+
+def get_schema_catalog(conn=None):
+    """Возвращает каталог схемы, перестраивая его только после изменения схемы базы."""
+    global _catalog
+    conn = conn or get_db_connection()
+    version = _schema_version(conn)
+    catalog = _catalog
+    if catalog is not None and catalog.version == version and catalog.db_file == DB_FILE:
+        count_cache('schema_catalog', True)
+        return catalog
+    count_cache('schema_catalog', False)
+    with _catalog_lock:
+        if _catalog is None or _catalog.version != version or _catalog.db_file != DB_FILE:
+            _catalog = _load_schema_catalog(conn, version)
+        return _catalog
+
+def get_table_names(conn=None):
+    return list(get_schema_catalog(conn).tables)
+
+# --- Поисковый индекс по "Путь" (FTS5 trigram) ---
+# search_keys сопоставляет каждой записи (таблица, rowid) стабильный id,
+# который используется как rowid в виртуальной таблице search_index.
+# Индекс поддерживается триггерами, поэтому остается актуальным при любых
+# вставках и удалениях, в том числе при массовом импорте.
+
+def _search_trigger_names(table_name):
+    return [f'{table_name}__search_{suffix}' for suffix in ('ai', 'ad', 'au')]
+
+def index_record_table(conn, table_name):
+    """Подключает таблицу записей к поисковому индексу: создает триггеры и индексирует текущие строки."""
+    c = conn.cursor()
+    insert_trigger, delete_trigger, update_trigger = _search_trigger_names(table_name)
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name = ?", (insert_trigger,)).fetchone():
+        return
+    table_literal = table_name.replace("'", "''")
+
+    def key_id(row):
+        return f"(SELECT id FROM {SEARCH_KEYS_TABLE} WHERE source_table = '{table_literal}' AND record_rowid = {row}.rowid)"
+
+    # Таблица могла быть пересоздана — убираем ключи, оставшиеся от старой версии
+    _drop_search_keys(c, table_name)
+    c.execute(f'''
+        CREATE TRIGGER "{insert_trigger}" AFTER INSERT ON "{table_name}" BEGIN
+            INSERT INTO {SEARCH_KEYS_TABLE} (source_table, record_rowid) VALUES ('{table_literal}', new.rowid);
+            INSERT INTO {SEARCH_INDEX_TABLE} (rowid, path) VALUES ({key_id('new')}, new."Путь");
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER "{delete_trigger}" AFTER DELETE ON "{table_name}" BEGIN
+            DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid = {key_id('old')};
+            DELETE FROM {SEARCH_KEYS_TABLE} WHERE source_table = '{table_literal}' AND record_rowid = old.rowid;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER "{update_trigger}" AFTER UPDATE OF "Путь" ON "{table_name}" BEGIN
+            UPDATE {SEARCH_INDEX_TABLE} SET path = new."Путь" WHERE rowid = {key_id('new')};
+        END
+    ''')
+    c.execute(f'INSERT INTO {SEARCH_KEYS_TABLE} (source_table, record_rowid) SELECT ?, rowid FROM "{table_name}"', (table_name,))
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (RECORD_TAGS_TABLE,)).fetchone():
+        # Новая таблица (например, после импорта) — переносим и ее теги
+        c.execute(f'DELETE FROM {RECORD_TAGS_TABLE} WHERE source_table = ?', (table_name,))
+        _migrate_record_tags(c, table_name)
+    c.execute(f'''
+        INSERT INTO {SEARCH_INDEX_TABLE} (rowid, path)
+        SELECT k.id, t."Путь" FROM "{table_name}" t JOIN {SEARCH_KEYS_TABLE} k ON k.source_table = ? AND k.record_rowid = t.rowid
+    ''', (table_name,))
+
+def _drop_search_keys(c, table_name):
+    c.execute(f'DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid IN (SELECT id FROM {SEARCH_KEYS_TABLE} WHERE source_table = ?)', (table_name,))
+    c.execute(f'DELETE FROM {SEARCH_KEYS_TABLE} WHERE source_table = ?', (table_name,))
+
+def sync_search_index(conn):
+    """Создает поисковый индекс, подключает к нему новые таблицы и убирает записи удаленных таблиц."""
+    c = conn.cursor()
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SEARCH_KEYS_TABLE} (
+            id INTEGER PRIMARY KEY, source_table TEXT NOT NULL, record_rowid INTEGER NOT NULL,
+            UNIQUE (source_table, record_rowid)
+        )
+    ''')
+    c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5(path, tokenize='trigram')")
+    table_names = get_table_names(conn)
+    for table in table_names:
+        index_record_table(conn, table)
+    for table in _distinct_source_tables(c, SEARCH_KEYS_TABLE):
+        if table not in table_names:
+            _drop_search_keys(c, table)
+    conn.commit()
+
+def _distinct_source_tables(c, service_table):
+    """Возвращает различные source_table служебной таблицы прыжками по индексу, не читая все строки."""
+    return [row[0] for row in c.execute(f'''
+        WITH RECURSIVE t(name) AS (
+            SELECT MIN(source_table) FROM {service_table}
+            UNION ALL
+            SELECT (SELECT MIN(source_table) FROM {service_table} WHERE source_table > t.name) FROM t WHERE t.name IS NOT NULL
+        )
+        SELECT name FROM t WHERE name IS NOT NULL
+    ''')]
+
+# --- Связь записей и тегов ---
+# record_tags — нормализованное хранение тегов записей. Колонка tags в таблицах
+# записей остается денормализованной копией для отображения и обновляется
+# вместе с record_tags.
+
+def _split_tags(tags):
+    return [tag.strip() for tag in (tags or '').split(',') if tag.strip()]
+
+def _get_tag_ids(c, tag_names):
+    """Возвращает {имя: id} для тегов, создавая отсутствующие в справочнике."""
+    c.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(name,) for name in tag_names])
+    return {row[0]: row[1] for row in c.execute("SELECT name, id FROM tags WHERE name IN (SELECT value FROM json_each(?))", (json.dumps(list(tag_names)),))}
+
+def _set_record_tags(c, table_name, rowid, tag_names):
+    tag_ids = _get_tag_ids(c, tag_names)
+    c.execute(f'DELETE FROM {RECORD_TAGS_TABLE} WHERE source_table = ? AND record_rowid = ?', (table_name, rowid))
+    c.executemany(f'INSERT OR IGNORE INTO {RECORD_TAGS_TABLE} (source_table, record_rowid, tag_id) VALUES (?, ?, ?)', [(table_name, rowid, tag_ids[name]) for name in tag_names])
+
+def _migrate_record_tags(c, table_name):
+    """Переносит теги из CSV-колонки tags таблицы в record_tags."""
+    if not get_schema_catalog(c.connection).has_column(table_name, 'tags'): return
+    rows = [(row[0], _split_tags(row[1])) for row in c.execute(f'SELECT rowid, tags FROM "{table_name}" WHERE tags IS NOT NULL AND tags != \'\'')]
+    tag_ids = _get_tag_ids(c, {name for _, names in rows for name in names})
+    c.executemany(f'INSERT OR IGNORE INTO {RECORD_TAGS_TABLE} (source_table, record_rowid, tag_id) VALUES (?, ?, ?)', [(table_name, rowid, tag_ids[name]) for rowid, names in rows for name in names])
+
+def sync_record_tags(conn):
+    """Создает record_tags и при первом запуске однократно переносит в нее теги всех таблиц."""
+    c = conn.cursor()
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (RECORD_TAGS_TABLE,)).fetchone()
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {RECORD_TAGS_TABLE} (
+            source_table TEXT NOT NULL, record_rowid INTEGER NOT NULL, tag_id INTEGER NOT NULL,
+            PRIMARY KEY (source_table, record_rowid, tag_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute(f'CREATE INDEX IF NOT EXISTS idx_{RECORD_TAGS_TABLE}_tag ON {RECORD_TAGS_TABLE} (tag_id, source_table, record_rowid)')
+    table_names = get_table_names(conn)
+    if not exists:
+        for table in table_names:
+            _migrate_record_tags(c, table)
+    for table in _distinct_source_tables(c, RECORD_TAGS_TABLE):
+        if table not in table_names:
+            c.execute(f'DELETE FROM {RECORD_TAGS_TABLE} WHERE source_table = ?', (table,))
+    conn.commit()
+
+# --- Счетчики записей по тегам ---
+# tag_counts хранит количество записей с каждым тегом. Его ведут триггеры
+# record_tags и tags, поэтому счетчики верны при любых изменениях тегов, а
+# список тегов с количеством не требует просмотра record_tags.
+
+TAG_COUNTS_TRIGGERS = ('record_tags__count_ai', 'record_tags__count_ad', 'tags__count_ad')
+
+def recount_tags(c):
+    """Пересчитывает tag_counts по record_tags."""
+    c.execute(f'DELETE FROM {TAG_COUNTS_TABLE}')
+    c.execute(f'INSERT INTO {TAG_COUNTS_TABLE} (tag_id, records) SELECT tag_id, COUNT(*) FROM {RECORD_TAGS_TABLE} GROUP BY tag_id')
+
+def sync_tag_counts(conn):
+    """Создает tag_counts и триггеры счетчиков; при первом запуске заполняет счетчики."""
+    c = conn.cursor()
+    c.execute(f'CREATE TABLE IF NOT EXISTS {TAG_COUNTS_TABLE} (tag_id INTEGER PRIMARY KEY, records INTEGER NOT NULL DEFAULT 0)')
+    insert_trigger, delete_trigger, tag_delete_trigger = TAG_COUNTS_TRIGGERS
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name = ?", (insert_trigger,)).fetchone():
+        c.execute(f'''
+            CREATE TRIGGER "{insert_trigger}" AFTER INSERT ON {RECORD_TAGS_TABLE} BEGIN
+                INSERT INTO {TAG_COUNTS_TABLE} (tag_id, records) VALUES (new.tag_id, 1)
+                ON CONFLICT (tag_id) DO UPDATE SET records = records + 1;
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER "{delete_trigger}" AFTER DELETE ON {RECORD_TAGS_TABLE} BEGIN
+                UPDATE {TAG_COUNTS_TABLE} SET records = records - 1 WHERE tag_id = old.tag_id;
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER "{tag_delete_trigger}" AFTER DELETE ON tags BEGIN
+                DELETE FROM {TAG_COUNTS_TABLE} WHERE tag_id = old.id;
+            END
+        ''')
+        # Связи, появившиеся до триггеров, не учтены
+        recount_tags(c)
+    conn.commit()
+
+def _rewrite_tags_column(c, tag_id, rename_to=None):
+    """Переименовывает (или убирает) тег в колонке tags всех записей, где он стоит."""
+    old_name = c.execute("SELECT name FROM tags WHERE id = ?", (tag_id,)).fetchone()
+    if not old_name: return
+    old_name = old_name[0]
+    hits = {}
+    for source_table, record_rowid in c.execute(f'SELECT source_table, record_rowid FROM {RECORD_TAGS_TABLE} WHERE tag_id = ?', (tag_id,)):
+        hits.setdefault(source_table, []).append(record_rowid)
+    for table, rowids in hits.items():
+        if not get_schema_catalog(c.connection).has_column(table, 'tags'): continue
+        updates = []
+        for rowid, tags in c.execute(f'SELECT rowid, tags FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?))', (json.dumps(rowids),)).fetchall():
+            names = [rename_to if name == old_name else name for name in _split_tags(tags)]
+            updates.append((",".join(name for name in dict.fromkeys(names) if name), rowid))
+        c.executemany(f'UPDATE "{table}" SET tags = ? WHERE rowid = ?', updates)
+
+# --- Ссылки на фото из хранилища ---
+# photo_store — объекты хранилища фото (code.photo_store) со счетчиком ссылок.
+# Счетчик ведут триггеры таблиц записей на колонку "Фото", поэтому он верен при
+# любых изменениях, включая импорт и массовые операции. Файл объекта удаляется,
+# когда на него не остается ссылок.
+
+def _photo_trigger_names(table_name):
+    return [f'{table_name}__photo_{suffix}' for suffix in ('ai', 'ad', 'au')]
+
+def _ensure_photo_triggers(c, table_name):
+    """Создает триггеры счетчика ссылок для таблицы. Возвращает True, если их не было."""
+    insert_trigger, delete_trigger, update_trigger = _photo_trigger_names(table_name)
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name = ?", (insert_trigger,)).fetchone():
+        return False
+    c.execute(f'''
+        CREATE TRIGGER "{insert_trigger}" AFTER INSERT ON "{table_name}" WHEN new."Фото" IS NOT NULL BEGIN
+            UPDATE {PHOTO_STORE_TABLE} SET refcount = refcount + 1 WHERE path = new."Фото";
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER "{delete_trigger}" AFTER DELETE ON "{table_name}" WHEN old."Фото" IS NOT NULL BEGIN
+            UPDATE {PHOTO_STORE_TABLE} SET refcount = refcount - 1 WHERE path = old."Фото";
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER "{update_trigger}" AFTER UPDATE OF "Фото" ON "{table_name}" WHEN old."Фото" IS NOT new."Фото" BEGIN
+            UPDATE {PHOTO_STORE_TABLE} SET refcount = refcount - 1 WHERE path = old."Фото";
+            UPDATE {PHOTO_STORE_TABLE} SET refcount = refcount + 1 WHERE path = new."Фото";
+        END
+    ''')
+    return True
+
+def recount_photo_refs(c):
+    """Пересчитывает ссылки на объекты хранилища по всем таблицам записей."""
+    catalog = get_schema_catalog(c.connection)
+    counts = dict.fromkeys((row[0] for row in c.execute(f'SELECT path FROM {PHOTO_STORE_TABLE}').fetchall()), 0)
+    for table in catalog.tables:
+        if not catalog.has_column(table, 'Фото'): continue
+        for path, refs in c.execute(f'SELECT "Фото", COUNT(*) FROM "{table}" WHERE "Фото" IN (SELECT path FROM {PHOTO_STORE_TABLE}) GROUP BY "Фото"').fetchall():
+            counts[path] += refs
+    c.executemany(f'UPDATE {PHOTO_STORE_TABLE} SET refcount = ? WHERE path = ?', [(refs, path) for path, refs in counts.items()])
+
+def sync_photo_store(conn):
+    """Создает photo_store и триггеры счетчика ссылок для всех таблиц записей с колонкой "Фото"."""
+    c = conn.cursor()
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {PHOTO_STORE_TABLE} (
+            path TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL, refcount INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    catalog = get_schema_catalog(conn)
+    created = [table for table in catalog.tables if catalog.has_column(table, 'Фото') and _ensure_photo_triggers(c, table)]
+    if created:
+        # Ссылки из строк, появившихся до триггеров, не учтены
+        recount_photo_refs(c)
+    conn.commit()
+
+def register_photo(c, path, digest, size):
+    """Добавляет объект хранилища с нулевым счетчиком; ссылки добавят триггеры при записи "Фото"."""
+    c.execute(f'INSERT OR IGNORE INTO {PHOTO_STORE_TABLE} (path, digest, size, refcount) VALUES (?, ?, ?, 0)', (path, digest, size))
+    index_photo_files(c, [path])
+
+def release_photos(c, paths=None):
+    """Удаляет объекты хранилища без ссылок (среди paths или все) вместе с файлами.
+
+    Вызывается внутри пишущей транзакции: файлы удаляются под той же блокировкой,
+    поэтому параллельная загрузка того же содержимого не потеряет файл.
+    """
+    if paths is None:
+        released = [row[0] for row in c.execute(f'SELECT path FROM {PHOTO_STORE_TABLE} WHERE refcount <= 0').fetchall()]
+    else:
+        released = [row[0] for row in c.execute(f'SELECT path FROM {PHOTO_STORE_TABLE} WHERE refcount <= 0 AND path IN (SELECT value FROM json_each(?))', (json.dumps(list(paths)),)).fetchall()]
+    c.executemany(f'DELETE FROM {PHOTO_STORE_TABLE} WHERE path = ?', [(path,) for path in released])
+    for path in released:
+        full_path = os.path.join(BASE_DIR, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+    index_photo_files(c, released)
+    return released
+
+def unreferenced_photo_files(c, paths):
+    """Фото вне хранилища, на которые больше не ссылается ни одна запись."""
+    paths = set(paths) - {row[0] for row in c.execute(f'SELECT path FROM {PHOTO_STORE_TABLE} WHERE path IN (SELECT value FROM json_each(?))', (json.dumps(list(paths)),))}
+    if not paths: return []
+    catalog = get_schema_catalog(c.connection)
+    for table in catalog.tables:
+        if not paths: break
+        if not catalog.has_column(table, 'Фото'): continue
+        paths -= {row[0] for row in c.execute(f'SELECT DISTINCT "Фото" FROM "{table}" WHERE "Фото" IN (SELECT value FROM json_each(?))', (json.dumps(list(paths)),))}
+    return sorted(paths)
+
+def ensure_import_manifest(conn):
+    """Создает манифест импорта (code.importer): путь файла относительно img/ -> запись."""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {IMPORT_MANIFEST_TABLE} (
+            path TEXT PRIMARY KEY, source_table TEXT NOT NULL, record_rowid INTEGER NOT NULL,
+            size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+def _linked_originals(c, table, rowids):
+    """Исходные файлы дерева img/ записей, которые dedupe_photos заменил жесткими ссылками на объект хранилища."""
+    originals = []
+    for path, photo in c.execute(f'''
+        SELECT 'img/' || m.path, r."Фото" FROM {IMPORT_MANIFEST_TABLE} m JOIN "{table}" r ON r.rowid = m.record_rowid
+        WHERE m.source_table = ? AND m.record_rowid IN (SELECT value FROM json_each(?))
+          AND r."Фото" IN (SELECT path FROM {PHOTO_STORE_TABLE})
+    ''', (table, json.dumps(rowids))).fetchall():
+        try:
+            if os.path.samefile(os.path.join(BASE_DIR, path), os.path.join(BASE_DIR, photo)):
+                originals.append(path)
+        except OSError:
+            continue
+    return originals
+
+# --- Дерево каталогов по "Путь" ---
+# path_tree хранит для каждой таблицы и каждого каталога-предка записей
+# (все префиксы "Путь" до "/") количество записей и записей с фото в его
+# поддереве, а также родительский каталог. Строки ведут триггеры таблиц
+# записей, поэтому переход на уровень ниже — выборка по индексу (parent, dir),
+# без просмотра таблиц. Каталоги-предки перечисляются в SQL без рекурсии
+# (CTE в триггерах недоступны): json_each по массиву из length("Путь") нулей
+# дает позиции символов, из которых берутся позиции "/".
+
+def _path_tree_trigger_names(table_name):
+    return [f'{table_name}__tree_{suffix}' for suffix in ('ai', 'ad', 'au')]
+
+def _slash_positions_sql(path):
+    """(табличная функция, условие): j.key пробегает позиции "/" в пути path (SQL-выражение)."""
+    return (
+        f"json_each('[' || substr(replace(hex(zeroblob(length({path}))), '00', ',0'), 2) || ']') j",
+        f"j.key > 0 AND substr({path}, j.key + 1, 1) = '/'",
+    )
+
+def _parent_dir_sql(directory):
+    # rtrim по всем символам, кроме "/", отрезает последний сегмент
+    return f"rtrim(rtrim({directory}, replace({directory}, '/', '')), '/')"
+
+def _has_photo_sql(row, has_photo_column):
+    return f"(COALESCE({row}.\"Фото\", '') <> '')" if has_photo_column else '0'
+
+def _path_tree_upsert_sql(table_literal, select_sql):
+    """Прибавляет к path_tree строки (dir, records, photos) подзапроса select_sql."""
+    return f'''
+        INSERT INTO {PATH_TREE_TABLE} (source_table, dir, parent, records, photos)
+        SELECT '{table_literal}', dir, {_parent_dir_sql('dir')}, records, photos FROM ({select_sql}) WHERE true
+        ON CONFLICT (source_table, dir) DO UPDATE SET records = records + excluded.records, photos = photos + excluded.photos;
+    '''
+
+def _ensure_path_tree_triggers(c, table_name, has_photo_column):
+    """Создает триггеры дерева каталогов для таблицы. Возвращает True, если их не было."""
+    insert_trigger, delete_trigger, update_trigger = _path_tree_trigger_names(table_name)
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name = ?", (insert_trigger,)).fetchone():
+        return False
+    table_literal = table_name.replace("'", "''")
+
+    def add(row):
+        positions, condition = _slash_positions_sql(f'{row}."Путь"')
+        select_sql = f'SELECT substr({row}."Путь", 1, j.key) AS dir, 1 AS records, {_has_photo_sql(row, has_photo_column)} AS photos FROM {positions} WHERE {condition}'
+        return _path_tree_upsert_sql(table_literal, select_sql)
+
+    def remove(row):
+        positions, condition = _slash_positions_sql(f'{row}."Путь"')
+        dirs = f'SELECT substr({row}."Путь", 1, j.key) FROM {positions} WHERE {condition}'
+        return f'''
+            UPDATE {PATH_TREE_TABLE} SET records = records - 1, photos = photos - {_has_photo_sql(row, has_photo_column)}
+            WHERE source_table = '{table_literal}' AND dir IN ({dirs});
+            DELETE FROM {PATH_TREE_TABLE} WHERE source_table = '{table_literal}' AND records <= 0 AND dir IN ({dirs});
+        '''
+
+    columns = '"Путь", "Фото"' if has_photo_column else '"Путь"'
+    changed = 'old."Путь" IS NOT new."Путь"'
+    if has_photo_column:
+        changed += f" OR {_has_photo_sql('old', True)} <> {_has_photo_sql('new', True)}"
+    c.execute(f'CREATE TRIGGER "{insert_trigger}" AFTER INSERT ON "{table_name}" BEGIN {add("new")} END')
+    c.execute(f'CREATE TRIGGER "{delete_trigger}" AFTER DELETE ON "{table_name}" BEGIN {remove("old")} END')
+    c.execute(f'CREATE TRIGGER "{update_trigger}" AFTER UPDATE OF {columns} ON "{table_name}" WHEN {changed} BEGIN {remove("old")} {add("new")} END')
+    return True
+
+def rebuild_path_tree(c, table_name, has_photo_column):
+    """Заново заполняет path_tree по строкам таблицы."""
+    c.execute(f'DELETE FROM {PATH_TREE_TABLE} WHERE source_table = ?', (table_name,))
+    positions, condition = _slash_positions_sql('t."Путь"')
+    select_sql = f'''
+        SELECT substr(t."Путь", 1, j.key) AS dir, COUNT(*) AS records, SUM({_has_photo_sql('t', has_photo_column)}) AS photos
+        FROM "{table_name}" t, {positions} WHERE {condition}
+        GROUP BY 1
+    '''
+    c.execute(_path_tree_upsert_sql(table_name.replace("'", "''"), select_sql))
+
+def sync_path_tree(conn):
+    """Создает path_tree, триггеры для всех таблиц записей и убирает строки удаленных таблиц."""
+    c = conn.cursor()
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {PATH_TREE_TABLE} (
+            source_table TEXT NOT NULL, dir TEXT NOT NULL, parent TEXT NOT NULL,
+            records INTEGER NOT NULL DEFAULT 0, photos INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (source_table, dir)
+        ) WITHOUT ROWID
+    ''')
+    c.execute(f'CREATE INDEX IF NOT EXISTS {PATH_TREE_TABLE}_parent ON {PATH_TREE_TABLE} (parent, dir)')
+    catalog = get_schema_catalog(conn)
+    for table in catalog.tables:
+        has_photo_column = catalog.has_column(table, 'Фото')
+        if _ensure_path_tree_triggers(c, table, has_photo_column):
+            # Таблица новая или пересоздана: строки, появившиеся до триггеров, не учтены
+            rebuild_path_tree(c, table, has_photo_column)
+    for table in _distinct_source_tables(c, PATH_TREE_TABLE):
+        if table not in catalog.tables:
+            c.execute(f'DELETE FROM {PATH_TREE_TABLE} WHERE source_table = ?', (table,))
+    conn.commit()
+
+def attach_record_table(conn, table_name):
+    """Подключает таблицу записей к тем же производным таблицам, что и init_db: поиску,
+    счетчикам ссылок photo_store и path_tree. Строки, уже лежащие в таблице, учитываются.
 
-def get_table_names():
-    with get_db_connection() as conn: 
-        return [row['name'] for row in conn.cursor().execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name NOT IN ('users', 'tags')")]
+    Не фиксирует транзакцию: таблицу можно создать и заполнить в одной транзакции
+    (импорт), и триггеры будут на месте до первой вставки.
+    """
+    c = conn.cursor()
+    index_record_table(conn, table_name)
+    has_photo_column = get_schema_catalog(conn).has_column(table_name, 'Фото')
+    if has_photo_column and _ensure_photo_triggers(c, table_name):
+        recount_photo_refs(c)
+    if _ensure_path_tree_triggers(c, table_name, has_photo_column):
+        rebuild_path_tree(c, table_name, has_photo_column)
+
+# --- Индекс файлов фото ---
+# photo_files — файлы дерева img/ (путь в формате "Фото", размер, mtime_ns),
+# чтобы страницы узнавали о наличии фото одним запросом, а не stat каждой
+# строки. Целиком индекс сверяет с диском сканер code.photo_index и отмечает
+# время сверки в app_meta (photo_scan_at); между сверками его обновляют
+# загрузка, импорт и удаление фото приложением. До первой сверки наличие
+# фото проверяется по файловой системе.
+
+def sync_photo_files(conn):
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {PHOTO_FILES_TABLE} (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL) WITHOUT ROWID')
+    conn.commit()
+
+def update_photo_files(c, files=(), removed=()):
+    """Записывает в индекс файлы [(путь, размер, mtime_ns)] и убирает удаленные пути."""
+    c.executemany(f'''
+        INSERT INTO {PHOTO_FILES_TABLE} (path, size, mtime_ns) VALUES (?, ?, ?)
+        ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns
+    ''', files)
+    c.executemany(f'DELETE FROM {PHOTO_FILES_TABLE} WHERE path = ?', [(path,) for path in removed])
+
+def _stat_photos(paths):
+    files = {}
+    for path in paths:
+        try:
+            stat = os.stat(os.path.join(BASE_DIR, path))
+        except OSError:
+            continue
+        files[path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def index_photo_files(c, paths):
+    """Сверяет с диском отдельные пути (после записи или удаления файлов приложением)."""
+    files = _stat_photos(paths)
+    update_photo_files(c, [(path, *info) for path, info in files.items()], [path for path in paths if path not in files])
+
+def get_photo_files(paths):
+    """{путь: (размер, mtime_ns)} для существующих фото из paths (по индексу, до первой сверки — через stat)."""
+    paths = [path for path in dict.fromkeys(paths) if path]
+    if not paths: return {}
+    with get_db_connection() as conn:
+        try:
+            scanned = conn.execute(f"SELECT 1 FROM {APP_META_TABLE} WHERE key = 'photo_scan_at'").fetchone()
+        except sqlite3.OperationalError:
+            scanned = None
+        if not scanned:
+            return _stat_photos(paths)
+        return {row[0]: (row[1], row[2]) for row in conn.execute(
+            f'SELECT path, size, mtime_ns FROM {PHOTO_FILES_TABLE} WHERE path IN (SELECT value FROM json_each(?))', (json.dumps(paths),)
+        )}
+
+def get_record_tags(table_name, rowid):
+    with get_db_connection() as conn:
+        return [row['name'] for row in conn.cursor().execute(f'SELECT t.name FROM {RECORD_TAGS_TABLE} rt JOIN tags t ON t.id = rt.tag_id WHERE rt.source_table = ? AND rt.record_rowid = ? ORDER BY t.name', (table_name, rowid))]
+
+@lru_cache(maxsize=64)
+def _matching_keys_sql(has_text, tag_count, by_table):
+    key_sets = []
+    if has_text:
+        # CROSS JOIN фиксирует порядок: сначала индекс, потом ключи. Иначе при фильтре
+        # по таблице SQLite перебирает ключи таблицы и ищет каждый в индексе
+        key_sets.append(f'''
+            SELECT k.source_table, k.record_rowid FROM {SEARCH_INDEX_TABLE} s
+            CROSS JOIN {SEARCH_KEYS_TABLE} k ON k.id = s.rowid
+            WHERE s.path LIKE ?
+        ''')
+    key_sets += [f'SELECT source_table, record_rowid FROM {RECORD_TAGS_TABLE} WHERE tag_id = (SELECT id FROM tags WHERE name = ?)'] * tag_count
+    sql_query = " INTERSECT ".join(key_sets)
+    if by_table:
+        sql_query = f'SELECT * FROM ({sql_query}) WHERE source_table = ?'
+    return sql_query
+
+def _matching_keys_query(text_query="", tag_list=(), table_name=None):
+    """Строит запрос (source_table, record_rowid) для записей, подходящих под текст и все теги.
+
+    Подстрока ищется по индексу search_index, теги — по record_tags;
+    несколько условий объединяются через INTERSECT. Возвращает (sql, params)
+    или (None, []), если условий нет.
+    """
+    tags = list(dict.fromkeys(tag_list))
+    if not text_query and not tags: return None, []
+    params = ([f'%{text_query}%'] if text_query else []) + tags + ([table_name] if table_name else [])
+    return _matching_keys_sql(bool(text_query), len(tags), bool(table_name)), params
+
+def _page_bounds(page, per_page):
+    return per_page, (max(1, page) - 1) * per_page
+
+def _fetch_records_by_keys(conn, keys, full=False):
+    """Читает записи по списку ключей (source_table, rowid), сохраняя порядок ключей.
+
+    full=False — только публичные колонки, full=True — все колонки таблицы.
+    """
+    catalog = get_schema_catalog(conn)
+    selects = catalog.full_select if full else catalog.public_select
+    rowids_by_table = {}
+    for source_table, rowid in keys:
+        rowids_by_table.setdefault(source_table, []).append(rowid)
+    records = {}
+    for table, rowids in rowids_by_table.items():
+        if table not in selects: continue
+        for row in conn.cursor().execute(selects[table], (json.dumps(rowids),)):
+            records[(table, row['rowid'])] = row
+    return [records[tuple(key)] for key in keys if tuple(key) in records]
+
+# --- Общий кэш результатов поиска ---
+# Результаты поиска хранятся на уровне процесса в виде компактных массивов rowid
+# (не строк sqlite3.Row) и переиспользуются всеми сессиями. Каждая запись кэша
+# помечена поколением данных из app_meta; функции, меняющие записи или теги,
+# увеличивают поколение в той же транзакции, поэтому устаревшие результаты
+# не выдаются даже после записи из другого процесса (например, импорта).
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+class KeySet:
+    """Отсортированные rowid найденных записей по таблицам."""
+    __slots__ = ('rowids', 'total', 'nbytes')
+
+    def __init__(self, hits):
+        self.rowids = {table: array('q', sorted(rowids)) for table, rowids in hits.items()}
+        self.total = sum(len(rowids) for rowids in self.rowids.values())
+        self.nbytes = 128 + sum(96 + len(table) + rowids.itemsize * len(rowids) for table, rowids in self.rowids.items())
+
+    def page(self, offset, limit, table_order):
+        """Ключи (source_table, rowid) с offset по offset + limit в порядке table_order, rowid."""
+        keys = []
+        for table in table_order:
+            rowids = self.rowids.get(table)
+            if rowids is None: continue
+            if offset >= len(rowids):
+                offset -= len(rowids); continue
+            chunk = rowids[offset:offset + limit - len(keys)]
+            keys += [(table, rowid) for rowid in chunk]
+            offset = 0
+            if len(keys) >= limit: break
+        return keys
+
+    def keys(self, table_order):
+        return [(table, rowid) for table in table_order if table in self.rowids for rowid in self.rowids[table]]
+
+class ResultCache:
+    """LRU-кэш с ограничением по суммарному объему значений в байтах."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                count_cache('result_cache', True)
+                return entry[1]
+            self._stats['misses'] += 1
+        count_cache('result_cache', False)
+        return None
+
+    def put(self, key, generation, value, nbytes):
+        if nbytes > self.max_bytes: return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (generation, value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+
+_result_cache = ResultCache(RESULT_CACHE_MAX_BYTES)
+
+def get_result_cache_stats():
+    return _result_cache.stats()
+
+def _data_generation(conn):
+    try:
+        row = conn.execute(f"SELECT value FROM {APP_META_TABLE} WHERE key = 'data_generation'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+def bump_data_generation(conn):
+    """Помечает кэшированные результаты поиска устаревшими. Вызывается внутри пишущей транзакции."""
+    conn.execute(f"INSERT INTO {APP_META_TABLE} (key, value) VALUES ('data_generation', 1) ON CONFLICT (key) DO UPDATE SET value = value + 1")
+
+def get_data_version():
+    """Версия данных (поколение данных, версия схемы): меняется при любом изменении записей, тегов или таблиц."""
+    conn = get_db_connection()
+    return _data_generation(conn), _schema_version(conn)
+
+def get_cached(conn, key, compute, nbytes=lambda value: 64):
+    """Кэширует производное от данных значение в общем кэше результатов до смены поколения данных."""
+    generation = _data_generation(conn)
+    key = (DB_FILE,) + key
+    value = _result_cache.get(key, generation)
+    if value is None:
+        value = compute()
+        _result_cache.put(key, generation, value, nbytes(value))
+    return value
+
+def _matching_keyset(conn, text_query="", tag_list=(), table_name=None):
+    """Возвращает KeySet записей, подходящих под текст и все теги, через общий кэш."""
+    # LIKE не различает регистр только для ASCII, поэтому нормализуем только его
+    normalized_text = (text_query or "").translate(_ASCII_LOWER)
+    normalized_tags = tuple(sorted(set(tag_list)))
+
+    def compute():
+        sql_query, params = _matching_keys_query(normalized_text, normalized_tags, table_name)
+        hits = {}
+        if sql_query:
+            for source_table, record_rowid in conn.cursor().execute(sql_query, params):
+                hits.setdefault(source_table, []).append(record_rowid)
+        return KeySet(hits)
+
+    return get_cached(conn, ('keys', normalized_text, normalized_tags, table_name), compute, lambda keyset: keyset.nbytes)
 
 def get_records(table_name, search_query=""):
     if not table_name: return []
     with get_db_connection() as conn:
-        sql_query = f'SELECT "{table_name}" as source_table, rowid, * FROM "{table_name}"'
-        params = []
-        if search_query: sql_query += ' WHERE "Путь" LIKE ?'; params.append(f'%{search_query}%')
-        return conn.cursor().execute(sql_query, params).fetchall()
+        if search_query:
+            keyset = _matching_keyset(conn, search_query, table_name=table_name)
+            return _fetch_records_by_keys(conn, keyset.keys([table_name]), full=True)
+        catalog = get_schema_catalog(conn)
+        if table_name not in catalog.tables: return []
+        return conn.cursor().execute(catalog.full_page_select[table_name], (-1, 0)).fetchall()
 
 def global_search_records(search_query):
     if not search_query: return []
     with get_db_connection() as conn:
-        table_names = get_table_names()
-        if not table_names: return []
-        union_parts = [f'SELECT "{table}" as source_table, rowid, * FROM "{table}" WHERE "Путь" LIKE ?' for table in table_names]
-        sql_query = " UNION ALL ".join(union_parts)
-        params = [f'%{search_query}%'] * len(table_names)
-        return conn.cursor().execute(sql_query, params).fetchall()
+        keyset = _matching_keyset(conn, search_query)
+        return _fetch_records_by_keys(conn, keyset.keys(get_table_names(conn)), full=True)
 
 def search_public(text_query="", tag_list=[]):
     """Выполняет публичный поиск по тексту и тегам."""
+    if not text_query and not tag_list: return []
     with get_db_connection() as conn:
-        table_names = get_table_names()
-        if not table_names: return []
-
-        where_clauses = []
-        params_for_one_table = []
-        if text_query:
-            where_clauses.append('"Путь" LIKE ?')
-            params_for_one_table.append(f'%{text_query}%')
-        if tag_list:
-            for tag in tag_list:
-                where_clauses.append('"," || tags || "," LIKE ?')
-                params_for_one_table.append(f'%,{tag},%')
-        
-        if not where_clauses: return []
+        # Подходящие записи находятся по индексам, в таблицы идем только за найденными rowid
+        keyset = _matching_keyset(conn, text_query, tag_list)
+        return _fetch_records_by_keys(conn, keyset.keys(get_table_names(conn)))
 
-        select_parts = []
-        for table in table_names:
-            query = f'SELECT "{table}" as source_table, "Путь", "Подфайл", "Комментарий", "Фото", "tags" FROM "{table}"'
-            if where_clauses:
-                query += " WHERE " + " AND ".join(where_clauses)
-            select_parts.append(query)
-        
-        final_sql = " UNION ALL ".join(select_parts)
-        final_params = params_for_one_table * len(table_names)
+# --- Постраничные варианты поиска ---
+# Возвращают одну страницу; общее количество считается отдельной функцией
+# count_*, чтобы вызывающий код мог его закэшировать. Ключи страниц берутся
+# из общего кэша результатов, из таблиц читается только сама страница.
+
+def search_public_page(text_query="", tag_list=[], page=1, per_page=30):
+    """Возвращает одну страницу публичного поиска по тексту и тегам."""
+    if not text_query and not tag_list: return []
+    with get_db_connection() as conn:
+        limit, offset = _page_bounds(page, per_page)
+        keys = _matching_keyset(conn, text_query, tag_list).page(offset, limit, get_schema_catalog(conn).tables)
+        return _fetch_records_by_keys(conn, keys)
+
+def count_search_public(text_query="", tag_list=[]):
+    if not text_query and not tag_list: return 0
+    with get_db_connection() as conn: return _matching_keyset(conn, text_query, tag_list).total
+
+def get_records_page(table_name, search_query="", page=1, per_page=30):
+    if not table_name: return []
+    with get_db_connection() as conn:
+        if search_query:
+            limit, offset = _page_bounds(page, per_page)
+            keys = _matching_keyset(conn, search_query, table_name=table_name).page(offset, limit, [table_name])
+            return _fetch_records_by_keys(conn, keys, full=True)
+        catalog = get_schema_catalog(conn)
+        if table_name not in catalog.tables: return []
+        return conn.cursor().execute(catalog.full_page_select[table_name], _page_bounds(page, per_page)).fetchall()
+
+def count_records(table_name, search_query=""):
+    if not table_name: return 0
+    with get_db_connection() as conn:
+        if search_query: return _matching_keyset(conn, search_query, table_name=table_name).total
+        if table_name not in get_schema_catalog(conn).tables: return 0
+        return get_cached(conn, ('count', table_name), lambda: conn.cursor().execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0])
+
+def global_search_records_page(search_query, page=1, per_page=30):
+    if not search_query: return []
+    with get_db_connection() as conn:
+        limit, offset = _page_bounds(page, per_page)
+        keys = _matching_keyset(conn, search_query).page(offset, limit, get_schema_catalog(conn).tables)
+        return _fetch_records_by_keys(conn, keys, full=True)
+
+def count_global_search_records(search_query):
+    if not search_query: return 0
+    with get_db_connection() as conn: return _matching_keyset(conn, search_query).total
+
+# --- Просмотр по каталогам ---
+# Подкаталоги и их счетчики читаются из path_tree по индексу (parent, dir).
+# Записи каталога (со всеми подкаталогами) находятся по поисковому индексу
+# префиксом "каталог/%" с точной проверкой начала пути: LIKE не различает
+# регистр и считает "_" и "%" шаблонами.
+
+def get_path_children(parent=""):
+    """Подкаталоги parent ("" — верхний уровень): [(каталог, записей, записей с фото)] по всем таблицам."""
+    with get_db_connection() as conn:
+        return [tuple(row) for row in conn.cursor().execute(f'''
+            SELECT dir, SUM(records), SUM(photos) FROM {PATH_TREE_TABLE} WHERE parent = ? GROUP BY dir ORDER BY dir
+        ''', (parent,))]
+
+def _path_keyset(conn, directory):
+    def compute():
+        hits = {}
+        for source_table, record_rowid in conn.cursor().execute(f'''
+            SELECT k.source_table, k.record_rowid FROM {SEARCH_INDEX_TABLE} s
+            CROSS JOIN {SEARCH_KEYS_TABLE} k ON k.id = s.rowid
+            WHERE s.path LIKE ? AND substr(s.path, 1, ?) = ?
+        ''', (f'{directory}/%', len(directory) + 1, f'{directory}/')):
+            hits.setdefault(source_table, []).append(record_rowid)
+        return KeySet(hits)
+    return get_cached(conn, ('path', directory), compute, lambda keyset: keyset.nbytes)
+
+def get_path_records_page(directory, page=1, per_page=30):
+    """Одна страница записей каталога directory и его подкаталогов."""
+    if not directory: return []
+    with get_db_connection() as conn:
+        limit, offset = _page_bounds(page, per_page)
+        return _fetch_records_by_keys(conn, _path_keyset(conn, directory).page(offset, limit, get_schema_catalog(conn).tables))
+
+def count_path_records(directory):
+    """Количество записей в каталоге directory и его подкаталогах (по path_tree)."""
+    if not directory: return 0
+    with get_db_connection() as conn:
+        row = conn.cursor().execute(f'''
+            SELECT SUM(records) FROM {PATH_TREE_TABLE} WHERE parent = ? AND dir = ?
+        ''', (directory.rpartition('/')[0], directory)).fetchone()
+        return row[0] or 0
+
+def iter_records(table_name=None, text_query="", tag_list=(), full=False, batch_size=1000):
+    """Потоково выдает записи под фильтром поиска (текст, теги, таблица) по таблицам и rowid.
 
-        if not final_sql or not final_params: return []
+    Строки читаются через fetchmany, результат целиком в памяти не собирается.
+    Без условий выдаются все записи таблицы (или всех таблиц).
+    """
+    conn = get_db_connection()
+    catalog = get_schema_catalog(conn)
+    columns = catalog.full_columns if full else catalog.public_columns
+    normalized_text = (text_query or "").translate(_ASCII_LOWER)
+    for table in [table_name] if table_name else get_table_names(conn):
+        if table not in catalog.tables: continue
+        sql_query = f'SELECT "{table}" as source_table, rowid, {columns[table]} FROM "{table}"'
+        keys_query, params = _matching_keys_query(normalized_text, tag_list, table)
+        if keys_query:
+            sql_query += f' WHERE rowid IN (SELECT record_rowid FROM ({keys_query}))'
+        cursor = conn.cursor().execute(sql_query + ' ORDER BY rowid', params)
+        while rows := cursor.fetchmany(batch_size):
+            yield from rows
 
-        return conn.cursor().execute(final_sql, final_params).fetchall()
+def get_records_by_keys(keys, full=False):
+    """Записи по списку ключей (source_table, rowid) в том же порядке."""
+    with get_db_connection() as conn: return _fetch_records_by_keys(conn, keys, full)
 
 def get_record_by_id(table_name, rowid):
-    with get_db_connection() as conn: return conn.cursor().execute(f'SELECT rowid, * FROM "{table_name}" WHERE rowid = ?', (rowid,)).fetchone()
+    with get_db_connection() as conn:
+        catalog = get_schema_catalog(conn)
+        if table_name in catalog.full_select:
+            return conn.cursor().execute(catalog.full_select[table_name], (json.dumps([rowid]),)).fetchone()
+        return conn.cursor().execute(f'SELECT rowid, * FROM "{table_name}" WHERE rowid = ?', (rowid,)).fetchone()
 
 def update_record(table_name, rowid, comment, tags, photo_path):
-    with get_db_connection() as conn: conn.cursor().execute(f'UPDATE "{table_name}" SET "Комментарий" = ?, "tags" = ?, "Фото" = ? WHERE rowid = ?', (comment, tags, photo_path, rowid)); conn.commit()
+    tag_names = list(dict.fromkeys(_split_tags(tags)))
+    with get_write_connection() as conn:
+        c = conn.cursor()
+        old_photo = c.execute(f'SELECT "Фото" FROM "{table_name}" WHERE rowid = ?', (rowid,)).fetchone()
+        c.execute(f'UPDATE "{table_name}" SET "Комментарий" = ?, "tags" = ?, "Фото" = ? WHERE rowid = ?', (comment, ",".join(tag_names), photo_path, rowid))
+        _set_record_tags(c, table_name, rowid, tag_names)
+        if old_photo and old_photo[0] and old_photo[0] != photo_path:
+            release_photos(c, [old_photo[0]])
+        bump_data_generation(conn)
 
 def delete_record(table_name, rowid):
-    record = get_record_by_id(table_name, rowid)
-    if record and record['Фото']:
-        full_image_path = os.path.join(BASE_DIR, record['Фото'])
+    delete_records([(table_name, rowid)])
+
+# --- Массовые операции ---
+# Работают со списком ключей (source_table, rowid): выделением на странице или
+# всеми записями текущего фильтра. Все изменения выполняются одной транзакцией,
+# по одному executemany на таблицу.
+
+def _group_keys(keys):
+    rowids_by_table = {}
+    for table, rowid in keys:
+        rowids_by_table.setdefault(table, []).append(rowid)
+    return rowids_by_table
+
+def get_record_keys(table_name=None, search_query=""):
+    """Ключи всех записей фильтра админки: таблица и/или подстрока пути."""
+    with get_db_connection() as conn:
+        table_names = get_table_names(conn)
+        if search_query:
+            return _matching_keyset(conn, search_query, table_name=table_name).keys(table_names)
+        if table_name not in table_names: return []
+        return [(table_name, row[0]) for row in conn.cursor().execute(f'SELECT rowid FROM "{table_name}" ORDER BY rowid')]
+
+def bulk_update_records(keys, add_tags=(), remove_tags=(), comment=None, detach_photo=False):
+    """Добавляет/убирает теги, задает комментарий (если не None) и открепляет фото у записей. Возвращает число записей."""
+    add_tags = [name for name in dict.fromkeys(add_tags) if name not in remove_tags]
+    remove_tags = list(dict.fromkeys(remove_tags))
+    updated = 0
+    detached = []
+    with get_write_connection() as conn:
+        c = conn.cursor()
+        catalog = get_schema_catalog(conn)
+        add_ids = _get_tag_ids(c, add_tags) if add_tags else {}
+        remove_ids = [row[0] for row in c.execute("SELECT id FROM tags WHERE name IN (SELECT value FROM json_each(?))", (json.dumps(remove_tags),))] if remove_tags else []
+        for table, rowids in _group_keys(keys).items():
+            if table not in catalog.tables: continue
+            updated += len(rowids)
+            if (add_tags or remove_tags) and catalog.has_column(table, 'tags'):
+                updates = []
+                for rowid, tags in c.execute(f'SELECT rowid, tags FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?))', (json.dumps(rowids),)).fetchall():
+                    names = [name for name in _split_tags(tags) if name not in remove_tags]
+                    updates.append((",".join(dict.fromkeys(names + add_tags)), rowid))
+                c.executemany(f'UPDATE "{table}" SET tags = ? WHERE rowid = ?', updates)
+            if add_ids:
+                c.executemany(f'INSERT OR IGNORE INTO {RECORD_TAGS_TABLE} (source_table, record_rowid, tag_id) VALUES (?, ?, ?)', [(table, rowid, tag_id) for rowid in rowids for tag_id in add_ids.values()])
+            if remove_ids:
+                c.executemany(f'DELETE FROM {RECORD_TAGS_TABLE} WHERE source_table = ? AND record_rowid = ? AND tag_id = ?', [(table, rowid, tag_id) for rowid in rowids for tag_id in remove_ids])
+            if comment is not None and catalog.has_column(table, 'Комментарий'):
+                c.executemany(f'UPDATE "{table}" SET "Комментарий" = ? WHERE rowid = ?', [(comment, rowid) for rowid in rowids])
+            if detach_photo and catalog.has_column(table, 'Фото'):
+                detached += [row[0] for row in c.execute(f'SELECT DISTINCT "Фото" FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?)) AND "Фото" != \'\'', (json.dumps(rowids),))]
+                c.executemany(f'UPDATE "{table}" SET "Фото" = \'\' WHERE rowid = ?', [(rowid,) for rowid in rowids])
+        if detached:
+            release_photos(c, detached)
+        if updated:
+            bump_data_generation(conn)
+    return updated
+
+def delete_records(keys):
+    """Удаляет записи с тегами и фото, на которые больше никто не ссылается. Возвращает число записей."""
+    rowids_by_table = _group_keys(keys)
+    deleted = 0
+    with get_write_connection() as conn:
+        c = conn.cursor()
+        catalog = get_schema_catalog(conn)
+        has_manifest = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (IMPORT_MANIFEST_TABLE,)).fetchone()
+        photos, originals = [], []
+        for table, rowids in rowids_by_table.items():
+            if table not in catalog.tables: continue
+            if catalog.has_column(table, 'Фото'):
+                photos += [row[0] for row in c.execute(f'SELECT "Фото" FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?)) AND "Фото" IS NOT NULL AND "Фото" != \'\'', (json.dumps(rowids),))]
+                if has_manifest:
+                    originals += _linked_originals(c, table, rowids)
+            c.executemany(f'DELETE FROM "{table}" WHERE rowid = ?', [(rowid,) for rowid in rowids])
+            deleted += c.rowcount
+            c.executemany(f'DELETE FROM {RECORD_TAGS_TABLE} WHERE source_table = ? AND record_rowid = ?', [(table, rowid) for rowid in rowids])
+            if has_manifest:
+                # Строка манифеста остается с record_rowid = 0, чтобы импорт не создал запись заново,
+                # если исходный файл остался на диске. Индекса по (source_table, record_rowid) нет: один проход на таблицу
+                c.execute(f'UPDATE {IMPORT_MANIFEST_TABLE} SET record_rowid = 0 WHERE source_table = ? AND record_rowid IN (SELECT value FROM json_each(?))', (table, json.dumps(rowids)))
+        if deleted:
+            bump_data_generation(conn)
+        # Исходный файл дерева — та же копия, что и объект хранилища: без его удаления место не освободится
+        legacy_photos = unreferenced_photo_files(c, photos + originals)
+        release_photos(c, photos)
+    # Файлы вне хранилища удаляются после коммита, чтобы откат транзакции не оставил записи без фото
+    for photo in legacy_photos:
+        full_image_path = os.path.join(BASE_DIR, photo)
         if os.path.exists(full_image_path):
             os.remove(full_image_path)
-    with get_db_connection() as conn: conn.cursor().execute(f'DELETE FROM "{table_name}" WHERE rowid = ?', (rowid,)); conn.commit()
+    if legacy_photos:
+        with get_write_connection() as conn:
+            index_photo_files(conn.cursor(), legacy_photos)
+    return deleted
 
 def get_all_tags():
     with get_db_connection() as conn: return [row['name'] for row in conn.cursor().execute("SELECT name FROM tags ORDER BY name")]
 
+def get_tag_counts():
+    """Возвращает {имя тега: количество записей} по всем тегам."""
+    with get_db_connection() as conn:
+        def compute():
+            return {row[0]: row[1] for row in conn.cursor().execute(f'SELECT t.name, COALESCE(tc.records, 0) FROM tags t LEFT JOIN {TAG_COUNTS_TABLE} tc ON tc.tag_id = t.id')}
+        return get_cached(conn, ('tag_counts',), compute, lambda counts: 64 + 96 * len(counts))
+
+def get_tag_facets(text_query="", tag_list=[]):
+    """Возвращает {имя тега: количество записей} среди результатов поиска по тексту и тегам.
+
+    Без условий поиска — общие счетчики из tag_counts, иначе один агрегирующий
+    запрос по record_tags найденных записей. Тегов без совпадений в ответе нет.
+    """
+    if not text_query and not tag_list: return get_tag_counts()
+    normalized_text = (text_query or "").translate(_ASCII_LOWER)
+    normalized_tags = tuple(sorted(set(tag_list)))
+    with get_db_connection() as conn:
+        def compute():
+            keys_query, params = _matching_keys_query(normalized_text, normalized_tags)
+            return {row[0]: row[1] for row in conn.cursor().execute(f'''
+                SELECT t.name, COUNT(*) FROM ({keys_query}) m
+                JOIN {RECORD_TAGS_TABLE} rt ON rt.source_table = m.source_table AND rt.record_rowid = m.record_rowid
+                JOIN tags t ON t.id = rt.tag_id
+                GROUP BY rt.tag_id
+            ''', params)}
+        return get_cached(conn, ('facets', normalized_text, normalized_tags), compute, lambda counts: 64 + 96 * len(counts))
+
 def add_new_tag(name, description):
-    with get_db_connection() as conn: conn.cursor().execute("INSERT INTO tags (name, description) VALUES (?, ?)", (name, description)); conn.commit()
+    with get_write_connection() as conn:
+        conn.cursor().execute("INSERT INTO tags (name, description) VALUES (?, ?)", (name, description))
+        bump_data_generation(conn)
 
 def update_tag(tag_id, new_name, new_description):
-    with get_db_connection() as conn: conn.cursor().execute("UPDATE tags SET name = ?, description = ? WHERE id = ?", (new_name, new_description, tag_id)); conn.commit()
+    with get_write_connection() as conn:
+        c = conn.cursor()
+        _rewrite_tags_column(c, tag_id, rename_to=new_name)
+        c.execute("UPDATE tags SET name = ?, description = ? WHERE id = ?", (new_name, new_description, tag_id))
+        bump_data_generation(conn)
 
 def delete_tag(tag_id):
-    with get_db_connection() as conn: conn.cursor().execute("DELETE FROM tags WHERE id = ?", (tag_id,)); conn.commit()
+    with get_write_connection() as conn:
+        c = conn.cursor()
+        _rewrite_tags_column(c, tag_id)
+        c.execute(f'DELETE FROM {RECORD_TAGS_TABLE} WHERE tag_id = ?', (tag_id,))
+        c.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+        bump_data_generation(conn)
 
 def get_all_users():
     with get_db_connection() as conn: return conn.cursor().execute("SELECT rowid, username, name, admin FROM users").fetchall()
@@ -120,7 +1310,7 @@ def get_user_by_username(username):
         return conn.cursor().execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
 
 def update_user(username, new_name=None, new_admin_status=None, new_username=None, new_password=None):
-    with get_db_connection() as conn:
+    with get_write_connection() as conn:
         updates = []
         params = []
         if new_name is not None:
@@ -139,18 +1329,23 @@ def update_user(username, new_name=None, new_admin_status=None, new_username=Non
         if updates:
             params.append(username)
             conn.cursor().execute(f"UPDATE users SET {', '.join(updates)} WHERE username = ?", tuple(params))
-            conn.commit()
 
 def delete_user(username):
-    with get_db_connection() as conn: conn.cursor().execute("DELETE FROM users WHERE username = ?", (username,)); conn.commit()
+    with get_write_connection() as conn: conn.cursor().execute("DELETE FROM users WHERE username = ?", (username,))
 
-@st.cache_data
-def get_image_as_base64(path):
-    import base64
-    full_image_path = os.path.join(BASE_DIR, path)
-    try:
-        with open(full_image_path, "rb") as f:
-            data = f.read()
-        return base64.b64encode(data).decode()
-    except Exception:
-        return None
+def get_meta_value(key, create=None):
+    """Значение из app_meta; если его нет и задан create, сохраняет create() и возвращает сохраненное."""
+    init_db()
+    row = get_db_connection().execute(f"SELECT value FROM {APP_META_TABLE} WHERE key = ?", (key,)).fetchone()
+    if row or create is None:
+        return row[0] if row else None
+    with get_write_connection() as conn:
+        # Параллельный вызов мог сохранить значение первым — побеждает сохраненное
+        conn.execute(f"INSERT OR IGNORE INTO {APP_META_TABLE} (key, value) VALUES (?, ?)", (key, create()))
+        return conn.execute(f"SELECT value FROM {APP_META_TABLE} WHERE key = ?", (key,)).fetchone()[0]
+
+def set_meta_value(key, value):
+    """Сохраняет служебное значение в app_meta, заменяя прежнее."""
+    init_db()
+    with get_write_connection() as conn:
+        conn.execute(f"INSERT OR REPLACE INTO {APP_META_TABLE} (key, value) VALUES (?, ?)", (key, value))
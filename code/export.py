@@ -0,0 +1,192 @@
+import io
+import os
+import csv
+import hmac
+import json
+import time
+import base64
+import hashlib
+import zipfile
+import secrets
+from itertools import islice
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from code.db_helpers import BASE_DIR, RECORD_COLUMNS, get_db_connection, get_schema_catalog, get_meta_value, iter_records
+from code.i18n import t
+
+# --- Экспорт результатов поиска ---
+# Записи под фильтром поиска читаются через iter_records (fetchmany) и сразу
+# кодируются в CSV или Parquet; при выгрузке с фото файл данных и фото
+# упаковываются в zip на лету. Выгрузку отдает сервер изображений
+# (/export/<токен>) с chunked-кодированием, поэтому ни результат, ни файл
+# целиком в памяти не собираются. Параметры выгрузки страница кладет в сам
+# токен и подписывает ключом из app_meta, поэтому выгрузку может отдать сервер
+# изображений любого процесса приложения. Токен действует от EXPORT_TTL_S до
+# 2 * EXPORT_TTL_S секунд и не меняется при перерисовке страницы.
+# Без сервера изображений (IMAGE_SERVER_URL не задан) файл отдает Streamlit
+# через download_button, который собирает его в памяти, поэтому такая
+# выгрузка ограничена EXPORT_INLINE_MAX_ROWS записями и не включает фото.
+
+EXPORT_FORMATS = {'csv': 'text/csv; charset=utf-8', 'parquet': 'application/vnd.apache.parquet'}
+EXPORT_TTL_S = 15 * 60
+EXPORT_INLINE_MAX_ROWS = int(os.environ.get('APP_EXPORT_INLINE_MAX_ROWS', 10000))
+CSV_BATCH_ROWS = 1000
+PARQUET_ROW_GROUP = 10000
+
+class _ChunkSink(io.RawIOBase):
+    """Файловый объект только для записи: копит байты, которые генератор забирает через drain()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def export_columns(table_name=None, full=False):
+    """Колонки выгрузки: source_table, rowid, колонки записей и (full=True) остальные колонки таблиц."""
+    columns = ['source_table', 'rowid', *RECORD_COLUMNS]
+    if full:
+        catalog = get_schema_catalog(get_db_connection())
+        for table in [table_name] if table_name else catalog.tables:
+            columns += [column for column in catalog.columns.get(table, ()) if column not in columns]
+    return columns
+
+def _row_values(row, columns):
+    keys = row.keys()
+    return [row[column] if column in keys else None for column in columns]
+
+def iter_csv(rows, columns):
+    """Кодирует строки в CSV (UTF-8 с BOM для Excel) частями по CSV_BATCH_ROWS строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(_row_values(row, columns))
+        if i % CSV_BATCH_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0); buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def iter_parquet(rows, columns):
+    """Кодирует строки в Parquet группами по PARQUET_ROW_GROUP строк; rowid — int64, остальное — строки."""
+    schema = pa.schema([(column, pa.int64() if column == 'rowid' else pa.string()) for column in columns])
+    sink = _ChunkSink()
+
+    def write_batch(writer, batch):
+        arrays = [
+            pa.array([values[i] if column == 'rowid' or values[i] is None else str(values[i]) for values in batch], schema.field(column).type)
+            for i, column in enumerate(columns)
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        batch = []
+        for row in rows:
+            batch.append(_row_values(row, columns))
+            if len(batch) >= PARQUET_ROW_GROUP:
+                write_batch(writer, batch); batch.clear()
+                yield sink.drain()
+        if batch:
+            write_batch(writer, batch)
+    yield sink.drain()
+
+def iter_zip(rows, columns, fmt, data_name):
+    """Zip с файлом данных и фото записей (под их путями из колонки "Фото")."""
+    photos = {}
+
+    def collect(rows):
+        for row in rows:
+            photo = row['Фото']
+            if photo: photos[photo] = None
+            yield row
+
+    encode = iter_parquet if fmt == 'parquet' else iter_csv
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        info = zipfile.ZipInfo(data_name, time.localtime()[:6])
+        # Parquet уже сжат внутри файла
+        info.compress_type = zipfile.ZIP_STORED if fmt == 'parquet' else zipfile.ZIP_DEFLATED
+        with archive.open(info, 'w', force_zip64=True) as member:
+            for chunk in encode(collect(rows), columns):
+                member.write(chunk)
+                yield sink.drain()
+        for photo in photos:
+            full_path = os.path.join(BASE_DIR, photo)
+            if not os.path.isfile(full_path): continue
+            # Фото уже сжаты, поэтому хранятся без сжатия
+            archive.write(full_path, photo, compress_type=zipfile.ZIP_STORED)
+            yield sink.drain()
+    yield sink.drain()
+
+# --- Токены выгрузок ---
+
+def _export_secret():
+    return get_meta_value('export_secret', lambda: secrets.token_hex(32)).encode('utf-8')
+
+def _sign(payload):
+    return hmac.new(_export_secret(), payload.encode('ascii'), hashlib.sha256).hexdigest()
+
+def register_export(fmt, table_name=None, text_query="", tag_list=(), full=False, with_photos=False):
+    """Возвращает подписанный токен выгрузки; одинаковые параметры в течение EXPORT_TTL_S дают тот же токен."""
+    if fmt not in EXPORT_FORMATS: raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    # Срок округлен вверх до следующего окна, чтобы ссылка не менялась на каждой перерисовке
+    expires = (int(time.time()) // EXPORT_TTL_S + 2) * EXPORT_TTL_S
+    params = [fmt, table_name, text_query or "", sorted(set(tag_list)), bool(full), bool(with_photos), expires]
+    payload = base64.urlsafe_b64encode(json.dumps(params, ensure_ascii=False).encode('utf-8')).decode('ascii').rstrip('=')
+    return f"{payload}.{_sign(payload)}"
+
+def open_export(export_id, max_rows=None):
+    """Возвращает (имя файла, Content-Type, генератор байтов) для выгрузки или None, если токен неверен или истек."""
+    try:
+        payload, signature = (export_id or '').split('.')
+        if not hmac.compare_digest(signature.encode('ascii'), _sign(payload).encode('ascii')): return None
+        fmt, table_name, text_query, tag_list, full, with_photos, expires = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (ValueError, UnicodeEncodeError):
+        return None
+    if expires < time.time() or fmt not in EXPORT_FORMATS: return None
+    columns = export_columns(table_name, full)
+    rows = iter_records(table_name, text_query, tag_list, full)
+    if max_rows is not None:
+        rows = islice(rows, max_rows)
+    name = f"export-{datetime.now():%Y%m%d-%H%M%S}"
+    if with_photos:
+        return f"{name}.zip", 'application/zip', iter_zip(rows, columns, fmt, f"{name}.{fmt}")
+    encode = iter_parquet if fmt == 'parquet' else iter_csv
+    return f"{name}.{fmt}", EXPORT_FORMATS[fmt], encode(rows, columns)
+
+# --- Элементы страницы ---
+
+def export_controls(table_name=None, text_query="", tag_list=(), full=False, key='export'):
+    """Кнопка выгрузки текущего фильтра: формат, фото в zip и ссылка на скачивание."""
+    from code.image_server import IMAGE_SERVER_URL
+    # Токен подписан, поэтому выгрузку отдаст сервер изображений любого процесса
+    streaming = bool(IMAGE_SERVER_URL)
+    with st.popover(t('export_button')):
+        fmt = st.radio(t('export_format'), list(EXPORT_FORMATS), horizontal=True, format_func=str.upper, key=f'{key}_format')
+        with_photos = st.checkbox(t('export_with_photos'), key=f'{key}_photos', disabled=not streaming)
+        export_id = register_export(fmt, table_name, text_query, tag_list, full, with_photos and streaming)
+        if streaming:
+            st.link_button(t('export_download'), f'{IMAGE_SERVER_URL}/export/{export_id}')
+        else:
+            # Без сервера изображений файл соберется в памяти процесса Streamlit
+            st.caption(t('export_inline_limit').format(rows=EXPORT_INLINE_MAX_ROWS))
+            filename, mime, _ = open_export(export_id)
+            st.download_button(t('export_download'), lambda: b''.join(open_export(export_id, EXPORT_INLINE_MAX_ROWS)[2]), file_name=filename, mime=mime, key=f'{key}_download')
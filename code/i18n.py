@@ -1,54 +1,130 @@
 import streamlit as st
 import json
 import os
+import re
+import glob
+import string
+import logging
 
-# --- Кэшированная функция для загрузки локали ---
-@st.cache_data
-def load_locale(language_code='en'):
-    """Загружает JSON-файл локали для указанного языка."""
-    locale_path = os.path.join('locales', f'{language_code}.json')
-    try:
-        with open(locale_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Если файл для языка не найден, возвращаем пустой словарь
-        return {}
+logger = logging.getLogger(__name__)
+
+# --- Каталоги переводов ---
+# Файлы locales/*.json читаются и проверяются один раз при импорте модуля.
+# Переводы каждого языка хранятся в обычном словаре: ключи, которых нет
+# в языке, заранее заполнены текстом базового языка, шаблоны с {полями}
+# разобраны заранее. Расхождения между языками и ключи, которых нет ни в одном
+# каталоге, попадают в лог при запуске, а не обнаруживаются при отрисовке.
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+LOCALES_DIR = os.path.join(BASE_DIR, 'locales')
+DEFAULT_LANGUAGE = 'en'
+LANGUAGES = {'Русский': 'ru', 'English': 'en'}
+
+# Файлы, в которых ищутся вызовы t('ключ') для проверки каталогов
+SOURCE_PATTERNS = ('Main_Page.py', os.path.join('pages', '*.py'), os.path.join('code', '*.py'))
+_KEY_CALL = re.compile(r'''\bt\(\s*['"]([A-Za-z0-9_]+)['"]''')
+
+class Template:
+    """Строка перевода; поля {имя} разобраны при загрузке каталога."""
+    __slots__ = ('text', 'parts', 'fields')
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = [(literal, field, spec, conversion) for literal, field, spec, conversion in string.Formatter().parse(text)]
+        self.fields = {field for _, field, _, _ in self.parts if field is not None}
+        if not self.fields:
+            self.parts = None
+
+    def render(self, params):
+        if self.parts is None:
+            return self.text
+        chunks = []
+        for literal, field, spec, conversion in self.parts:
+            chunks.append(literal)
+            if field is None: continue
+            value = params[field]
+            if conversion == 'r': value = repr(value)
+            elif conversion == 'a': value = ascii(value)
+            chunks.append(format(value, spec) if spec else str(value))
+        return ''.join(chunks)
+
+def _read_catalog(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Некорректный файл локали {path}: {e}") from e
+    if not isinstance(data, dict) or not all(isinstance(value, str) for value in data.values()):
+        raise ValueError(f"Файл локали {path} должен быть объектом {{ключ: строка}}")
+    return data
+
+def _used_keys():
+    keys = set()
+    for pattern in SOURCE_PATTERNS:
+        for path in glob.glob(os.path.join(BASE_DIR, pattern)):
+            with open(path, 'r', encoding='utf-8') as f:
+                keys.update(_KEY_CALL.findall(f.read()))
+    return keys
+
+def _compile_catalogs():
+    """Загружает locales/*.json и возвращает {язык: {ключ: Template}}."""
+    raw = {os.path.splitext(os.path.basename(path))[0]: _read_catalog(path) for path in sorted(glob.glob(os.path.join(LOCALES_DIR, '*.json')))}
+    base = raw.get(DEFAULT_LANGUAGE, {})
+    for language, texts in raw.items():
+        if language == DEFAULT_LANGUAGE: continue
+        missing = sorted(set(base) - set(texts))
+        if missing:
+            logger.warning("В локали %s нет ключей (используется %s): %s", language, DEFAULT_LANGUAGE, ", ".join(missing))
+        extra = sorted(set(texts) - set(base))
+        if extra:
+            logger.warning("Ключи локали %s отсутствуют в %s: %s", language, DEFAULT_LANGUAGE, ", ".join(extra))
+    catalogs = {language: {key: Template(text) for key, text in {**base, **texts}.items()} for language, texts in raw.items()}
+    for language, catalog in catalogs.items():
+        if language == DEFAULT_LANGUAGE: continue
+        mismatched = sorted(key for key, template in catalog.items() if key in base and template.fields != catalogs[DEFAULT_LANGUAGE][key].fields)
+        if mismatched:
+            logger.warning("Поля шаблонов локали %s не совпадают с %s: %s", language, DEFAULT_LANGUAGE, ", ".join(mismatched))
+    unknown = sorted(key for key in _used_keys() if not any(key in catalog for catalog in catalogs.values()))
+    if unknown:
+        logger.warning("Ключи без перевода ни в одной локали: %s", ", ".join(unknown))
+    return catalogs
+
+_CATALOGS = _compile_catalogs()
+_EMPTY = {}
+
+def load_locale(language_code=DEFAULT_LANGUAGE):
+    """Возвращает {ключ: строка} для указанного языка (пустой словарь для неизвестного языка)."""
+    return {key: template.text for key, template in _CATALOGS.get(language_code, _EMPTY).items()}
 
 # --- Основная функция-переводчик ---
-def t(key):
+def t(key, **params):
     """
     Получает переведенную строку по ключу для текущего языка.
-    Язык берется из st.session_state.lang.
+    Язык берется из st.session_state.lang; params подставляются в поля шаблона.
     """
     # Устанавливаем язык по умолчанию, если он еще не задан
     if 'lang' not in st.session_state:
-        st.session_state.lang = 'en'
-    
-    # Загружаем словарь локали
-    locale_dict = load_locale(st.session_state.lang)
-    
+        st.session_state.lang = DEFAULT_LANGUAGE
+
+    template = _CATALOGS.get(st.session_state.lang, _EMPTY).get(key)
     # Возвращаем перевод или сам ключ, если перевод не найден
-    return locale_dict.get(key, key)
+    if template is None:
+        return key
+    return template.render(params) if params else template.text
 
 # --- Виджет для выбора языка ---
 def language_selector():
     """Отображает selectbox для выбора языка и обновляет состояние."""
-    
-    def on_lang_change():
-        """Callback-функция для обновления URL и состояния."""
-        st.rerun()
-
-    languages = {'Русский': 'ru', 'English': 'en'}
     # Находим текущий язык для отображения в selectbox
-    current_lang_name = [name for name, code in languages.items() if code == st.session_state.get('lang', 'en')][0]
-    
+    current_lang_name = [name for name, code in LANGUAGES.items() if code == st.session_state.get('lang', DEFAULT_LANGUAGE)][0]
+
     selected_language = st.sidebar.selectbox(
-        label="Язык / Language", 
-        options=languages.keys(), 
-        index=list(languages.keys()).index(current_lang_name)
+        label="Язык / Language",
+        options=LANGUAGES.keys(),
+        index=list(LANGUAGES.keys()).index(current_lang_name)
     )
-    
+
     # Если выбор изменился, обновляем состояние и перезапускаем
-    if languages[selected_language] != st.session_state.get('lang'):
-        st.session_state.lang = languages[selected_language]
+    if LANGUAGES[selected_language] != st.session_state.get('lang'):
+        st.session_state.lang = LANGUAGES[selected_language]
         st.rerun()
@@ -0,0 +1,176 @@
+import os
+import shutil
+import logging
+import mimetypes
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit, parse_qs
+import streamlit as st
+
+from code.db_helpers import BASE_DIR
+from code.thumbnails import get_thumbnail_path, LIST_THUMB_SIZE, EDIT_THUMB_SIZE, THUMB_EXTENSION
+from code.export import open_export
+
+# --- Ссылки на миниатюры ---
+# Страницы показывают миниатюры по URL того же источника, что и само
+# приложение, поэтому ссылки работают с любого компьютера и по HTTPS.
+# По умолчанию миниатюры лежат в static/thumbs и их отдает сам Streamlit
+# (server.enableStaticServing, см. .streamlit/config.toml) по адресу
+# /app/static/thumbs/...: имя файла — ключ миниатюры, а параметр ?v включает
+# в tornado Cache-Control на год, поэтому повторно картинки не скачиваются.
+#
+# --- HTTP-сервер изображений ---
+# Отдельный сервер нужен за обратным прокси, который переводит путь вроде
+# /images на IMAGE_SERVER_PORT. Он запускается, только если задан
+# IMAGE_SERVER_URL — публичный адрес этого пути: путь того же сайта ("/images")
+# или адрес без схемы ("//img.example.com"), тогда схему берет браузер по
+# странице. Сервер отдает оригиналы из img/ (/files/<Фото>), миниатюры
+# (/thumbs/<Ш>x<В>/<Фото>) с ETag/Last-Modified/Cache-Control и выгрузки
+# результатов поиска (/export/<токен>, см. code.export) — потоково, без
+# Content-Length. Вход он не проверяет, поэтому слушает только 127.0.0.1
+# (IMAGE_SERVER_HOST=0.0.0.0 — открыть наружу).
+
+IMG_DIR = os.path.join(BASE_DIR, 'img')
+IMAGE_SERVER_HOST = os.environ.get('IMAGE_SERVER_HOST', '127.0.0.1')
+IMAGE_SERVER_PORT = int(os.environ.get('IMAGE_SERVER_PORT', '8502'))
+# Публичный адрес сервера за прокси; пусто — миниатюры отдает Streamlit
+IMAGE_SERVER_URL = os.environ.get('IMAGE_SERVER_URL', '').rstrip('/')
+STATIC_THUMBS_PATH = 'app/static/thumbs'
+
+ALLOWED_THUMB_SIZES = {f'{w}x{h}': (w, h) for w, h in (LIST_THUMB_SIZE, EDIT_THUMB_SIZE)}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+logger = logging.getLogger(__name__)
+
+def _resolve_photo(path):
+    """Возвращает абсолютный путь к фото внутри img/ или None, если путь выходит за его пределы."""
+    full_path = os.path.realpath(os.path.join(BASE_DIR, path))
+    if not full_path.startswith(IMG_DIR + os.sep) or not os.path.isfile(full_path):
+        return None
+    return full_path
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _serve(self, send_body):
+        url = urlsplit(self.path)
+        route, _, rest = url.path.lstrip('/').partition('/')
+        rest = unquote(rest)
+        versioned = 'v' in parse_qs(url.query)
+
+        if route == 'files':
+            file_path = _resolve_photo(rest)
+            if not file_path: return self.send_error(404)
+            stat = os.stat(file_path)
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        elif route == 'thumbs':
+            size_name, _, photo = rest.partition('/')
+            if size_name not in ALLOWED_THUMB_SIZES or not _resolve_photo(photo): return self.send_error(404)
+            file_path = get_thumbnail_path(photo, ALLOWED_THUMB_SIZES[size_name])
+            if not file_path: return self.send_error(404)
+            stat = os.stat(file_path)
+            # Имя миниатюры — это хэш пути, mtime и размеров исходника
+            etag = f'"{os.path.splitext(os.path.basename(file_path))[0]}"'
+        elif route == 'export':
+            return self._serve_export(rest, send_body)
+        else:
+            return self.send_error(404)
+
+        headers = {
+            'ETag': etag,
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+            'Cache-Control': IMMUTABLE_CACHE_CONTROL if versioned else REVALIDATE_CACHE_CONTROL,
+        }
+        if self._not_modified(etag, stat.st_mtime):
+            self.send_response(304)
+            for name, value in headers.items(): self.send_header(name, value)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', mimetypes.guess_type(file_path)[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(stat.st_size))
+        for name, value in headers.items(): self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            with open(file_path, 'rb') as f:
+                shutil.copyfileobj(f, self.wfile)
+
+    def _serve_export(self, export_id, send_body):
+        export = open_export(export_id)
+        if not export: return self.send_error(404)
+        filename, content_type, chunks = export
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(filename)}")
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        if not send_body:
+            chunks.close()
+            return
+        try:
+            for chunk in chunks:
+                if chunk:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент прервал скачивание
+            self.close_connection = True
+        finally:
+            chunks.close()
+
+    def _not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+def create_image_server(host=IMAGE_SERVER_HOST, port=IMAGE_SERVER_PORT):
+    server = ThreadingHTTPServer((host, port), ImageRequestHandler)
+    server.daemon_threads = True
+    return server
+
+@st.cache_resource
+def start_image_server():
+    """Запускает сервер изображений в фоновом потоке один раз на процесс, если задан IMAGE_SERVER_URL."""
+    if not IMAGE_SERVER_URL:
+        return None
+    try:
+        server = create_image_server()
+    except OSError as e:
+        # Порт уже занят — скорее всего, сервер запущен другим процессом приложения
+        logger.warning("Сервер изображений не запущен: %s", e)
+        return None
+    threading.Thread(target=server.serve_forever, name='image-server', daemon=True).start()
+    return server
+
+def _static_base():
+    """Путь к статическим файлам Streamlit от корня сайта (с учетом server.baseUrlPath)."""
+    base = (st.get_option('server.baseUrlPath') or '').strip('/')
+    return f"/{base + '/' if base else ''}{STATIC_THUMBS_PATH}"
+
+def thumbnail_url(path, key, size=LIST_THUMB_SIZE):
+    """URL готовой миниатюры по ключу (см. prefetch_thumbnails); None — если ключа нет."""
+    if not key: return None
+    if IMAGE_SERVER_URL:
+        return f'{IMAGE_SERVER_URL}/thumbs/{size[0]}x{size[1]}/{quote(path)}?v={key}'
+    # Ключ уже входит в имя файла; ?v нужен только для долгого Cache-Control
+    return f'{_static_base()}/{key[:2]}/{key}.{THUMB_EXTENSION}?v=1'
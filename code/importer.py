@@ -0,0 +1,223 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from code import db_helpers, photo_index
+from code.db_helpers import (
+    BASE_DIR, IMPORT_MANIFEST_TABLE, RECORD_TAGS_TABLE, RECORD_COLUMNS,
+    get_db_connection, get_write_connection, get_schema_catalog, is_service_table, attach_record_table, init_db, ensure_import_manifest, bump_data_generation, release_photos, update_photo_files,
+)
+
+# --- Импорт записей из дерева img/ ---
+# Каждый каталог верхнего уровня (boot, cache, cacherender, ...) становится
+# таблицей записей, каждый файл изображения — записью с "Путь" относительно
+# корня и "Фото" относительно BASE_DIR. Манифест import_manifest хранит размер
+# и mtime каждого импортированного файла, поэтому повторный запуск трогает
+# только новые, измененные и удаленные файлы. Каталоги, имя которых совпадает
+# со служебной таблицей (users, tags, app_meta, ...), не импортируются.
+
+IMG_DIR = os.path.join(BASE_DIR, 'img')
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp'}
+SUBFILE_PATTERN = re.compile(r'^(\d+)_unpacked$')
+BATCH_SIZE = 5000
+
+logger = logging.getLogger(__name__)
+
+def _scan_tree(directory, root):
+    """Рекурсивно обходит каталог через os.scandir. Возвращает {путь относительно root: (размер, mtime_ns)}."""
+    files = {}
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                stat = entry.stat(follow_symlinks=False)
+                files[os.path.relpath(entry.path, root).replace(os.sep, '/')] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def scan_files(root, workers=None):
+    """Параллельно сканирует дерево: отдельная задача на каждый подкаталог второго уровня."""
+    tasks = []
+    files = {}
+    for top in os.scandir(root):
+        # Скрытые каталоги (например, хранилище фото .store) таблицами не являются
+        if not top.is_dir(follow_symlinks=False) or top.name.startswith('.'): continue
+        for entry in os.scandir(top.path):
+            if entry.is_dir(follow_symlinks=False):
+                tasks.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                stat = entry.stat(follow_symlinks=False)
+                files[os.path.relpath(entry.path, root).replace(os.sep, '/')] = (stat.st_size, stat.st_mtime_ns)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(lambda directory: _scan_tree(directory, root), tasks):
+            files.update(result)
+    return files
+
+def _photo_path(root, rel_path):
+    """Путь к фото относительно BASE_DIR или None, если корень импорта лежит вне проекта."""
+    full_path = os.path.join(root, rel_path)
+    if os.path.commonpath([os.path.abspath(full_path), BASE_DIR]) != BASE_DIR:
+        return None
+    return os.path.relpath(full_path, BASE_DIR).replace(os.sep, '/')
+
+def _record_for(root, rel_path):
+    name = os.path.splitext(os.path.basename(rel_path))[0]
+    match = SUBFILE_PATTERN.match(name)
+    return rel_path, match.group(1) if match else None, None, _photo_path(root, rel_path), None
+
+def _ensure_record_table(conn, table):
+    if table not in get_schema_catalog(conn).tables:
+        columns = ", ".join(f'"{column}" TEXT' for column in RECORD_COLUMNS)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns})')
+    # Триггеры ставятся до вставки строк; для уже подключенной таблицы ничего не делает
+    attach_record_table(conn, table)
+
+def _adoptable_records(conn, table):
+    """Существующие записи таблицы, созданные не импортом: {Фото: rowid}. Позволяют не дублировать их."""
+    if not get_schema_catalog(conn).has_column(table, 'Фото'): return {}
+    return {row[0]: row[1] for row in conn.execute(f'''
+        SELECT "Фото", rowid FROM "{table}"
+        WHERE "Фото" IS NOT NULL AND "Фото" != '' AND rowid NOT IN (SELECT record_rowid FROM {IMPORT_MANIFEST_TABLE} WHERE source_table = ?)
+    ''', (table,))}
+
+def is_reserved_table(name):
+    """True, если каталог с таким именем нельзя импортировать как таблицу записей (имена в SQLite без учета регистра)."""
+    name = name.lower()
+    return is_service_table(name) or name.startswith('sqlite_')
+
+def _read_manifest():
+    """Манифест через читающее соединение, без записи в базу; {} — если базы или манифеста еще нет."""
+    if not os.path.exists(db_helpers.DB_FILE): return {}
+    with get_db_connection() as conn:
+        try:
+            return _load_manifest(conn)
+        except sqlite3.OperationalError:
+            return {}
+
+def _load_manifest(conn):
+    return {row[0]: (row[1], row[2], row[3], row[4]) for row in conn.execute(f'SELECT path, source_table, record_rowid, size, mtime_ns FROM {IMPORT_MANIFEST_TABLE}')}
+
+def _plan(files, manifest):
+    """Сравнивает обход с манифестом: (новые файлы по таблицам, измененные, удаленные по таблицам)."""
+    new_files = {}
+    changed = []
+    for rel_path, (size, mtime_ns) in files.items():
+        known = manifest.get(rel_path)
+        if known is None:
+            new_files.setdefault(rel_path.split('/', 1)[0], []).append(rel_path)
+        elif known[2:] != (size, mtime_ns):
+            changed.append((size, mtime_ns, rel_path))
+    removed = {}
+    for rel_path, (table, rowid, _, _) in manifest.items():
+        if rel_path not in files:
+            removed.setdefault(table, []).append((rel_path, rowid))
+    return new_files, changed, removed
+
+def _chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def import_tree(root=IMG_DIR, workers=None, dry_run=False):
+    """Синхронизирует таблицы записей с деревом файлов. Возвращает статистику изменений."""
+    started = time.perf_counter()
+    root = os.path.abspath(root)
+    files = scan_files(root, workers)
+    reserved = sorted({rel_path.split('/', 1)[0] for rel_path in files if is_reserved_table(rel_path.split('/', 1)[0])})
+    if reserved:
+        logger.warning("Каталоги с именами служебных таблиц не импортируются: %s", ", ".join(reserved))
+        files = {rel_path: info for rel_path, info in files.items() if rel_path.split('/', 1)[0] not in reserved}
+    stats = {'scanned': len(files), 'added': 0, 'adopted': 0, 'changed': 0, 'removed': 0}
+    if reserved:
+        stats['skipped_dirs'] = reserved
+
+    if dry_run:
+        new_files, changed, removed = _plan(files, _read_manifest())
+        stats['added'] = sum(len(items) for items in new_files.values())
+        stats['changed'] = len(changed)
+        stats['removed'] = sum(len(items) for items in removed.values())
+        stats['elapsed_s'] = round(time.perf_counter() - started, 3)
+        return stats
+
+    init_db()
+    with get_write_connection() as conn:
+        ensure_import_manifest(conn)
+        new_files, changed, removed = _plan(files, _load_manifest(conn))
+        stats['changed'] = len(changed)
+        stats['removed'] = sum(len(items) for items in removed.values())
+
+        for table, items in removed.items():
+            catalog = get_schema_catalog(conn)
+            for chunk in _chunks(items):
+                rowids = json.dumps([rowid for _, rowid in chunk])
+                if table in catalog.tables:
+                    conn.execute(f'DELETE FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?))', (rowids,))
+                conn.execute(f'DELETE FROM {RECORD_TAGS_TABLE} WHERE source_table = ? AND record_rowid IN (SELECT value FROM json_each(?))', (table, rowids))
+                conn.executemany(f'DELETE FROM {IMPORT_MANIFEST_TABLE} WHERE path = ?', [(rel_path,) for rel_path, _ in chunk])
+
+        conn.executemany(f'UPDATE {IMPORT_MANIFEST_TABLE} SET size = ?, mtime_ns = ? WHERE path = ?', changed)
+
+        for table, paths in new_files.items():
+            _ensure_record_table(conn, table)
+            adoptable = _adoptable_records(conn, table)
+            next_rowid = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) + 1 FROM "{table}"').fetchone()[0]
+            column_list = ", ".join(f'"{column}"' for column in RECORD_COLUMNS)
+            for chunk in _chunks(sorted(paths)):
+                records, manifest_rows = [], []
+                for rel_path in chunk:
+                    size, mtime_ns = files[rel_path]
+                    record = _record_for(root, rel_path)
+                    rowid = adoptable.pop(record[3], None) if record[3] else None
+                    if rowid is None:
+                        rowid = next_rowid; next_rowid += 1
+                        records.append((rowid,) + record)
+                    else:
+                        stats['adopted'] += 1
+                    manifest_rows.append((rel_path, table, rowid, size, mtime_ns))
+                conn.executemany(f'INSERT INTO "{table}" (rowid, {column_list}) VALUES (?, {", ".join("?" * len(RECORD_COLUMNS))})', records)
+                conn.executemany(f'INSERT INTO {IMPORT_MANIFEST_TABLE} (path, source_table, record_rowid, size, mtime_ns) VALUES (?, ?, ?, ?, ?)', manifest_rows)
+                stats['added'] += len(records)
+
+        if stats['removed']:
+            release_photos(conn.cursor())
+        # Обход уже дал размеры и mtime файлов — заодно обновляем индекс фото
+        touched = [rel_path for paths in new_files.values() for rel_path in paths] + [rel_path for _, _, rel_path in changed]
+        gone = [rel_path for items in removed.values() for rel_path, _ in items]
+        update_photo_files(
+            conn.cursor(),
+            [(photo, *files[rel_path]) for rel_path in touched if (photo := _photo_path(root, rel_path))],
+            [photo for rel_path in gone if (photo := _photo_path(root, rel_path))],
+        )
+        if stats['added'] or stats['adopted'] or stats['removed'] or stats['changed']:
+            bump_data_generation(conn)
+
+    stats['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импортирует/синхронизирует таблицы записей с деревом изображений.")
+    parser.add_argument('--root', default=IMG_DIR, help="Корень дерева изображений (по умолчанию img/).")
+    parser.add_argument('--workers', type=int, default=None, help="Количество потоков обхода.")
+    parser.add_argument('--dry-run', action='store_true', help="Только посчитать изменения, ничего не записывая.")
+    parser.add_argument('--no-photo-scan', action='store_true', help="Не сверять img/ с базой после импорта (то же, что APP_PHOTO_SCAN=0).")
+    args = parser.parse_args(argv)
+    stats = import_tree(args.root, args.workers, args.dry_run)
+    if not args.dry_run and not args.no_photo_scan and photo_index.SCAN_ENABLED:
+        report = photo_index.run_scan()
+        stats['photo_orphans'], stats['photo_dangling'] = len(report['orphans']), len(report['dangling'])
+    print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
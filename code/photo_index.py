@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from code import db_helpers
+from code.db_helpers import (
+    BASE_DIR, APP_META_TABLE, PHOTO_FILES_TABLE, IMPORT_MANIFEST_TABLE, get_db_connection, get_write_connection, get_schema_catalog,
+    init_db, update_photo_files, index_photo_files,
+)
+
+# --- Сверка img/ с базой ---
+# Сканер обходит img/ через os.scandir в пуле потоков: каждый каталог —
+# отдельная задача, найденные подкаталоги сразу ставятся в очередь, поэтому
+# глубокие и широкие ветки обходятся параллельно. Результат сверяется с
+# индексом photo_files (см. db_helpers), после чего считаются:
+#   - сироты — файлы img/, на которые не ссылается ни одна запись;
+#   - висячие ссылки — записи, чье "Фото" указывает на несуществующий файл.
+# Страницы сверку сами не запускают: ее выполняет импортер после импорта
+# (python -m code.importer), кнопка на странице диагностики или запуск вручную:
+# python -m code.photo_index [--workers 8] [--list] [--db app.db]
+# APP_PHOTO_SCAN=0 отключает сверку после импорта (бенчмарки, тестовые базы).
+
+IMG_DIR = os.path.join(BASE_DIR, 'img')
+# Незавершенные загрузки хранилища фото (code.photo_store)
+SKIP_DIRS = {os.path.join(IMG_DIR, '.store', 'tmp')}
+SCAN_WORKERS = int(os.environ.get('APP_SCAN_WORKERS', 8))
+# Сверка после импорта (code.importer)
+SCAN_ENABLED = os.environ.get('APP_PHOTO_SCAN', '1') != '0'
+
+logger = logging.getLogger(__name__)
+
+def _scan_dir(directory):
+    files, subdirs = [], []
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return files, subdirs
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if entry.path not in SKIP_DIRS: subdirs.append(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            stat = entry.stat(follow_symlinks=False)
+            files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return files, subdirs
+
+def scan_img_tree(root=IMG_DIR, workers=SCAN_WORKERS):
+    """Параллельно обходит дерево. Возвращает {путь в формате "Фото": (размер, mtime_ns)}."""
+    files = {}
+    prefix_length = len(BASE_DIR) + 1
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photo-scan') as pool:
+        pending = {pool.submit(_scan_dir, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirs = future.result()
+                for path, size, mtime_ns in found:
+                    files[path[prefix_length:].replace(os.sep, '/')] = (size, mtime_ns)
+                pending.update(pool.submit(_scan_dir, subdir) for subdir in subdirs)
+    return files
+
+def reconcile(files):
+    """Приводит photo_files к результату сканирования. Возвращает (добавлено или изменено, удалено)."""
+    with get_write_connection() as conn:
+        c = conn.cursor()
+        known = {row[0]: (row[1], row[2]) for row in c.execute(f'SELECT path, size, mtime_ns FROM {PHOTO_FILES_TABLE}')}
+        changed = [(path, *info) for path, info in files.items() if known.get(path) != info]
+        missing = [path for path in known if path not in files]
+        update_photo_files(c, changed)
+        # Файл мог появиться уже после обхода своего каталога — такие пути проверяются заново
+        index_photo_files(c, missing)
+        c.execute(f"INSERT INTO {APP_META_TABLE} (key, value) VALUES ('photo_scan_at', ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (time.time(),))
+    return len(changed), len(missing)
+
+def _photo_tables(conn):
+    catalog = get_schema_catalog(conn)
+    return [table for table in catalog.tables if catalog.has_column(table, 'Фото')]
+
+def find_orphans(conn=None):
+    """Файлы img/ из индекса, на которые не ссылается ни одна запись и которых нет в дереве импорта."""
+    conn = conn or get_db_connection()
+    referenced = [f'SELECT "Фото" FROM "{table}" WHERE "Фото" IS NOT NULL' for table in _photo_tables(conn)]
+    # После code.photo_store и code.photo_optimizer записи ссылаются на хранилище, а файлы дерева остаются для импорта
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (IMPORT_MANIFEST_TABLE,)).fetchone():
+        referenced.append(f"SELECT 'img/' || path FROM {IMPORT_MANIFEST_TABLE}")
+    if not referenced:
+        return [row[0] for row in conn.execute(f'SELECT path FROM {PHOTO_FILES_TABLE} ORDER BY path')]
+    referenced = " UNION ".join(referenced)
+    return [row[0] for row in conn.execute(f'SELECT path FROM {PHOTO_FILES_TABLE} WHERE path NOT IN ({referenced}) ORDER BY path')]
+
+def find_dangling(conn=None):
+    """Записи, чье "Фото" не найдено в индексе: [(таблица, rowid, фото)]."""
+    conn = conn or get_db_connection()
+    dangling = []
+    for table in _photo_tables(conn):
+        dangling += [(table, row[0], row[1]) for row in conn.execute(f'''
+            SELECT rowid, "Фото" FROM "{table}"
+            WHERE COALESCE("Фото", '') <> '' AND "Фото" NOT IN (SELECT path FROM {PHOTO_FILES_TABLE})
+        ''')]
+    return dangling
+
+def run_scan(workers=SCAN_WORKERS):
+    """Сканирует img/, обновляет индекс и возвращает отчет со списками сирот и висячих ссылок."""
+    started = time.perf_counter()
+    init_db()
+    files = scan_img_tree(workers=workers)
+    scanned_s = time.perf_counter() - started
+    changed, removed = reconcile(files)
+    conn = get_db_connection()
+    orphans, dangling = find_orphans(conn), find_dangling(conn)
+    return {
+        'files': len(files), 'changed': changed, 'removed': removed,
+        'orphans': orphans, 'dangling': dangling,
+        'scan_s': round(scanned_s, 3), 'elapsed_s': round(time.perf_counter() - started, 3),
+    }
+
+def last_scan_time():
+    """Время последней сверки (unix time) или None."""
+    row = get_db_connection().execute(f"SELECT value FROM {APP_META_TABLE} WHERE key = 'photo_scan_at'").fetchone()
+    return row[0] if row else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сверяет колонку \"Фото\" с деревом img/ и обновляет индекс файлов.")
+    parser.add_argument('--workers', type=int, default=SCAN_WORKERS, help="Количество потоков обхода.")
+    parser.add_argument('--list', action='store_true', help="Вывести пути сирот и висячих ссылок, а не только их количество.")
+    parser.add_argument('--db', default=None, help="Файл базы (по умолчанию APP_DB_FILE или app.db).")
+    args = parser.parse_args(argv)
+    # Вне `streamlit run` кэши Streamlit пишут предупреждение на каждый вызов
+    from streamlit import logger as streamlit_logger
+    streamlit_logger.set_log_level('error')
+    if args.db:
+        db_helpers.DB_FILE = os.path.abspath(args.db)
+    report = run_scan(args.workers)
+    if not args.list:
+        report['orphans'], report['dangling'] = len(report['orphans']), len(report['dangling'])
+    print(json.dumps(report, ensure_ascii=False, indent=2 if args.list else None))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
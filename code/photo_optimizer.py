@@ -0,0 +1,292 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from code.db_helpers import (
+    BASE_DIR, IMPORT_MANIFEST_TABLE, PHOTO_STORE_TABLE, PHOTO_RECOMPRESS_TABLE, get_db_connection, get_write_connection,
+    get_schema_catalog, init_db, release_photos, index_photo_files, unreferenced_photo_files, bump_data_generation,
+)
+from code.photo_store import TMP_DIR, store_path, place_photo
+
+# --- Сжатие фото без потерь ---
+# Фото записей в PNG (и BMP) перекодируются в пуле процессов в WebP без потерь
+# и/или PNG с максимальным сжатием; результат принимается, только если он
+# заметно меньше и после декодирования попиксельно совпадает с оригиналом.
+# Новые файлы кладутся в хранилище по содержимому (code.photo_store), ссылки
+# "Фото" переводятся на них транзакциями по APPLY_BATCH фото. Файлы дерева
+# импорта (import_manifest) заменяются жесткими ссылками на новый объект с
+# новым расширением, поэтому импорт не считает записи удаленными.
+# Манифест photo_recompress хранит размеры и sha256 до и после и пишется после
+# каждой партии: повторный запуск пропускает уже обработанные файлы и продолжает
+# с места остановки, а временные файлы прерванного запуска удаляются при старте.
+# Запуск: python -m code.photo_optimizer [--format auto|webp|png] [--workers 4] [--dry-run]
+
+SOURCE_EXTENSIONS = {'.png', '.bmp'}
+FORMAT_TIERS = {'auto': ('webp', 'png'), 'webp': ('webp',), 'png': ('png',)}
+EXTENSIONS = {'webp': '.webp', 'png': '.png'}
+# Меньшая экономия не стоит перезаписи ссылок и файлов
+MIN_SAVING = 0.05
+# Параметры WebP: на скриншотах method=6 и quality=100 дают тот же размер в десятки раз медленнее
+WEBP_METHOD = 4
+WEBP_EFFORT = 80
+# Режимы, для которых сравнение в RGBA не теряет информацию
+RGBA_MODES = {'1', 'L', 'LA', 'P', 'PA', 'RGB', 'RGBA'}
+SRGB_GAMMA = 1 / 2.2
+# Фото на транзакцию: ограничивает и потерю работы при прерывании, и объем временных файлов
+APPLY_BATCH = 500
+TMP_PREFIX = 'recompress-'
+# Чужие временные файлы хранилища (загрузки) старше этого срока считаются брошенными
+STALE_TMP_AGE_S = 24 * 3600
+
+def _ensure_manifest(conn):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {PHOTO_RECOMPRESS_TABLE} (
+            path TEXT PRIMARY KEY, source_digest TEXT, source_size INTEGER NOT NULL, status TEXT NOT NULL,
+            format TEXT, target TEXT, target_digest TEXT, target_size INTEGER, processed_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+def _clear_stale_tmp():
+    """Удаляет временные файлы прерванных запусков. Возвращает их количество."""
+    removed = 0
+    try:
+        entries = list(os.scandir(TMP_DIR))
+    except OSError:
+        return 0
+    now = time.time()
+    for entry in entries:
+        try:
+            if entry.name.startswith(TMP_PREFIX) or now - entry.stat().st_mtime > STALE_TMP_AGE_S:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+def _pixels(img):
+    if img.mode in RGBA_MODES:
+        return img.convert('RGBA').tobytes()
+    return img.mode, img.tobytes()
+
+def _neutral_color(info):
+    """True, если браузер покажет изображение как sRGB и без цветовых чанков PNG (gAMA, cHRM)."""
+    if 'srgb' in info: return True
+    if 'chromaticity' in info: return False
+    return 'gamma' not in info or abs(info['gamma'] - SRGB_GAMMA) < 0.001
+
+def _encode(img, fmt):
+    buffer = io.BytesIO()
+    extra = {'icc_profile': img.info['icc_profile']} if img.info.get('icc_profile') else {}
+    if fmt == 'webp':
+        # exact=True сохраняет цвет полностью прозрачных пикселей — иначе сверка не пройдет
+        img.save(buffer, 'WEBP', lossless=True, quality=WEBP_EFFORT, method=WEBP_METHOD, exact=True, **extra)
+    else:
+        img.save(buffer, 'PNG', optimize=True, **extra)
+    return buffer.getvalue()
+
+def _recompress(item):
+    """Подбирает самый компактный формат без потерь. Выполняется в процессе пула."""
+    path, target_format, dry_run = item
+    result = {'path': path, 'status': 'kept', 'source_digest': None, 'source_size': 0}
+    try:
+        with open(os.path.join(BASE_DIR, path), 'rb') as f:
+            data = f.read()
+        result.update(source_digest=hashlib.sha256(data).hexdigest(), source_size=len(data))
+        best = None
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            if getattr(img, 'n_frames', 1) > 1 or not _neutral_color(img.info):
+                return result
+            original = _pixels(img)
+            for fmt in FORMAT_TIERS[target_format]:
+                encoded = _encode(img, fmt)
+                if len(encoded) > len(data) * (1 - MIN_SAVING) or (best and len(encoded) >= len(best[1])): continue
+                with Image.open(io.BytesIO(encoded)) as check:
+                    if _pixels(check) != original: continue
+                best = fmt, encoded
+    except Exception:
+        result['status'] = 'failed'
+        return result
+    if best:
+        fmt, encoded = best
+        result.update(status='converted', format=fmt, target_digest=hashlib.sha256(encoded).hexdigest(), target_size=len(encoded), tmp=None)
+        if not dry_run:
+            os.makedirs(TMP_DIR, exist_ok=True)
+            result['tmp'] = os.path.join(TMP_DIR, TMP_PREFIX + uuid.uuid4().hex)
+            with open(result['tmp'], 'wb') as f:
+                f.write(encoded)
+    return result
+
+def _tree_files(c, table, rows, targets, store_paths):
+    """{фото дерева импорта: новый объект} для файлов, которые были тем же файлом, что и исходное фото записи."""
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (IMPORT_MANIFEST_TABLE,)).fetchone():
+        return {}
+    source_by_rowid = {rowid: source for source in targets for rowid in rows[source]}
+    tree = {}
+    for rel_path, rowid in c.execute(f'SELECT path, record_rowid FROM {IMPORT_MANIFEST_TABLE} WHERE source_table = ?', (table,)):
+        source = source_by_rowid.get(rowid)
+        if source is None: continue
+        photo = f'img/{rel_path}'
+        if photo == source:
+            tree[photo] = targets[source]
+        elif source in store_paths:
+            # После code.photo_store файл дерева — жесткая ссылка на объект хранилища
+            try:
+                if os.path.samefile(os.path.join(BASE_DIR, photo), os.path.join(BASE_DIR, source)):
+                    tree[photo] = targets[source]
+            except OSError:
+                pass
+    return tree
+
+def _relink(c, photo, target, created):
+    """Заменяет файл дерева импорта жесткой ссылкой на target с расширением target. Возвращает новое фото или None."""
+    new_photo = os.path.splitext(photo)[0] + os.path.splitext(target)[1]
+    new_full_path = os.path.join(BASE_DIR, new_photo)
+    if new_photo != photo and os.path.lexists(new_full_path):
+        return None
+    tmp_path = f'{new_full_path}.{uuid.uuid4().hex}.tmp'
+    try:
+        os.link(os.path.join(BASE_DIR, target), tmp_path)
+    except OSError:
+        return None
+    os.replace(tmp_path, new_full_path)
+    if new_photo != photo:
+        created.append(new_full_path)
+    stat = os.stat(new_full_path)
+    c.execute(f'UPDATE {IMPORT_MANIFEST_TABLE} SET path = ?, size = ?, mtime_ns = ? WHERE path = ?', (new_photo[len('img/'):], stat.st_size, stat.st_mtime_ns, photo[len('img/'):]))
+    return new_photo
+
+def _apply(table, rows, results, reused):
+    """Одной транзакцией переводит записи таблицы на новые файлы (одна партия). Возвращает число обновленных записей."""
+    created, obsolete = [], []
+    try:
+        with get_write_connection() as conn:
+            c = conn.cursor()
+            now = time.time()
+            targets = dict(reused)
+            manifest = []
+            for r in results:
+                target = None
+                if r['status'] == 'converted':
+                    target = targets[r['path']] = place_photo(c, r['tmp'], r['target_digest'], r['target_size'], EXTENSIONS[r['format']])
+                    manifest.append((target, r['target_digest'], r['target_size'], 'output', r['format'], None, None, None, now))
+                manifest.append((r['path'], r['source_digest'], r['source_size'], r['status'], r.get('format'), target, r.get('target_digest'), r.get('target_size'), now))
+            c.executemany(f'INSERT OR REPLACE INTO {PHOTO_RECOMPRESS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', manifest)
+            if not targets:
+                return 0
+            store_paths = {row[0] for row in c.execute(f'SELECT path FROM {PHOTO_STORE_TABLE} WHERE path IN (SELECT value FROM json_each(?))', (json.dumps(list(targets)),))}
+            # Сверка жестких ссылок — до того, как старые объекты хранилища будут удалены
+            tree = _tree_files(c, table, rows, targets, store_paths)
+            c.executemany(f'UPDATE "{table}" SET "Фото" = ? WHERE rowid = ? AND "Фото" = ?', [(target, rowid, source) for source, target in targets.items() for rowid in rows[source]])
+            updated = c.rowcount
+            leftovers = {source: target for source, target in targets.items() if source not in store_paths}
+            leftovers.update(tree)
+            touched = []
+            for photo in unreferenced_photo_files(c, leftovers):
+                if photo not in tree:
+                    obsolete.append(photo)
+                    continue
+                # Файл дерева импорта не удаляется: иначе следующий импорт удалит и запись
+                new_photo = _relink(c, photo, leftovers[photo], created)
+                if new_photo:
+                    touched += [photo, new_photo]
+                    if new_photo != photo: obsolete.append(photo)
+            release_photos(c, store_paths)
+            index_photo_files(c, touched)
+            bump_data_generation(conn)
+    except BaseException:
+        for path in created:
+            if os.path.exists(path): os.remove(path)
+        raise
+    finally:
+        for r in results:
+            if r.get('tmp') and os.path.exists(r['tmp']): os.remove(r['tmp'])
+    # Старые файлы вне хранилища удаляются после коммита, чтобы откат транзакции не оставил записи без фото
+    for photo in obsolete:
+        full_path = os.path.join(BASE_DIR, photo)
+        if os.path.exists(full_path): os.remove(full_path)
+    if obsolete:
+        with get_write_connection() as conn:
+            index_photo_files(conn.cursor(), obsolete)
+    return updated
+
+def optimize_photos(target_format='auto', workers=None, dry_run=False):
+    """Сжимает фото записей без потерь, таблица за таблицей, партиями по APPLY_BATCH. Возвращает статистику."""
+    started = time.perf_counter()
+    init_db()
+    if not dry_run:
+        with get_write_connection() as conn:
+            _ensure_manifest(conn)
+        _clear_stale_tmp()
+    conn = get_db_connection()
+    catalog = get_schema_catalog(conn)
+    known = {}
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (PHOTO_RECOMPRESS_TABLE,)).fetchone():
+        known = {row[0]: row[1:] for row in conn.execute(f'SELECT path, source_size, status, target FROM {PHOTO_RECOMPRESS_TABLE}')}
+    stats = {'photos': 0, 'converted': 0, 'reused': 0, 'kept': 0, 'failed': 0, 'skipped': 0, 'records': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for table in catalog.tables:
+            if not catalog.has_column(table, 'Фото'): continue
+            rows = {}
+            for rowid, path in conn.execute(f'SELECT rowid, "Фото" FROM "{table}" WHERE "Фото" IS NOT NULL AND "Фото" != \'\''):
+                if os.path.splitext(path)[1].lower() in SOURCE_EXTENSIONS:
+                    rows.setdefault(path, []).append(rowid)
+            pending, reused = [], {}
+            for path in rows:
+                try:
+                    size = os.path.getsize(os.path.join(BASE_DIR, path))
+                except OSError:
+                    continue
+                source_size, status, target = known.get(path, (None, None, None))
+                if status == 'converted' and target and (dry_run or os.path.exists(os.path.join(BASE_DIR, target))):
+                    # Файл уже сжат, но на него еще ссылаются записи этой таблицы
+                    reused[path] = target
+                elif status in ('kept', 'failed', 'output') and source_size == size:
+                    stats['skipped'] += 1
+                else:
+                    pending.append((path, target_format, dry_run))
+            stats['photos'] += len(pending) + len(reused)
+            stats['reused'] += len(reused)
+            if not dry_run and reused:
+                stats['records'] += _apply(table, rows, [], reused)
+            for start in range(0, len(pending), APPLY_BATCH):
+                results = []
+                try:
+                    results = list(pool.map(_recompress, pending[start:start + APPLY_BATCH], chunksize=16))
+                    for r in results:
+                        stats[r['status']] += 1
+                        if r['status'] == 'converted':
+                            stats['bytes_before'] += r['source_size']
+                            stats['bytes_after'] += r['target_size']
+                    if not dry_run and results:
+                        stats['records'] += _apply(table, rows, results, {})
+                finally:
+                    # _apply удаляет их сам; здесь — если до него не дошло
+                    for r in results:
+                        if r.get('tmp') and os.path.exists(r['tmp']): os.remove(r['tmp'])
+                for r in results:
+                    target = store_path(r['target_digest'], EXTENSIONS[r['format']]) if r['status'] == 'converted' else None
+                    known[r['path']] = (r['source_size'], r['status'], target)
+    stats['bytes_saved'] = stats['bytes_before'] - stats['bytes_after']
+    stats['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сжимает фото записей без потерь (WebP без потерь или оптимизированный PNG).")
+    parser.add_argument('--format', choices=sorted(FORMAT_TIERS), default='auto', help="Целевой формат; auto — меньший из WebP и PNG.")
+    parser.add_argument('--workers', type=int, default=None, help="Количество процессов (по умолчанию — число ядер).")
+    parser.add_argument('--dry-run', action='store_true', help="Только посчитать экономию, ничего не записывая.")
+    args = parser.parse_args(argv)
+    print(json.dumps(optimize_photos(args.format, args.workers, args.dry_run), ensure_ascii=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
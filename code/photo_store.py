@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import uuid
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from code.db_helpers import (
+    BASE_DIR, PHOTO_STORE_TABLE, IMPORT_MANIFEST_TABLE, get_db_connection, get_write_connection, get_schema_catalog,
+    init_db, update_record, register_photo, release_photos, bump_data_generation, ensure_import_manifest,
+)
+
+# --- Хранилище фото по содержимому ---
+# Загруженные фото лежат в img/.store/<2 символа>/<sha256><расширение>: одинаковые
+# файлы хранятся один раз, а файлы с одинаковыми именами из разных записей больше
+# не перезаписывают друг друга. Учет ссылок — в таблице photo_store (см.
+# db_helpers): объект удаляется, когда на него не ссылается ни одна запись.
+
+IMG_DIR = os.path.join(BASE_DIR, 'img')
+STORE_DIR = os.path.join(IMG_DIR, '.store')
+TMP_DIR = os.path.join(STORE_DIR, 'tmp')
+CHUNK_SIZE = 1024 * 1024
+
+def store_path(digest, extension=''):
+    """Путь объекта хранилища относительно BASE_DIR (в формате колонки "Фото")."""
+    return f'img/.store/{digest[:2]}/{digest}{extension.lower()}'
+
+def _spool(fileobj):
+    """Потоково пишет файл во временный файл хранилища, считая sha256. Возвращает (временный путь, дайджест, размер)."""
+    os.makedirs(TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(TMP_DIR, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    with open(tmp_path, 'wb') as f:
+        while chunk := fileobj.read(CHUNK_SIZE):
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return tmp_path, digest.hexdigest(), size
+
+def place_photo(c, source, digest, size, extension, link=False):
+    """Кладет файл в хранилище, если такого содержимого там еще нет, и регистрирует объект.
+
+    Вызывается внутри пишущей транзакции. link=True — объект создается жесткой
+    ссылкой на source (исходный файл остается на месте), иначе source перемещается.
+    """
+    path = store_path(digest, extension)
+    full_path = os.path.join(BASE_DIR, path)
+    if not os.path.exists(full_path):
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if link:
+            try:
+                os.link(source, full_path)
+            except OSError:
+                shutil.copy2(source, full_path)
+        else:
+            os.replace(source, full_path)
+    register_photo(c, path, digest, size)
+    return path
+
+def save_uploaded_photo(table_name, rowid, comment, tags, fileobj, filename):
+    """Сохраняет загруженное фото в хранилище и обновляет запись. Возвращает путь фото."""
+    tmp_path, digest, size = _spool(fileobj)
+    try:
+        # Объект и ссылка на него появляются в одной транзакции, иначе параллельное
+        # удаление последней ссылки на то же содержимое могло бы удалить файл между ними
+        with get_write_connection() as conn:
+            path = place_photo(conn.cursor(), tmp_path, digest, size, os.path.splitext(filename)[1])
+            update_record(table_name, rowid, comment, tags, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+# --- Дедупликация существующего дерева img/ ---
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(os.path.join(BASE_DIR, path), 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _link_to_store(path, store_file):
+    """Заменяет исходный файл жесткой ссылкой на объект хранилища. Возвращает освобожденные байты."""
+    full_path = os.path.join(BASE_DIR, path)
+    stat = os.stat(full_path)
+    if os.path.samefile(full_path, store_file): return 0
+    tmp_path = f'{full_path}.{uuid.uuid4().hex}.tmp'
+    try:
+        os.link(store_file, tmp_path)
+    except OSError:
+        return 0
+    os.replace(tmp_path, full_path)
+    return stat.st_size if stat.st_nlink == 1 else 0
+
+def _referenced_photos(conn):
+    """{путь фото вне хранилища: [(таблица, rowid), ...]} для существующих файлов из img/."""
+    catalog = get_schema_catalog(conn)
+    photos = {}
+    for table in catalog.tables:
+        if not catalog.has_column(table, 'Фото'): continue
+        for rowid, path in conn.execute(f'''
+            SELECT rowid, "Фото" FROM "{table}"
+            WHERE "Фото" LIKE 'img/%' AND "Фото" NOT IN (SELECT path FROM {PHOTO_STORE_TABLE})
+        '''):
+            photos.setdefault(path, []).append((table, rowid))
+    return {path: keys for path, keys in photos.items() if os.path.isfile(os.path.join(BASE_DIR, path))}
+
+def dedupe_photos(workers=None, dry_run=False):
+    """Переносит фото записей из img/ в хранилище, объединяя одинаковые файлы.
+
+    Файлы хэшируются параллельно. Записи переводятся на объекты хранилища, а исходные
+    файлы заменяются жесткими ссылками на них: дубликаты перестают занимать место, но
+    дерево img/ остается целым для импорта. Исходный путь записи из img/<таблица>/
+    сохраняется в манифесте импорта, поэтому импорт узнает такой файл и не создает
+    запись заново. Жесткая ссылка в дереве держит объект на диске и после удаления
+    записи, поэтому delete_records удаляет и ее, если это все еще та же копия.
+    Возвращает статистику.
+    """
+    init_db()
+    photos = _referenced_photos(get_db_connection())
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = dict(zip(photos, pool.map(_hash_file, photos)))
+    stats = {'files': len(photos), 'unique': len(set(digests.values())), 'records': sum(len(keys) for keys in photos.values()), 'bytes_freed': 0}
+    if dry_run or not photos:
+        return stats
+
+    with get_write_connection() as conn:
+        c = conn.cursor()
+        ensure_import_manifest(conn)
+        updates, manifest_rows = {}, []
+        for path, digest in sorted(digests.items()):
+            new_path = place_photo(c, os.path.join(BASE_DIR, path), digest, os.path.getsize(os.path.join(BASE_DIR, path)), os.path.splitext(path)[1], link=True)
+            stats['bytes_freed'] += _link_to_store(path, os.path.join(BASE_DIR, new_path))
+            stat = os.stat(os.path.join(BASE_DIR, path))
+            for table, rowid in photos[path]:
+                updates.setdefault(table, []).append((new_path, rowid))
+                # Импорт кладет img/<таблица>/... в одноименную таблицу — только такие пути он мог бы создать заново
+                if path.split('/')[1] == table:
+                    manifest_rows.append((path[len('img/'):], table, rowid, stat.st_size, stat.st_mtime_ns))
+        for table, params in updates.items():
+            c.executemany(f'UPDATE "{table}" SET "Фото" = ? WHERE rowid = ?', params)
+        c.executemany(f'INSERT OR IGNORE INTO {IMPORT_MANIFEST_TABLE} (path, source_table, record_rowid, size, mtime_ns) VALUES (?, ?, ?, ?, ?)', manifest_rows)
+        release_photos(c)
+        bump_data_generation(conn)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Переносит фото записей в хранилище по содержимому, объединяя дубликаты.")
+    parser.add_argument('--workers', type=int, default=None, help="Количество потоков хэширования.")
+    parser.add_argument('--dry-run', action='store_true', help="Только посчитать файлы и дубликаты.")
+    args = parser.parse_args(argv)
+    print(json.dumps(dedupe_photos(args.workers, args.dry_run), ensure_ascii=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# --- Профилирование запросов и перезапусков страниц ---
+# По умолчанию выключено (APP_PROFILING=1 или переключатель в админке включает).
+# В выключенном состоянии соединения и этапы сводятся к проверке одного флага.
+# Во включенном пишутся события: SQL-запросы (текст, время, число строк) и
+# этапы перезапуска страницы; события группируются по перезапускам и хранятся
+# в кольцевых буферах процесса.
+
+MAX_EVENTS = 5000
+MAX_RUNS = 200
+
+_enabled = os.environ.get('APP_PROFILING', '') not in ('', '0')
+_lock = threading.Lock()
+_local = threading.local()
+_events = deque(maxlen=MAX_EVENTS)
+_runs = deque(maxlen=MAX_RUNS)
+_cache_counters = {}
+
+def is_enabled():
+    return _enabled
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+def clear():
+    """Очищает собранные события, перезапуски и счетчики кэшей."""
+    with _lock:
+        _events.clear()
+        _runs.clear()
+        for counters in _cache_counters.values():
+            counters.update(calls=0, misses=0)
+
+def _record(event):
+    event['ts'] = time.time()
+    event['thread'] = threading.current_thread().name
+    run = getattr(_local, 'run', None)
+    with _lock:
+        _events.append(event)
+        if run is not None:
+            run['events'].append(event)
+            run['elapsed_ms'] = (time.perf_counter() - run['_started']) * 1000
+    return event
+
+# --- Перезапуски и этапы ---
+
+def begin_run(page):
+    """Отмечает начало перезапуска страницы; последующие события потока попадут в него."""
+    if not _enabled:
+        _local.run = None
+        return
+    # Перезапуск в цикле (например, долгий импорт) не должен копить события без предела
+    run = {'page': page, 'started_at': time.time(), 'elapsed_ms': 0.0, 'events': deque(maxlen=MAX_EVENTS), '_started': time.perf_counter()}
+    _local.run = run
+    with _lock:
+        _runs.append(run)
+
+def begin_fragment_run(page):
+    """Начинает отдельный перезапуск, если выполняется только фрагмент страницы (st.fragment)."""
+    ctx = get_script_run_ctx()
+    if ctx is not None and ctx.fragment_ids_this_run:
+        begin_run(page)
+
+@contextmanager
+def stage(name):
+    """Замеряет этап перезапуска (или любой участок кода) под именем name."""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record({'kind': 'stage', 'name': name, 'ms': (time.perf_counter() - started) * 1000})
+
+# --- SQL ---
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Курсор, который записывает время выполнения и число прочитанных строк."""
+    _event = None
+
+    def _track(self, started, rows):
+        event = self._event
+        if event is not None:
+            event['ms'] += (time.perf_counter() - started) * 1000
+            event['rows'] += rows
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = (time.perf_counter() - started) * 1000
+        self._event = _record({'kind': 'query', 'sql': ' '.join(sql.split()), 'ms': elapsed, 'rows': max(self.rowcount, 0)})
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        elapsed = (time.perf_counter() - started) * 1000
+        self._event = _record({'kind': 'query', 'sql': ' '.join(sql.split()), 'ms': elapsed, 'rows': max(self.rowcount, 0), 'many': True})
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._track(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._track(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._track(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._track(started, 0)
+            raise
+        self._track(started, 1)
+        return row
+
+class ProfiledConnection(sqlite3.Connection):
+    """Фабрика соединений пула: при включенном профилировании выдает ProfiledCursor."""
+
+    def cursor(self, factory=None):
+        if factory is None and _enabled:
+            factory = ProfiledCursor
+        return super().cursor(factory) if factory is not None else super().cursor()
+
+    def execute(self, sql, parameters=()):
+        if not _enabled:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not _enabled:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# --- Кэши ---
+
+def count_cache(name, hit):
+    """Учитывает обращение к кэшу name (hit — значение нашлось); при выключенном профилировании ничего не делает."""
+    if not _enabled: return
+    with _lock:
+        counters = _cache_counters.setdefault(name, {'calls': 0, 'misses': 0})
+        counters['calls'] += 1
+        if not hit:
+            counters['misses'] += 1
+
+def get_cache_stats():
+    """Возвращает {имя: {calls, misses, hits, hit_rate}} для отслеживаемых кэшей."""
+    with _lock:
+        snapshot = {name: dict(counters) for name, counters in _cache_counters.items()}
+    for counters in snapshot.values():
+        counters['hits'] = max(counters['calls'] - counters['misses'], 0)
+        counters['hit_rate'] = counters['hits'] / counters['calls'] if counters['calls'] else None
+    return snapshot
+
+# --- Отчеты ---
+
+def get_runs(limit=None):
+    """Последние перезапуски, новые первыми: страница, общее время и время по этапам."""
+    with _lock:
+        runs = list(_runs)[::-1][:limit]
+        result = []
+        for run in runs:
+            stages = {}
+            queries = [event for event in run['events'] if event['kind'] == 'query']
+            for event in run['events']:
+                if event['kind'] == 'stage':
+                    stages[event['name']] = stages.get(event['name'], 0.0) + event['ms']
+            result.append({
+                'page': run['page'], 'started_at': run['started_at'], 'elapsed_ms': run['elapsed_ms'], 'stages': stages,
+                'queries': len(queries), 'query_ms': sum(event['ms'] for event in queries),
+            })
+    return result
+
+def get_query_summary(limit=20):
+    """Агрегаты по тексту запроса, отсортированные по суммарному времени."""
+    summary = {}
+    with _lock:
+        for event in _events:
+            if event['kind'] != 'query': continue
+            item = summary.setdefault(event['sql'], {'sql': event['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0})
+            item['count'] += 1
+            item['total_ms'] += event['ms']
+            item['max_ms'] = max(item['max_ms'], event['ms'])
+            item['rows'] += event['rows']
+    for item in summary.values():
+        item['avg_ms'] = item['total_ms'] / item['count']
+    return sorted(summary.values(), key=lambda item: item['total_ms'], reverse=True)[:limit]
+
+def export_log():
+    """Выгружает перезапуски и события в формате JSON Lines."""
+    with _lock:
+        runs = [{key: value for key, value in run.items() if key not in ('events', '_started')} for run in _runs]
+        events = list(_events)
+    lines = [json.dumps({'kind': 'run', **run}, ensure_ascii=False) for run in runs]
+    lines += [json.dumps(event, ensure_ascii=False) for event in events]
+    lines.append(json.dumps({'kind': 'cache_stats', 'caches': get_cache_stats()}, ensure_ascii=False))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+import streamlit as st
+
+from code import db_helpers
+
+# --- Публикация снимков для реплики ---
+# Издатель держит собственное соединение с основной базой и раз в
+# PUBLISH_INTERVAL_S секунд проверяет PRAGMA data_version: она меняется после
+# каждого коммита любого другого соединения, в том числе из других процессов.
+# Если база изменилась, backup API снимает согласованную копию (целиком за
+# один шаг, писатели в режиме WAL при этом не ждут), копия переводится
+# из WAL в обычный журнал, сбрасывается на диск и атомарно подменяет
+# replica.db. Читатели (см. use_read_replica) подхватывают новый файл
+# в начале следующего запуска страницы.
+# Запуск: python -m code.replica --replica-dir /path/to/replicas [--db app.db]
+# или внутри приложения при APP_REPLICA_PUBLISHER=1.
+
+PUBLISH_INTERVAL_S = float(os.environ.get('APP_REPLICA_INTERVAL', 2))
+PUBLISHER_ENABLED = os.environ.get('APP_REPLICA_PUBLISHER') == '1'
+
+logger = logging.getLogger(__name__)
+
+def publish_snapshot(source, replica_file):
+    """Копирует базу из соединения source в replica_file через временный файл и os.replace."""
+    replica_dir = os.path.dirname(os.path.abspath(replica_file))
+    os.makedirs(replica_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.replica-', suffix='.db', dir=replica_dir)
+    os.close(fd)
+    try:
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+            # Снимок открывается с immutable=1, файлы -wal/-shm ему не нужны
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, replica_file)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def run_publisher(db_file=None, replica_file=None, interval=PUBLISH_INTERVAL_S, stop=None):
+    """Публикует снимок при каждом изменении основной базы, пока не установлен stop."""
+    db_file = db_file or db_helpers.DB_FILE
+    replica_file = replica_file or db_helpers.REPLICA_FILE
+    stop = stop or threading.Event()
+    source = sqlite3.connect(db_file, check_same_thread=False)
+    published_version = None
+    try:
+        while not stop.is_set():
+            version = source.execute('PRAGMA data_version').fetchone()[0]
+            if version != published_version or not os.path.exists(replica_file):
+                started = time.perf_counter()
+                try:
+                    publish_snapshot(source, replica_file)
+                except (OSError, sqlite3.Error) as e:
+                    # Например, снимок открыт читателем в Windows; попробуем в следующий раз
+                    logger.warning("Снимок реплики не опубликован: %s", e)
+                else:
+                    published_version = version
+                    logger.info("Снимок реплики опубликован за %.0f мс", (time.perf_counter() - started) * 1000)
+            stop.wait(interval)
+    finally:
+        source.close()
+
+@st.cache_resource
+def start_replica_publisher():
+    """Запускает издателя снимков в фоновом потоке, если он включен (APP_REPLICA_DIR и APP_REPLICA_PUBLISHER=1)."""
+    if not (PUBLISHER_ENABLED and db_helpers.REPLICA_FILE):
+        return None
+    stop = threading.Event()
+    threading.Thread(target=run_publisher, kwargs={'stop': stop}, name='replica-publisher', daemon=True).start()
+    return stop
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Публикует снимки основной базы для читателей-реплик.")
+    parser.add_argument('--db', default=None, help="Основная база (по умолчанию APP_DB_FILE или app.db).")
+    parser.add_argument('--replica-dir', default=db_helpers.REPLICA_DIR or None, help="Каталог снимка (по умолчанию APP_REPLICA_DIR).")
+    parser.add_argument('--interval', type=float, default=PUBLISH_INTERVAL_S, help="Период проверки изменений, секунды.")
+    parser.add_argument('--once', action='store_true', help="Опубликовать один снимок и выйти.")
+    args = parser.parse_args(argv)
+    if not args.replica_dir:
+        parser.error("нужен --replica-dir или APP_REPLICA_DIR")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    db_file = os.path.abspath(args.db) if args.db else db_helpers.DB_FILE
+    replica_file = os.path.join(args.replica_dir, db_helpers.REPLICA_FILENAME)
+    if args.once:
+        source = sqlite3.connect(db_file)
+        try:
+            publish_snapshot(source, replica_file)
+        finally:
+            source.close()
+        return 0
+    try:
+        run_publisher(db_file, replica_file, args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
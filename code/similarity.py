@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import sqlite3
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+
+from code.db_helpers import (
+    BASE_DIR, PHOTO_HASHES_TABLE, get_db_connection, get_write_connection, get_schema_catalog,
+    get_cached, get_records_by_keys, bump_data_generation, init_db,
+)
+
+# --- Поиск похожих изображений ---
+# Для каждого фото считается 64-битный dHash (разности яркости соседних пикселей
+# уменьшенной до 9×8 копии). Хэши хранятся в photo_hashes с размером и mtime
+# файла, поэтому повторная сборка считает только новые и измененные фото.
+# Для поиска хэши всех записей загружаются в массивы NumPy, расстояние Хэмминга
+# до всей коллекции считается одной векторной операцией.
+
+HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 10
+WRITE_BATCH_SIZE = 2000
+
+def dhash(path):
+    """dHash изображения по абсолютному пути как беззнаковое 64-битное целое."""
+    with Image.open(path) as img:
+        img.draft('L', (HASH_SIZE * 4, HASH_SIZE * 4))
+        pixels = np.asarray(img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+def _to_signed(value):
+    # SQLite хранит только знаковые 64-битные целые
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _ensure_table(conn):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {PHOTO_HASHES_TABLE} (
+            path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, dhash INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+def _photo_paths(conn):
+    catalog = get_schema_catalog(conn)
+    paths = set()
+    for table in catalog.tables:
+        if not catalog.has_column(table, 'Фото'): continue
+        paths.update(row[0] for row in conn.execute(f'SELECT DISTINCT "Фото" FROM "{table}" WHERE "Фото" IS NOT NULL AND "Фото" != \'\''))
+    return paths
+
+def _hash_one(item):
+    path, size, mtime_ns = item
+    try:
+        return path, size, mtime_ns, _to_signed(dhash(os.path.join(BASE_DIR, path)))
+    except Exception:
+        return path, size, mtime_ns, None
+
+def build_photo_hashes(workers=None):
+    """Досчитывает хэши новых и измененных фото в пуле процессов. Возвращает статистику."""
+    started = time.perf_counter()
+    init_db()
+    with get_write_connection() as conn:
+        _ensure_table(conn)
+    conn = get_db_connection()
+    known = {row[0]: (row[1], row[2]) for row in conn.execute(f'SELECT path, size, mtime_ns FROM {PHOTO_HASHES_TABLE}')}
+    paths = _photo_paths(conn)
+    pending = []
+    for path in paths:
+        try:
+            stat = os.stat(os.path.join(BASE_DIR, path))
+        except OSError:
+            continue
+        if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+            pending.append((path, stat.st_size, stat.st_mtime_ns))
+    stale = [path for path in known if path not in paths]
+    stats = {'photos': len(paths), 'hashed': 0, 'failed': 0, 'removed': len(stale)}
+
+    batch = []
+    def flush():
+        with get_write_connection() as conn:
+            conn.executemany(f'INSERT OR REPLACE INTO {PHOTO_HASHES_TABLE} (path, size, mtime_ns, dhash) VALUES (?, ?, ?, ?)', batch)
+        batch.clear()
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, size, mtime_ns, value in pool.map(_hash_one, pending, chunksize=64):
+                if value is None:
+                    stats['failed'] += 1; continue
+                batch.append((path, size, mtime_ns, value))
+                stats['hashed'] += 1
+                if len(batch) >= WRITE_BATCH_SIZE: flush()
+    if batch: flush()
+    with get_write_connection() as conn:
+        conn.executemany(f'DELETE FROM {PHOTO_HASHES_TABLE} WHERE path = ?', [(path,) for path in stale])
+        if stats['hashed'] or stale:
+            bump_data_generation(conn)
+    stats['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return stats
+
+# --- Индекс в памяти ---
+
+class HashIndex:
+    """Хэши фото всех записей: номер таблицы, rowid и dHash в параллельных массивах."""
+    __slots__ = ('tables', 'table_ids', 'rowids', 'hashes', 'nbytes')
+
+    def __init__(self, rows_by_table):
+        self.tables = sorted(rows_by_table)
+        counts = [len(rows_by_table[table]) for table in self.tables]
+        self.table_ids = np.repeat(np.arange(len(self.tables), dtype=np.int32), counts)
+        rows = [row for table in self.tables for row in rows_by_table[table]]
+        self.rowids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        self.hashes = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows)).view(np.uint64)
+        self.nbytes = 256 + self.table_ids.nbytes + self.rowids.nbytes + self.hashes.nbytes
+
+    def search(self, value, max_distance=DEFAULT_MAX_DISTANCE, limit=30, exclude=None):
+        """Ключи (source_table, rowid, расстояние) ближайших записей, по возрастанию расстояния."""
+        distances = np.bitwise_count(self.hashes ^ np.uint64(value))
+        candidates = np.flatnonzero(distances <= max_distance)
+        order = candidates[np.argsort(distances[candidates], kind='stable')]
+        result = []
+        for i in order:
+            key = (self.tables[self.table_ids[i]], int(self.rowids[i]))
+            if key == exclude: continue
+            result.append(key + (int(distances[i]),))
+            if len(result) >= limit: break
+        return result
+
+def _load_index(conn):
+    catalog = get_schema_catalog(conn)
+    rows_by_table = {}
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (PHOTO_HASHES_TABLE,)).fetchone():
+        return HashIndex(rows_by_table)
+    for table in catalog.tables:
+        if not catalog.has_column(table, 'Фото'): continue
+        rows = conn.execute(f'SELECT t.rowid, h.dhash FROM "{table}" t JOIN {PHOTO_HASHES_TABLE} h ON h.path = t."Фото"').fetchall()
+        if rows: rows_by_table[table] = rows
+    return HashIndex(rows_by_table)
+
+def get_hash_index():
+    conn = get_db_connection()
+    return get_cached(conn, ('photo_hash_index',), lambda: _load_index(conn), lambda index: index.nbytes)
+
+def _photo_hash(conn, path):
+    """Хэш фото из photo_hashes, если он актуален, иначе — посчитанный на месте."""
+    full_path = os.path.join(BASE_DIR, path)
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        return None
+    try:
+        row = conn.execute(f'SELECT size, mtime_ns, dhash FROM {PHOTO_HASHES_TABLE} WHERE path = ?', (path,)).fetchone()
+    except sqlite3.OperationalError:
+        row = None  # Хэши еще не собирались
+    if row and (row[0], row[1]) == (stat.st_size, stat.st_mtime_ns):
+        return row[2] & ((1 << 64) - 1)
+    try:
+        return dhash(full_path)
+    except Exception:
+        return None
+
+def find_similar_records(path, limit=30, max_distance=DEFAULT_MAX_DISTANCE, exclude=None, full=False):
+    """Записи с фото, похожими на path. Возвращает [(запись, расстояние), ...] от самых похожих."""
+    if not path: return []
+    value = _photo_hash(get_db_connection(), path)
+    if value is None: return []
+    hits = get_hash_index().search(value, max_distance, limit, tuple(exclude) if exclude else None)
+    distances = {(table, rowid): distance for table, rowid, distance in hits}
+    records = get_records_by_keys([(table, rowid) for table, rowid, _ in hits], full)
+    return [(record, distances[(record['source_table'], record['rowid'])]) for record in records]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Считает перцептивные хэши фото записей для поиска похожих изображений.")
+    parser.add_argument('--workers', type=int, default=None, help="Количество процессов (по умолчанию — число ядер).")
+    args = parser.parse_args(argv)
+    print(json.dumps(build_photo_hashes(args.workers), ensure_ascii=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
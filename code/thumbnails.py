@@ -0,0 +1,153 @@
+import os
+import sys
+import uuid
+import hashlib
+import argparse
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from PIL import Image
+
+from code.profiling import count_cache
+from code.db_helpers import BASE_DIR, get_db_connection, get_table_names, get_photo_files
+
+# --- Кэш миниатюр ---
+# Миниатюры лежат в THUMB_DIR под именем sha1(путь + mtime + размер файла + размер
+# миниатюры), поэтому замена исходного файла автоматически дает новый ключ,
+# а старая миниатюра просто перестает использоваться. Каталог лежит в static/,
+# откуда файлы отдает сам Streamlit (см. code.image_server.thumbnail_url).
+
+THUMB_DIR = os.path.join(BASE_DIR, 'static', 'thumbs')
+THUMB_FORMAT = 'WEBP'
+THUMB_EXTENSION = 'webp'
+THUMB_MIME = 'image/webp'
+THUMB_QUALITY = 80
+
+# Размеры с запасом x2 под HiDPI-экраны для контейнеров 150×100 и 200×150
+LIST_THUMB_SIZE = (300, 200)
+EDIT_THUMB_SIZE = (400, 300)
+
+def thumbnail_key(path, size=LIST_THUMB_SIZE, file_info=None):
+    """Возвращает ключ миниатюры для пути к фото относительно BASE_DIR или None, если файла нет.
+
+    file_info — уже известные (размер, mtime_ns) файла (см. get_photo_files), иначе вызывается stat.
+    """
+    if file_info is None:
+        try:
+            stat = os.stat(os.path.join(BASE_DIR, path))
+        except OSError:
+            return None
+        file_info = (stat.st_size, stat.st_mtime_ns)
+    file_size, mtime_ns = file_info
+    source = f'{path}|{mtime_ns}|{file_size}|{size[0]}x{size[1]}'
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def _thumbnail_file(key):
+    return os.path.join(THUMB_DIR, key[:2], f'{key}.{THUMB_EXTENSION}')
+
+def _render_thumbnail(path, size, destination):
+    """Уменьшает изображение и атомарно записывает его в кэш."""
+    with Image.open(os.path.join(BASE_DIR, path)) as img:
+        img.thumbnail(size)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # Одну миниатюру могут одновременно готовить потоки предзагрузки и сервера изображений
+        tmp_path = f'{destination}.{uuid.uuid4().hex}.tmp'
+        try:
+            img.save(tmp_path, THUMB_FORMAT, quality=THUMB_QUALITY, method=4)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+
+def get_thumbnail_path(path, size=LIST_THUMB_SIZE, file_info=None):
+    """Возвращает абсолютный путь к миниатюре, при необходимости создавая ее. None — если фото недоступно."""
+    if not path: return None
+    key = thumbnail_key(path, size, file_info)
+    if not key: return None
+    destination = _thumbnail_file(key)
+    exists = os.path.exists(destination)
+    count_cache('thumbnails', exists)
+    if not exists:
+        try:
+            _render_thumbnail(path, size, destination)
+        except Exception:
+            return None
+    return destination
+
+# --- Предзагрузка для страниц ---
+# Пока страница рисует текстовые колонки, миниатюры текущей и следующей
+# страницы готовятся в фоновом пуле потоков (Pillow отпускает GIL при
+# декодировании и масштабировании). К моменту запроса браузера миниатюра уже
+# лежит в кэше и отдается сразу. Наличие и версия фото
+# берутся одним запросом к индексу photo_files; для отсутствующих фото задачи
+# не создаются.
+
+PREFETCH_WORKERS = int(os.environ.get('THUMB_PREFETCH_WORKERS', 4))
+
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='thumb-prefetch')
+_inflight = {}
+_inflight_lock = threading.RLock()
+
+_missing = Future()
+_missing.set_result(None)
+
+def _prepare_thumbnail(path, size, file_info):
+    destination = get_thumbnail_path(path, size, file_info)
+    # Ключ отдаем только для готовой миниатюры: по нему страница строит ссылку на файл
+    return os.path.basename(destination).rsplit('.', 1)[0] if destination else None
+
+def prefetch_thumbnails(paths, size=LIST_THUMB_SIZE):
+    """Готовит миниатюры в фоне. Возвращает {путь: Future с ключом миниатюры или None, если фото нет или оно не читается}."""
+    paths = [path for path in dict.fromkeys(paths) if path]
+    files = get_photo_files(paths)
+    futures = {}
+    with _inflight_lock:
+        for path in paths:
+            if path not in files:
+                futures[path] = _missing
+                continue
+            future = _inflight.get((path, size))
+            if future is None:
+                future = _inflight[(path, size)] = _prefetch_pool.submit(_prepare_thumbnail, path, size, files[path])
+                future.add_done_callback(lambda _, key=(path, size): _forget_inflight(key))
+            futures[path] = future
+    return futures
+
+def _forget_inflight(key):
+    with _inflight_lock:
+        _inflight.pop(key, None)
+
+# --- Пакетная генерация ---
+
+def get_all_photo_paths():
+    """Возвращает все непустые значения "Фото" из таблиц записей."""
+    paths = set()
+    with get_db_connection() as conn:
+        for table in get_table_names():
+            paths.update(row[0] for row in conn.cursor().execute(f'SELECT DISTINCT "Фото" FROM "{table}" WHERE "Фото" IS NOT NULL AND "Фото" != \'\''))
+    return sorted(paths)
+
+def _build_one(path):
+    return [get_thumbnail_path(path, size) is not None for size in (LIST_THUMB_SIZE, EDIT_THUMB_SIZE)]
+
+def build_thumbnails(paths, workers=None):
+    """Создает недостающие миниатюры для списка фото в пуле процессов. Возвращает (готово, ошибок)."""
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(_build_one, paths, chunksize=64):
+            done += all(results)
+            failed += not all(results)
+    return done, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генерирует миниатюры для всех фото записей.")
+    parser.add_argument('--workers', type=int, default=None, help="Количество процессов (по умолчанию — число ядер).")
+    args = parser.parse_args(argv)
+    paths = get_all_photo_paths()
+    done, failed = build_thumbnails(paths, args.workers)
+    print(f"Миниатюры: {done} готово, {failed} с ошибками, всего фото {len(paths)}.")
+    return 0 if not failed else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,24 +3,40 @@ import sqlite3
 import os
 import sys
 import shutil
+import time
 
 # --- Импорты ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from code.auth import check_password, add_user, update_user, delete_user
+from code.auth import (
+    check_password, add_user, update_user, delete_user, LoginThrottled, client_ip, login, logout, restore_session, sync_auth_cookie,
+)
 from code.db_helpers import (
-    get_db_connection, 
-    get_table_names, get_records, global_search_records, 
-    get_record_by_id, update_record, delete_record, get_all_tags, 
-    add_new_tag, update_tag, delete_tag, get_image_as_base64, BASE_DIR,
-    get_all_users
+    get_db_connection, use_read_replica, get_data_version,
+    get_table_names, get_records_page, count_records, global_search_records_page, count_global_search_records,
+    get_record_by_id, update_record, delete_record, get_all_tags, get_record_tags,
+    get_record_keys, bulk_update_records, delete_records,
+    add_new_tag, update_tag, delete_tag,
+    get_all_users, get_pool_stats, get_result_cache_stats
 )
+from code.photo_store import save_uploaded_photo
+from code.similarity import find_similar_records
+from code.image_server import start_image_server, thumbnail_url
+from code.thumbnails import EDIT_THUMB_SIZE, prefetch_thumbnails
+from code.photo_index import run_scan, last_scan_time
+from code.export import export_controls
 from code.i18n import t, language_selector
+from code import profiling
+
+profiling.begin_run('Admin_Page')
+# Администратор должен сразу видеть свои изменения: читаем основную базу, а не снимок
+use_read_replica(False)
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 IMG_DIR = os.path.join(PROJECT_ROOT, 'img')
 
 # --- Настройка страницы и CSS ---
 st.set_page_config(page_title=t('sidebar_admin'), page_icon="⚙️", layout="wide")
+start_image_server()
 st.markdown("""
 <style>
 .img-container-admin, .edit-img-container {
@@ -44,10 +60,14 @@ def login_form():
     with st.form("Login"):
         username, password = st.text_input(t('login_form_username')), st.text_input(t('login_form_password'), type="password")
         if st.form_submit_button(t('login_form_button')):
-            is_valid, user_name, is_admin = check_password(username, password)
-            if is_valid:
-                st.session_state.update({'authenticated': True, 'username': username, 'name': user_name, 'is_admin': is_admin}); st.rerun()
-            else: st.error(t('login_form_error'))
+            try:
+                is_valid, user_name, is_admin = check_password(username, password, client_ip())
+            except LoginThrottled as e:
+                st.error(t('login_throttled', seconds=e.retry_after))
+            else:
+                if is_valid:
+                    login(username, user_name, is_admin); st.rerun()
+                else: st.error(t('login_form_error'))
 
 def user_management_tab():
     st.header(t('user_management_title'))
@@ -67,6 +87,8 @@ def user_management_tab():
                     st.success(t('register_success'))
                 except sqlite3.IntegrityError:
                     st.error(f"User '{new_username}' already exists.")
+                except LoginThrottled as e:
+                    st.error(t('password_hash_busy', seconds=e.retry_after))
             else:
                 st.error(t('register_error_password_mismatch'))
 
@@ -85,15 +107,19 @@ def user_management_tab():
                 edited_is_admin = st.checkbox(t('register_form_is_admin'), value=bool(user['admin']))
                 c1, c2 = st.columns(2)
                 if c1.form_submit_button(t('save_button')):
-                    update_user(
-                        username=user['username'],
-                        new_username=edited_username,
-                        new_name=edited_name,
-                        new_password=edited_password if edited_password else None,
-                        new_admin_status=1 if edited_is_admin else 0
-                    )
-                    st.session_state.editing_user_username = None
-                    st.rerun()
+                    try:
+                        update_user(
+                            username=user['username'],
+                            new_username=edited_username,
+                            new_name=edited_name,
+                            new_password=edited_password if edited_password else None,
+                            new_admin_status=1 if edited_is_admin else 0
+                        )
+                    except LoginThrottled as e:
+                        st.error(t('password_hash_busy', seconds=e.retry_after))
+                    else:
+                        st.session_state.editing_user_username = None
+                        st.rerun()
                 if c2.form_submit_button(t('cancel_button')):
                     st.session_state.editing_user_username = None
                     st.rerun()
@@ -116,10 +142,225 @@ def user_management_tab():
                     st.rerun()
         st.divider()
 
+def _selection_key(key):
+    return f"bulk_sel_{key[0]}_{key[1]}"
+
+def clear_selection():
+    st.session_state.selected_records = set()
+    for widget_key in [k for k in st.session_state if str(k).startswith('bulk_sel_')]:
+        del st.session_state[widget_key]
+
+def finish_bulk_action(message):
+    """Сбрасывает выделение и кэш количества после массовой операции и делает один перезапуск."""
+    clear_selection()
+    st.session_state.update({'bulk_delete_pending': False, 'records_count_key': None, 'bulk_message': message})
+    st.rerun()
+
+def bulk_actions_panel(filter_table, search_query, total_records, page_keys):
+    selected = st.session_state.setdefault('selected_records', set())
+    # Флажки строк ниже по странице; их значения с прошлого перезапуска уже в session_state
+    for key in page_keys:
+        if st.session_state.get(_selection_key(key)): selected.add(key)
+        elif _selection_key(key) in st.session_state: selected.discard(key)
+    with st.expander(t('bulk_actions_title')):
+        st.caption(f"{t('bulk_selected')}: {len(selected)} · {t('bulk_scope_filter')}: {total_records}")
+        s1, s2, _ = st.columns([1, 1, 2])
+        if s1.button(t('bulk_select_page')):
+            for key in page_keys:
+                selected.add(key)
+                st.session_state[_selection_key(key)] = True
+            st.rerun()
+        if s2.button(t('bulk_clear_selection'), disabled=not selected):
+            clear_selection(); st.rerun()
+
+        scope = st.radio(t('bulk_scope'), ['selection', 'filter'], horizontal=True, format_func=lambda s: t(f'bulk_scope_{s}'))
+        all_tags = get_all_tags()
+        c1, c2 = st.columns(2)
+        add_tags = c1.multiselect(t('bulk_add_tags'), options=all_tags)
+        remove_tags = c2.multiselect(t('bulk_remove_tags'), options=all_tags)
+        set_comment = st.checkbox(t('bulk_set_comment'))
+        comment = st.text_input(t('edit_form_comment'), disabled=not set_comment, key='bulk_comment')
+        detach_photo = st.checkbox(t('bulk_detach_photo'))
+
+        def target_keys():
+            return sorted(selected) if scope == 'selection' else get_record_keys(filter_table, search_query)
+
+        has_targets = bool(selected) if scope == 'selection' else bool(total_records)
+        b1, b2, b3 = st.columns(3)
+        if b1.button(t('bulk_apply'), disabled=not has_targets or not (add_tags or remove_tags or set_comment or detach_photo)):
+            with profiling.stage('bulk_update'):
+                count = bulk_update_records(target_keys(), add_tags, remove_tags, comment if set_comment else None, detach_photo)
+            finish_bulk_action(t('bulk_updated', count=count))
+        if st.session_state.get('bulk_delete_pending'):
+            if b2.button(t('confirm_delete_button'), key='bulk_delete_confirm'):
+                with profiling.stage('bulk_delete'):
+                    count = delete_records(target_keys())
+                finish_bulk_action(t('bulk_deleted', count=count))
+            if b3.button(t('cancel_button'), key='bulk_delete_cancel'):
+                st.session_state.bulk_delete_pending = False; st.rerun()
+        elif b2.button(t('bulk_delete'), disabled=not has_targets):
+            st.session_state.bulk_delete_pending = True; st.rerun()
+
+# Кнопки списка записей меняют состояние в on_click: нажатие внутри фрагмента
+# само перезапускает только фрагмент
+def turn_page(delta):
+    st.session_state.current_page += delta
+
+def ask_delete_record(table, rowid):
+    st.session_state.deleting_record_info = {'table': table, 'rowid': rowid}
+
+def confirm_delete_record(deleting_info):
+    delete_record(deleting_info['table'], deleting_info['rowid'])
+    st.session_state.deleting_record_info = None
+    st.session_state.records_count_key = None
+
+@st.fragment
+def records_grid(selected_table, search_query):
+    """Список записей с листанием: страницы и удаление перезапускают только этот фрагмент."""
+    profiling.begin_fragment_run('Admin_Page:records')
+    use_read_replica(False)
+    is_global = selected_table == t('all_tables')
+    # Общее количество кэшируется в сессии до смены фильтра или любого изменения данных
+    count_key = (selected_table, search_query, get_data_version())
+    if st.session_state.get('records_count_key') != count_key:
+        with profiling.stage('count'):
+            if is_global:
+                st.session_state.records_total = count_global_search_records(search_query)
+            else:
+                st.session_state.records_total = count_records(selected_table, search_query)
+        st.session_state.records_count_key = count_key
+    total_records = st.session_state.records_total
+
+    if is_global and not search_query:
+        st.info(t('enter_query_global_search'))
+
+    if total_records:
+        total_pages = max(1, (total_records + RECORDS_PER_PAGE - 1) // RECORDS_PER_PAGE)
+        current_page = st.session_state.get('current_page', 1)
+        current_page = min(current_page, total_pages)
+        st.session_state.current_page = current_page
+
+        with profiling.stage('fetch_page'):
+            if is_global:
+                records_to_display = global_search_records_page(search_query, current_page, RECORDS_PER_PAGE)
+            else:
+                records_to_display = get_records_page(selected_table, search_query, current_page, RECORDS_PER_PAGE)
+
+        r1, r2 = st.columns([4, 1])
+        r1.write(f"{t('records_found')} {total_records}")
+        with r2:
+            export_controls(None if is_global else selected_table, search_query, full=True, key='admin_export')
+        bulk_actions_panel(None if is_global else selected_table, search_query, total_records, [(r['source_table'], r['rowid']) for r in records_to_display])
+        cols = st.columns([2, 5, 2, 3, 2, 1, 1])
+        cols[0].subheader(t('table_header_table'))
+        cols[1].subheader(t('table_header_path'))
+        cols[2].subheader(t('table_header_subfile'))
+        cols[3].subheader(t('table_header_comment'))
+        cols[4].subheader(t('table_header_photo'))
+
+        thumbs = prefetch_thumbnails([r['Фото'] for r in records_to_display])
+        with profiling.stage('render_rows'):
+            image_cells = []
+            deleting_info = st.session_state.get('deleting_record_info')
+            selected = st.session_state.selected_records
+            for r in records_to_display:
+                row_cols = st.columns([2, 5, 2, 3, 2, 1, 1])
+                record_key = (r['source_table'], r['rowid'])
+                st.session_state.setdefault(_selection_key(record_key), record_key in selected)
+                if row_cols[0].checkbox(r['source_table'], key=_selection_key(record_key)):
+                    selected.add(record_key)
+                else:
+                    selected.discard(record_key)
+                row_cols[1].markdown(f"`{r['Путь']}`")
+                row_cols[2].write(r['Подфайл'] or '')
+                row_cols[3].write(r['Комментарий'] or '')
+
+                image_cells.append((row_cols[4].empty(), r['Фото']))
+
+                if deleting_info and deleting_info['rowid'] == r['rowid']:
+                    row_cols[5].write(t('are_you_sure')) 
+                    row_cols[6].button(t('confirm_delete_button'), key=f"del_confirm_{r['rowid']}", on_click=confirm_delete_record, args=(deleting_info,))
+                else:
+                    if row_cols[5].button(t('edit_button'), key=f"edit_{r['rowid']}"):
+                        st.session_state.editing_record_info = {'table': r['source_table'], 'rowid': r['rowid']}
+                        st.rerun()
+                    row_cols[6].button(t('delete_button'), key=f"del_{r['rowid']}", on_click=ask_delete_record, args=(r['source_table'], r['rowid']))
+        with profiling.stage('render_images'):
+            for cell, photo in image_cells:
+                img_url = thumbnail_url(photo, thumbs[photo].result()) if photo else None
+                if img_url:
+                    cell.markdown(f'<div class="img-container-admin"><img src="{img_url}" loading="lazy"></div>', unsafe_allow_html=True)
+                else:
+                    cell.markdown('<div class="img-container-admin">---</div>', unsafe_allow_html=True)
+        # Следующая страница — после отрисовки текущей, чтобы не задерживать ее строки
+        if current_page < total_pages:
+            with profiling.stage('prefetch_next'):
+                if is_global:
+                    next_page = global_search_records_page(search_query, current_page + 1, RECORDS_PER_PAGE)
+                else:
+                    next_page = get_records_page(selected_table, search_query, current_page + 1, RECORDS_PER_PAGE)
+                prefetch_thumbnails([r['Фото'] for r in next_page])
+        st.divider()
+        p1,p2,p3 = st.columns([3,1,3]);
+        p1.button(t('pagination_prev'), disabled=current_page<=1, on_click=turn_page, args=(-1,))
+        p2.write(f"{t('pagination_page')} {current_page} {t('pagination_of')} {total_pages}")
+        p3.button(t('pagination_next'), disabled=current_page>=total_pages, on_click=turn_page, args=(1,))
+
+def diagnostics_tab():
+    st.header(t('diagnostics_title'))
+    enabled = st.toggle(t('diagnostics_enable'), value=profiling.is_enabled())
+    if enabled != profiling.is_enabled():
+        profiling.set_enabled(enabled)
+        st.rerun()
+    c1, c2 = st.columns(2)
+    c1.download_button(t('diagnostics_export'), profiling.export_log, file_name="profile.jsonl", mime="application/x-ndjson")
+    if c2.button(t('diagnostics_clear')):
+        profiling.clear(); st.rerun()
+
+    st.subheader(t('diagnostics_caches'))
+    st.dataframe([{'cache': name, **stats} for name, stats in profiling.get_cache_stats().items()], hide_index=True)
+    c1, c2 = st.columns(2)
+    c1.write(t('diagnostics_result_cache')); c1.json(get_result_cache_stats(), expanded=False)
+    c2.write(t('diagnostics_pool')); c2.json(get_pool_stats(), expanded=False)
+
+    st.subheader(t('diagnostics_photos'))
+    scanned_at = last_scan_time()
+    st.caption(t('photo_scan_last', time=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(scanned_at))) if scanned_at else t('photo_scan_never'))
+    if st.button(t('photo_scan_button')):
+        with st.spinner(t('photo_scan_spinner')):
+            st.session_state.photo_scan_report = run_scan()
+    report = st.session_state.get('photo_scan_report')
+    if report:
+        c1, c2, c3 = st.columns(3)
+        c1.metric(t('photo_scan_files'), report['files'])
+        c2.metric(t('photo_scan_orphans'), len(report['orphans']))
+        c3.metric(t('photo_scan_dangling'), len(report['dangling']))
+        if report['orphans']:
+            c2.dataframe({'path': report['orphans'][:1000]}, hide_index=True)
+        if report['dangling']:
+            c3.dataframe([{'table': table, 'rowid': rowid, 'photo': photo} for table, rowid, photo in report['dangling'][:1000]], hide_index=True)
+
+    st.subheader(t('diagnostics_runs'))
+    runs = profiling.get_runs(limit=50)
+    if not runs:
+        st.info(t('diagnostics_empty'))
+    else:
+        st.dataframe([
+            {'page': run['page'], 'elapsed_ms': round(run['elapsed_ms'], 1), 'queries': run['queries'], 'query_ms': round(run['query_ms'], 1),
+             **{name: round(ms, 1) for name, ms in run['stages'].items()}}
+            for run in runs
+        ], hide_index=True)
+        st.subheader(t('diagnostics_queries'))
+        st.dataframe(profiling.get_query_summary(), hide_index=True)
+
 # --- 3. Боковая панель ---
+restore_session()
 language_selector()
 if st.session_state.get('authenticated'):
     st.sidebar.success(f"{t('logged_in_as_sidebar')} **{st.session_state.name}**")
+    if st.sidebar.button(t('sidebar_logout')):
+        logout(); st.rerun()
+sync_auth_cookie()
 
 # --- 4. Основная логика страницы ---
 st.title(t('admin_panel_title'))
@@ -129,7 +370,7 @@ if not st.session_state.get('authenticated'):
 elif not st.session_state.get('is_admin'):
     st.error(t('permission_denied'))
 else: 
-    tab1, tab2, tab3 = st.tabs([t('tab_records'), t('tab_tags'), t('tab_user_management')])
+    tab1, tab2, tab3, tab4 = st.tabs([t('tab_records'), t('tab_tags'), t('tab_user_management'), t('tab_diagnostics')])
     with tab1:
         editing_info = st.session_state.get('editing_record_info')
         if editing_info:
@@ -137,15 +378,15 @@ else:
             if record:
                 with st.form(key=f"edit_form_{record['rowid']}"):
                     st.subheader(f"{t('edit_form_title')} `{record['Путь']}`")
-                    if record['Фото'] and os.path.exists(os.path.join(BASE_DIR, record['Фото'])):
-                        b64_image = get_image_as_base64(record['Фото'])
-                        if b64_image: 
-                            st.markdown(f'<div class="edit-img-container"><img src="data:image/png;base64,{b64_image}"></div>', unsafe_allow_html=True)
+                    if record['Фото']:
+                        edit_thumb = prefetch_thumbnails([record['Фото']], EDIT_THUMB_SIZE)[record['Фото']]
+                        img_url = thumbnail_url(record['Фото'], edit_thumb.result(), EDIT_THUMB_SIZE)
+                        if img_url: 
+                            st.markdown(f'<div class="edit-img-container"><img src="{img_url}"></div>', unsafe_allow_html=True)
                     
                     comment = st.text_area(t('edit_form_comment'), record['Комментарий'] or "")
                     all_tags_suggestions = get_all_tags()
-                    current_tags = record['tags'].split(',') if record['tags'] else []
-                    current_tags = [tag.strip() for tag in current_tags if tag.strip()]
+                    current_tags = get_record_tags(editing_info['table'], record['rowid'])
                     selected_tags = st.multiselect(t('edit_form_tags'), options=all_tags_suggestions, default=current_tags)
                     uploaded_file = st.file_uploader(t('edit_form_photo'))
 
@@ -153,16 +394,10 @@ else:
 
                     if save.form_submit_button(t('save_button')):
                         tags_to_save = ",".join(selected_tags)
-                        photo_path = record['Фото']
                         if uploaded_file:
-                            destination_dir = os.path.dirname(record['Путь'])
-                            full_destination_dir = os.path.join(IMG_DIR, destination_dir)
-                            os.makedirs(full_destination_dir, exist_ok=True)
-                            photo_path = os.path.join('img', destination_dir, uploaded_file.name)
-                            full_photo_path = os.path.join(PROJECT_ROOT, photo_path)
-                            with open(full_photo_path, "wb") as f:
-                                f.write(uploaded_file.getbuffer())
-                        update_record(editing_info['table'], record['rowid'], comment, tags_to_save, photo_path)
+                            save_uploaded_photo(editing_info['table'], record['rowid'], comment, tags_to_save, uploaded_file, uploaded_file.name)
+                        else:
+                            update_record(editing_info['table'], record['rowid'], comment, tags_to_save, record['Фото'])
                         st.session_state.editing_record_info = None
                         st.rerun()
 
@@ -173,8 +408,27 @@ else:
                         
                     if cancel.form_submit_button(t('cancel_button')):
                         st.session_state.editing_record_info = None; st.rerun()
+
+                if record['Фото']:
+                    with st.expander(t('similar_images_title')):
+                        similar = find_similar_records(record['Фото'], limit=12, exclude=(editing_info['table'], record['rowid']), full=True)
+                        if not similar:
+                            st.info(t('no_similar_found'))
+                        grid = st.columns(4)
+                        similar_thumbs = prefetch_thumbnails([other['Фото'] for other, _ in similar])
+                        for i, (other, distance) in enumerate(similar):
+                            cell = grid[i % 4]
+                            img_url = thumbnail_url(other['Фото'], similar_thumbs[other['Фото']].result())
+                            if img_url:
+                                cell.markdown(f'<div class="img-container-admin"><img src="{img_url}" loading="lazy"></div>', unsafe_allow_html=True)
+                            cell.caption(f"{other['source_table']} · `{other['Путь']}` · {t('similar_distance')} {distance}")
+                            if cell.button(t('edit_button'), key=f"similar_edit_{other['source_table']}_{other['rowid']}"):
+                                st.session_state.editing_record_info = {'table': other['source_table'], 'rowid': other['rowid']}
+                                st.rerun()
         else:
             st.header(t('tab_records'))
+            if st.session_state.get('bulk_message'):
+                st.success(st.session_state.pop('bulk_message'))
             c1, c2 = st.columns([1, 2])
             table_options = [t('all_tables')] + get_table_names()
             sel_table_idx = table_options.index(st.session_state.get('selected_table', t('all_tables'))) if st.session_state.get('selected_table', t('all_tables')) in table_options else 0
@@ -182,69 +436,10 @@ else:
             search_query = c2.text_input(t('search_by_path'), st.session_state.get('search_query', ''))
             if selected_table != st.session_state.get('selected_table') or search_query != st.session_state.get('search_query'):
                 st.session_state.update({'selected_table': selected_table, 'search_query': search_query, 'current_page': 1})
+                clear_selection()
                 st.rerun()
 
-            all_records = []
-            if selected_table == t('all_tables'):
-                if search_query:
-                    all_records = global_search_records(search_query)
-                else:
-                    st.info(t('enter_query_global_search'))
-            else:
-                all_records = get_records(selected_table, search_query)
-
-            if all_records:
-                total_records = len(all_records)
-                total_pages = max(1, (total_records + RECORDS_PER_PAGE - 1) // RECORDS_PER_PAGE)
-                current_page = st.session_state.get('current_page', 1)
-                current_page = min(current_page, total_pages)
-                st.session_state.current_page = current_page
-
-                start_idx = (current_page - 1) * RECORDS_PER_PAGE
-                end_idx = current_page * RECORDS_PER_PAGE
-                records_to_display = all_records[start_idx:end_idx]
-
-                st.write(f"{t('records_found')} {total_records}")
-                cols = st.columns([2, 5, 2, 3, 2, 1, 1])
-                cols[0].subheader(t('table_header_table'))
-                cols[1].subheader(t('table_header_path'))
-                cols[2].subheader(t('table_header_subfile'))
-                cols[3].subheader(t('table_header_comment'))
-                cols[4].subheader(t('table_header_photo'))
-
-                deleting_info = st.session_state.get('deleting_record_info')
-                for r in records_to_display:
-                    row_cols = st.columns([2, 5, 2, 3, 2, 1, 1])
-                    row_cols[0].write(r['source_table'])
-                    row_cols[1].markdown(f"`{r['Путь']}`")
-                    row_cols[2].write(r['Подфайл'] or '')
-                    row_cols[3].write(r['Комментарий'] or '')
-
-                    if r['Фото'] and os.path.exists(os.path.join(BASE_DIR, r['Фото'])):
-                        b64_image = get_image_as_base64(r['Фото'])
-                        if b64_image:
-                            row_cols[4].markdown(f'<div class="img-container-admin"><img src="data:image/png;base64,{b64_image}"></div>', unsafe_allow_html=True)
-                    else:
-                        row_cols[4].markdown('<div class="img-container-admin">---</div>', unsafe_allow_html=True)
-
-                    if deleting_info and deleting_info['rowid'] == r['rowid']:
-                        row_cols[5].write(t('are_you_sure')) 
-                        if row_cols[6].button(t('confirm_delete_button'), key=f"del_confirm_{r['rowid']}"):
-                            delete_record(deleting_info['table'], deleting_info['rowid'])
-                            st.session_state.deleting_record_info = None
-                            st.rerun()
-                    else:
-                        if row_cols[5].button(t('edit_button'), key=f"edit_{r['rowid']}"):
-                            st.session_state.editing_record_info = {'table': r['source_table'], 'rowid': r['rowid']}
-                            st.rerun()
-                        if row_cols[6].button(t('delete_button'), key=f"del_{r['rowid']}"):
-                            st.session_state.deleting_record_info = {'table': r['source_table'], 'rowid': r['rowid']}
-                            st.rerun()
-                st.divider()
-                p1,p2,p3 = st.columns([3,1,3]);
-                if p1.button(t('pagination_prev'), disabled=current_page<=1): st.session_state.current_page-=1; st.rerun()
-                p2.write(f"{t('pagination_page')} {current_page} {t('pagination_of')} {total_pages}")
-                if p3.button(t('pagination_next'), disabled=current_page>=total_pages): st.session_state.current_page+=1; st.rerun()
+            records_grid(selected_table, search_query)
 
     with tab2:
         st.header(t('tag_management_title'))
@@ -256,9 +451,9 @@ else:
                 if new_tag_name:
                     try:
                         add_new_tag(new_tag_name, new_tag_desc)
-                        st.success(t('tag_create_success').format(tag_name=new_tag_name))
+                        st.success(t('tag_create_success', tag_name=new_tag_name))
                     except sqlite3.IntegrityError:
-                        st.error(t('tag_create_error_exists').format(tag_name=new_tag_name))
+                        st.error(t('tag_create_error_exists', tag_name=new_tag_name))
                 else:
                     st.warning(t('tag_create_error_empty'))
         st.divider()
@@ -301,3 +496,6 @@ else:
 
     with tab3:
         user_management_tab()
+
+    with tab4:
+        diagnostics_tab()
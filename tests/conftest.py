@@ -0,0 +1,45 @@
+import os
+import sys
+import pytest
+
+# Корень проекта должен идти раньше стандартной библиотеки: иначе пакет code
+# перекрывается одноименным модулем stdlib, который pytest к этому моменту
+# уже импортировал (через pdb).
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+if not hasattr(sys.modules.get('code'), '__path__'):
+    sys.modules.pop('code', None)
+
+from streamlit import logger as streamlit_logger
+# Вне `streamlit run` кэши Streamlit пишут предупреждение на каждый вызов
+streamlit_logger.set_log_level('error')
+from code import db_helpers, importer, photo_store
+
+RECORD_TABLE_DDL = 'CREATE TABLE "{}" ("Путь" TEXT, "Подфайл" TEXT, "Комментарий" TEXT, "Фото" TEXT, "tags" TEXT)'
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Пустая база в tmp_path; BASE_DIR модулей указывает туда же, чтобы img/ и хранилище фото были временными."""
+    base_dir = str(tmp_path)
+    for module in (db_helpers, importer, photo_store):
+        monkeypatch.setattr(module, 'BASE_DIR', base_dir)
+    monkeypatch.setattr(importer, 'IMG_DIR', os.path.join(base_dir, 'img'))
+    monkeypatch.setattr(photo_store, 'IMG_DIR', os.path.join(base_dir, 'img'))
+    monkeypatch.setattr(photo_store, 'STORE_DIR', os.path.join(base_dir, 'img', '.store'))
+    monkeypatch.setattr(photo_store, 'TMP_DIR', os.path.join(base_dir, 'img', '.store', 'tmp'))
+    monkeypatch.setattr(db_helpers, 'DB_FILE', os.path.join(base_dir, 'app.db'))
+    monkeypatch.setattr(db_helpers, 'REPLICA_FILE', None)
+    os.makedirs(os.path.join(base_dir, 'img'))
+    db_helpers.init_db()
+    yield tmp_path
+    db_helpers._get_pool().close()
+
+@pytest.fixture
+def make_table(db):
+    """Создает таблицу записей со строками [(Путь, Фото, tags)] и подключает ее, как init_db."""
+    def make(name, rows=()):
+        with db_helpers.get_write_connection() as conn:
+            conn.execute(RECORD_TABLE_DDL.format(name))
+            conn.executemany(f'INSERT INTO "{name}" ("Путь", "Фото", "tags") VALUES (?, ?, ?)', rows)
+        db_helpers.init_db()
+    return make
@@ -0,0 +1,75 @@
+import gzip
+import json
+import threading
+import http.client
+import pytest
+from code import db_helpers
+from code.api import create_api_server, GZIP_MIN_BYTES
+
+@pytest.fixture
+def api(make_table):
+    """Сервер API на свободном порту поверх тестовой базы; возвращает get(path, headers) -> (статус, заголовки, тело)."""
+    make_table('boot', [(f'boot/menu/{i:02d}.png', None, 'menu' if i % 2 else 'ui') for i in range(25)])
+    server = create_api_server('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    def get(path, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+        try:
+            conn.request('GET', path, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            conn.close()
+    yield get
+    server.shutdown()
+    server.server_close()
+
+def test_search_pages(api):
+    pages = []
+    for page in (1, 2, 3):
+        status, _, body = api(f'/api/search?q=menu&per_page=10&page={page}')
+        assert status == 200
+        pages.append(json.loads(body))
+    assert [p['total'] for p in pages] == [25, 25, 25]
+    assert [len(p['records']) for p in pages] == [10, 10, 5]
+    paths = [r['Путь'] for p in pages for r in p['records']]
+    assert sorted(paths) == [f'boot/menu/{i:02d}.png' for i in range(25)]
+
+    status, _, body = api('/api/search?tags=menu&page=2&per_page=10')
+    assert json.loads(body)['total'] == 12 and len(json.loads(body)['records']) == 2
+
+@pytest.mark.parametrize('query', ['page=0', 'per_page=1000', 'page=x'])
+def test_search_rejects_bad_paging(api, query):
+    assert api(f'/api/search?{query}')[0] == 400
+
+def test_records(api):
+    status, _, body = api('/api/records/boot/3')
+    assert status == 200
+    assert json.loads(body) == {'source_table': 'boot', 'rowid': 3, 'Путь': 'boot/menu/02.png', 'Подфайл': None, 'Комментарий': None, 'Фото': None, 'tags': 'ui'}
+    for path in ('/api/records/boot/999', '/api/records/boot/abc', '/api/records/users/1', '/api/records/missing/1', '/api/unknown'):
+        status, _, body = api(path)
+        assert status == 404, path
+        assert 'error' in json.loads(body)
+
+def test_etag_revalidation(api):
+    status, headers, _ = api('/api/tags')
+    etag = headers['ETag']
+    assert status == 200 and etag.startswith('W/')
+    status, headers, body = api('/api/tags', {'If-None-Match': etag})
+    assert (status, body, headers['ETag']) == (304, b'', etag)
+
+    # Любое изменение данных дает новый ETag
+    db_helpers.update_record('boot', 1, 'changed', 'ui', None)
+    status, headers, _ = api('/api/tags', {'If-None-Match': etag})
+    assert status == 200 and headers['ETag'] != etag
+
+def test_gzip_only_when_accepted_and_large(api):
+    _, headers, plain = api('/api/search?q=menu&per_page=25')
+    assert len(plain) >= GZIP_MIN_BYTES and 'Content-Encoding' not in headers
+    _, headers, body = api('/api/search?q=menu&per_page=25', {'Accept-Encoding': 'gzip'})
+    assert headers['Content-Encoding'] == 'gzip' and headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(body) == plain
+
+    _, headers, _ = api('/api/records/boot/1', {'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in headers
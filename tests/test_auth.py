@@ -0,0 +1,95 @@
+import bcrypt
+import pytest
+from code import auth
+from code.auth import LoginThrottled, FAILURE_WINDOW_S, MAX_FAILURES_PER_USER, MAX_FAILURES_PER_IP
+
+@pytest.fixture(autouse=True)
+def fast_auth(monkeypatch):
+    """Дешевый bcrypt и чистые счетчики неудач для каждого теста."""
+    gensalt = bcrypt.gensalt
+    monkeypatch.setattr(auth.bcrypt, 'gensalt', lambda: gensalt(rounds=4))
+    monkeypatch.setattr(auth, '_failures', {})
+    monkeypatch.setattr(auth, '_dummy_hash', None)
+
+@pytest.fixture
+def user(db):
+    auth.add_user('alice', 'secret', 'Alice', 1)
+    return 'alice'
+
+def test_valid_and_invalid_password(user):
+    assert auth.check_password(user, 'secret') == (True, 'Alice', True)
+    assert auth.check_password(user, 'wrong') == (False, None, False)
+
+def test_user_is_locked_after_failures(user):
+    for _ in range(MAX_FAILURES_PER_USER):
+        auth.check_password(user, 'wrong')
+    with pytest.raises(LoginThrottled) as excinfo:
+        auth.check_password(user, 'secret')
+    assert 0 < excinfo.value.retry_after <= FAILURE_WINDOW_S + 1
+
+def test_success_clears_user_failures(user):
+    for _ in range(MAX_FAILURES_PER_USER - 1):
+        auth.check_password(user, 'wrong')
+    assert auth.check_password(user, 'secret')[0]
+    assert auth.check_password(user, 'wrong')[0] is False
+    assert auth.check_password(user, 'secret')[0]
+
+def test_ip_limit_spans_usernames(db):
+    for i in range(MAX_FAILURES_PER_IP):
+        auth.check_password(f'ghost{i}', 'x', client_ip='10.0.0.1')
+    with pytest.raises(LoginThrottled):
+        auth.check_password('someone-else', 'x', client_ip='10.0.0.1')
+    # Другой адрес не затронут
+    assert auth.check_password('someone-else', 'x', client_ip='10.0.0.2') == (False, None, False)
+
+def test_unknown_user_still_runs_bcrypt(db, monkeypatch):
+    calls = []
+    run_bcrypt = auth._run_bcrypt
+    monkeypatch.setattr(auth, '_run_bcrypt', lambda func, *args: calls.append(func) or run_bcrypt(func, *args))
+    assert auth.check_password('nobody', 'secret') == (False, None, False)
+    assert calls == [bcrypt.hashpw, bcrypt.checkpw]
+    assert auth._dummy_hash is not None
+    calls.clear()
+    auth.check_password('nobody', 'secret')
+    assert calls == [bcrypt.checkpw]
+
+def test_window_slides():
+    keys = [(('user', 'bob'), 2)]
+    auth._record_failure(keys, 100.0)
+    auth._record_failure(keys, 160.0)
+    assert auth._retry_after(keys, 200.0) == int(100.0 + FAILURE_WINDOW_S - 200.0) + 1
+    # Первая неудача вышла из окна — можно пробовать снова, а ключ еще помнит вторую
+    assert auth._retry_after(keys, 100.0 + FAILURE_WINDOW_S) == 0
+    assert list(auth._failures[('user', 'bob')]) == [160.0]
+    assert auth._retry_after(keys, 160.0 + FAILURE_WINDOW_S) == 0
+    assert ('user', 'bob') not in auth._failures
+
+def test_token_roundtrip(user):
+    token = auth.issue_token(user, user_agent='Firefox')
+    assert auth.verify_token(token, 'Firefox') == ('alice', 'Alice', True)
+    assert auth.issue_token('nobody') is None
+
+@pytest.mark.parametrize('token', ['', 'garbage', 'a.b.c', 'a.b.c.d'])
+def test_malformed_tokens(user, token):
+    assert auth.verify_token(token) is None
+
+def test_token_expiry_and_tamper(user):
+    assert auth.verify_token(auth.issue_token(user, ttl=-1)) is None
+    token = auth.issue_token(user)
+    name, expires, signature = token.split('.')
+    assert auth.verify_token(f'{name}.{int(expires) + 3600}.{signature}') is None
+    flipped = '1' if signature[-1] == '0' else '0'
+    assert auth.verify_token(f'{name}.{expires}.{signature[:-1]}{flipped}') is None
+    auth.add_user('mallory', 'x')
+    forged_name = auth.issue_token('mallory').split('.')[0]
+    assert auth.verify_token(f'{forged_name}.{expires}.{signature}') is None
+    assert auth.verify_token(token, 'Other browser') is None
+
+def test_password_change_and_logout_revoke_tokens(user):
+    token = auth.issue_token(user)
+    auth.update_user(user, new_password='changed')
+    assert auth.verify_token(token) is None
+    token = auth.issue_token(user)
+    auth.revoke_tokens(user)
+    assert auth.verify_token(token) is None
+    assert auth.verify_token(auth.issue_token(user)) is not None
@@ -0,0 +1,60 @@
+import os
+import pytest
+from code import db_helpers
+
+def snapshot(table):
+    """{rowid: (Комментарий, tags, Фото)} таблицы."""
+    conn = db_helpers.get_db_connection()
+    return {row[0]: tuple(row[1:]) for row in conn.execute(f'SELECT rowid, "Комментарий", tags, "Фото" FROM "{table}"')}
+
+@pytest.fixture
+def records(make_table):
+    make_table('boot', [
+        ('boot/menu/a.png', 'img/shared.png', 'menu,ui'),
+        ('boot/menu/b.png', 'img/shared.png', 'menu'),
+        ('boot/other/c.png', 'img/own.png', 'ui'),
+    ])
+    make_table('cache', [('cache/menu/d.png', None, None)])
+
+def test_comment_and_tags_only_on_selected(records):
+    before = snapshot('boot')
+    keys = db_helpers.get_record_keys(search_query='menu')
+    assert keys == [('boot', 1), ('boot', 2), ('cache', 1)]
+    assert db_helpers.bulk_update_records(keys, add_tags=['done'], remove_tags=['menu'], comment='checked') == 3
+    after = snapshot('boot')
+    assert after[1] == ('checked', 'ui,done', 'img/shared.png')
+    assert after[2] == ('checked', 'done', 'img/shared.png')
+    assert after[3] == before[3]
+    assert snapshot('cache')[1] == ('checked', 'done', None)
+
+def test_none_comment_keeps_existing(records):
+    db_helpers.bulk_update_records([('boot', 1)], comment='first')
+    db_helpers.bulk_update_records([('boot', 1)], add_tags=['x'])
+    assert snapshot('boot')[1][0] == 'first'
+
+def test_remove_wins_over_add(records):
+    db_helpers.bulk_update_records([('boot', 3)], add_tags=['ui', 'new'], remove_tags=['ui'])
+    assert db_helpers.get_record_tags('boot', 3) == ['new']
+
+def test_unknown_keys_are_ignored(records):
+    assert db_helpers.bulk_update_records([('missing', 1), ('users', 1)], comment='x') == 0
+    assert db_helpers.delete_records([('missing', 1), ('boot', 99)]) == 0
+    assert db_helpers.count_records('boot') == 3
+
+def test_failed_bulk_update_changes_nothing(records, monkeypatch):
+    before = snapshot('boot'), db_helpers.get_record_tags('boot', 1)
+    def fail(conn): raise RuntimeError('interrupted')
+    monkeypatch.setattr(db_helpers, 'bump_data_generation', fail)
+    with pytest.raises(RuntimeError):
+        db_helpers.bulk_update_records([('boot', 1), ('boot', 2)], add_tags=['x'], comment='x', detach_photo=True)
+    assert (snapshot('boot'), db_helpers.get_record_tags('boot', 1)) == before
+
+def test_delete_keeps_photos_still_in_use(records, db):
+    for name in ('shared.png', 'own.png'):
+        with open(os.path.join(db, 'img', name), 'wb') as f: f.write(b'png')
+    assert db_helpers.delete_records([('boot', 1), ('boot', 3)]) == 2
+    assert os.path.exists(os.path.join(db, 'img', 'shared.png'))
+    assert not os.path.exists(os.path.join(db, 'img', 'own.png'))
+    db_helpers.delete_records([('boot', 2)])
+    assert not os.path.exists(os.path.join(db, 'img', 'shared.png'))
+    assert snapshot('boot') == {}
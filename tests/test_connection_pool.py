@@ -0,0 +1,70 @@
+import threading
+import pytest
+from code.db_helpers import ConnectionPool
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'))
+    with pool.writer() as conn:
+        conn.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER)')
+        conn.execute('INSERT INTO counter VALUES (1, 0)')
+    yield pool
+    pool.close()
+
+def counter(pool):
+    return pool.reader().execute('SELECT value FROM counter WHERE id = 1').fetchone()[0]
+
+def test_writers_are_serialized(pool):
+    """Чтение-изменение-запись из многих потоков не теряет обновлений и не ловит 'database is locked'."""
+    errors = []
+
+    def work():
+        try:
+            for _ in range(50):
+                with pool.writer() as conn:
+                    value = conn.execute('SELECT value FROM counter WHERE id = 1').fetchone()[0]
+                    conn.execute('UPDATE counter SET value = ? WHERE id = 1', (value + 1,))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == []
+    assert counter(pool) == 400
+    stats = pool.stats()
+    assert stats['writes'] == 401 and stats['write_wait_max_ms'] >= 0
+
+def test_nested_blocks_commit_once(pool):
+    with pool.writer() as outer:
+        outer.execute('UPDATE counter SET value = 1')
+        with pool.writer() as inner:
+            assert inner is outer
+            inner.execute('UPDATE counter SET value = value + 1')
+        # Внутренний блок не коммитит: читатель видит прежнее значение
+        assert counter(pool) == 0
+    assert counter(pool) == 2
+
+def test_inner_error_rolls_back_outer_block(pool):
+    with pytest.raises(ValueError):
+        with pool.writer() as outer:
+            outer.execute('UPDATE counter SET value = 10')
+            with pool.writer():
+                raise ValueError('boom')
+    assert counter(pool) == 0
+    # После отката писатель снова доступен
+    with pool.writer() as conn:
+        conn.execute('UPDATE counter SET value = 5')
+    assert counter(pool) == 5
+
+def test_database_is_in_wal_mode(pool):
+    assert pool.reader().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+def test_reader_is_reused_within_thread(pool):
+    first = pool.reader()
+    assert pool.reader() is first
+    other = []
+    thread = threading.Thread(target=lambda: other.append(pool.reader()))
+    thread.start(); thread.join()
+    assert other[0] is not first
+    assert pool.stats()['readers_created'] == 2
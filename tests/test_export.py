@@ -0,0 +1,100 @@
+import io
+import csv
+import time
+import zipfile
+import threading
+import http.client
+import pyarrow.parquet as pq
+import pytest
+from code import db_helpers, export, image_server
+
+ROWS = 11
+
+@pytest.fixture
+def records(db, make_table, monkeypatch):
+    monkeypatch.setattr(export, 'BASE_DIR', str(db))
+    # Маленькие порции, чтобы выгрузка пересекала границы пакетов и групп строк
+    monkeypatch.setattr(export, 'CSV_BATCH_ROWS', 3)
+    monkeypatch.setattr(export, 'PARQUET_ROW_GROUP', 4)
+    for i in range(3):
+        (db / 'img' / f'{i}.png').write_bytes(b'png %d' % i)
+    make_table('boot', [(f'boot/menu/{i}.png', f'img/{i % 3}.png' if i % 2 else None, 'menu,ui' if i % 3 else 'ui') for i in range(ROWS)])
+    make_table('cache', [('cache/menu/x.png', None, 'ui'), ('cache/other.png', None, 'ui')])
+    with db_helpers.get_write_connection() as conn:
+        conn.execute('ALTER TABLE boot ADD COLUMN extra TEXT')
+        conn.execute("UPDATE boot SET extra = 'e' || rowid")
+
+def exported(fmt, *args, **kwargs):
+    filename, content_type, chunks = export.open_export(export.register_export(fmt, *args, **kwargs))
+    return filename, content_type, b''.join(chunks)
+
+def csv_rows(data):
+    return list(csv.DictReader(io.StringIO(data.decode('utf-8-sig'))))
+
+def expected(text_query="", tag_list=()):
+    return [(row['source_table'], str(row['rowid']), row['Путь']) for row in db_helpers.search_public(text_query, list(tag_list))]
+
+@pytest.mark.parametrize('query, tags', [('menu', ()), ('', ('ui',)), ('menu', ('menu',)), ('nothing', ())])
+def test_csv_matches_search(records, query, tags):
+    filename, content_type, data = exported('csv', None, query, tags)
+    assert filename.endswith('.csv') and content_type.startswith('text/csv')
+    assert [(row['source_table'], row['rowid'], row['Путь']) for row in csv_rows(data)] == expected(query, tags)
+
+def test_parquet_matches_csv(records):
+    _, _, data = exported('parquet', None, 'menu')
+    table = pq.read_table(io.BytesIO(data))
+    assert pq.ParquetFile(io.BytesIO(data)).metadata.num_row_groups == 3
+    assert table.column_names == ['source_table', 'rowid', *db_helpers.RECORD_COLUMNS]
+    assert [tuple(row.values()) for row in table.to_pylist()] == [
+        (row['source_table'], int(row['rowid']), row['Путь'], row['Подфайл'] or None, row['Комментарий'] or None, row['Фото'] or None, row['tags'] or None)
+        for row in csv_rows(exported('csv', None, 'menu')[2])
+    ]
+
+def test_full_export_has_all_columns(records):
+    rows = csv_rows(exported('csv', 'boot', full=True)[2])
+    assert len(rows) == ROWS
+    assert rows[0]['extra'] == 'e1'
+    assert 'extra' not in csv_rows(exported('csv', 'boot')[2])[0]
+
+def test_zip_contains_data_and_each_photo_once(records):
+    filename, content_type, data = exported('csv', 'boot', with_photos=True)
+    assert filename.endswith('.zip') and content_type == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        names = archive.namelist()
+        assert names[1:] == ['img/1.png', 'img/0.png', 'img/2.png']
+        assert len(csv_rows(archive.read(names[0]))) == ROWS
+        assert archive.read('img/2.png') == b'png 2'
+
+def test_tokens_are_stable_signed_and_expire(records, monkeypatch):
+    token = export.register_export('csv', None, 'menu', ['ui', 'ui'])
+    assert token == export.register_export('csv', None, 'menu', ['ui'])
+    payload, signature = token.split('.')
+    assert export.open_export(f'{payload}x.{signature}') is None
+    assert export.open_export(export.register_export('csv', None, 'other')[:-3] + token[-3:]) is None
+    with pytest.raises(ValueError):
+        export.register_export('xlsx')
+    now = time.time()
+    monkeypatch.setattr(export.time, 'time', lambda: now + 2 * export.EXPORT_TTL_S + 1)
+    assert export.open_export(token) is None
+
+def test_inline_export_is_capped(records):
+    token = export.register_export('csv', None, '', ['ui'])
+    assert len(csv_rows(b''.join(export.open_export(token, max_rows=5)[2]))) == 5
+
+def test_image_server_streams_export(records):
+    server = image_server.create_image_server('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+        conn.request('GET', f"/export/{export.register_export('csv', None, 'menu')}")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.headers['Transfer-Encoding'] == 'chunked' and 'Content-Length' not in response.headers
+        assert "filename*=UTF-8''export-" in response.headers['Content-Disposition']
+        assert [(row['source_table'], row['rowid'], row['Путь']) for row in csv_rows(response.read())] == expected('menu')
+        conn.request('GET', '/export/forged.token')
+        assert conn.getresponse().status == 404
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
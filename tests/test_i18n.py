@@ -0,0 +1,68 @@
+import json
+import logging
+import types
+from pathlib import Path
+import pytest
+from code import i18n
+from code.i18n import Template
+
+class SessionState(dict):
+    """Минимальная замена st.session_state: словарь с доступом через атрибуты."""
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+@pytest.fixture
+def session(monkeypatch):
+    state = SessionState()
+    monkeypatch.setattr(i18n, 'st', types.SimpleNamespace(session_state=state))
+    return state
+
+@pytest.fixture
+def locales(tmp_path, monkeypatch):
+    """Пишет каталоги {язык: {ключ: текст}} во временный locales/ и компилирует их."""
+    def compile(catalogs, sources=''):
+        (tmp_path / 'locales').mkdir(exist_ok=True)
+        for language, texts in catalogs.items():
+            (tmp_path / 'locales' / f'{language}.json').write_text(json.dumps(texts, ensure_ascii=False), encoding='utf-8')
+        (tmp_path / 'Main_Page.py').write_text(sources, encoding='utf-8')
+        monkeypatch.setattr(i18n, 'BASE_DIR', str(tmp_path))
+        monkeypatch.setattr(i18n, 'LOCALES_DIR', str(tmp_path / 'locales'))
+        return i18n._compile_catalogs()
+    return compile
+
+def test_shipped_catalogs_are_complete():
+    en, ru = i18n.load_locale('en'), i18n.load_locale('ru')
+    raw = {language: json.loads((Path(i18n.LOCALES_DIR) / f'{language}.json').read_text(encoding='utf-8')) for language in ('en', 'ru')}
+    assert set(raw['en']) == set(raw['ru'])
+    assert i18n._used_keys() <= set(en)
+    assert {key for key in en if Template(en[key]).fields != Template(ru[key]).fields} == set()
+
+def test_missing_keys_fall_back_to_default_language(locales, caplog):
+    with caplog.at_level(logging.WARNING, logger=i18n.__name__):
+        catalogs = locales({'en': {'hello': 'Hello', 'count': '{n} items'}, 'ru': {'hello': 'Привет', 'only_ru': 'x'}}, "t('hello') t('nowhere')")
+    assert catalogs['ru']['count'].text == '{n} items'
+    assert catalogs['ru']['hello'].text == 'Привет'
+    messages = ' | '.join(record.getMessage() for record in caplog.records)
+    assert 'count' in messages and 'only_ru' in messages and 'nowhere' in messages
+
+def test_mismatched_fields_are_reported(locales, caplog):
+    with caplog.at_level(logging.WARNING, logger=i18n.__name__):
+        locales({'en': {'count': '{n} items'}, 'ru': {'count': '{total} шт.'}})
+    assert any('count' in record.getMessage() and 'ru' in record.getMessage() for record in caplog.records)
+
+@pytest.mark.parametrize('content', ['{not json', '["list"]', '{"key": 1}'])
+def test_invalid_catalog_fails_at_compile(locales, content, tmp_path):
+    (tmp_path / 'locales').mkdir()
+    (tmp_path / 'locales' / 'en.json').write_text(content, encoding='utf-8')
+    with pytest.raises(ValueError):
+        locales({})
+
+def test_t_uses_session_language(session, locales, monkeypatch):
+    monkeypatch.setattr(i18n, '_CATALOGS', locales({'en': {'hello': 'Hello', 'count': '{n:>3} items, {name!r}'}, 'ru': {'hello': 'Привет'}}))
+    assert i18n.t('hello') == 'Hello' and session.lang == 'en'
+    session.lang = 'ru'
+    assert i18n.t('hello') == 'Привет'
+    assert i18n.t('count', n=7, name='x') == "  7 items, 'x'"
+    assert i18n.t('unknown_key') == 'unknown_key'
+    session.lang = 'de'
+    assert i18n.t('hello') == 'hello'
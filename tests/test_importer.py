@@ -0,0 +1,107 @@
+import os
+from code import db_helpers, importer
+from code.db_helpers import PHOTO_STORE_TABLE
+
+TREE = ['boot/menu/a.png', 'boot/menu/b.png', 'boot/c.jpg', 'boot/3_unpacked.png', 'cache/x/y.webp', 'cache/readme.txt']
+
+def write_tree(root, paths, content=b'image'):
+    for rel_path in paths:
+        full_path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(content)
+
+def records():
+    conn = db_helpers.get_db_connection()
+    return sorted((table, row[0], row[1], row[2]) for table in db_helpers.get_table_names(conn) for row in conn.execute(f'SELECT "Путь", "Подфайл", "Фото" FROM "{table}"'))
+
+def test_import_is_idempotent(db):
+    root = os.path.join(db, 'img')
+    write_tree(root, TREE)
+    stats = importer.import_tree(root)
+    assert (stats['scanned'], stats['added'], stats['changed'], stats['removed']) == (5, 5, 0, 0)
+    imported = records()
+    assert ('boot', 'boot/3_unpacked.png', '3', 'img/boot/3_unpacked.png') in imported
+    assert len(imported) == 5
+
+    stats = importer.import_tree(root)
+    assert (stats['added'], stats['adopted'], stats['changed'], stats['removed']) == (0, 0, 0, 0)
+    assert records() == imported
+
+def test_reimport_applies_only_changes(db):
+    root = os.path.join(db, 'img')
+    write_tree(root, TREE)
+    importer.import_tree(root)
+    write_tree(root, ['boot/c.jpg'], b'changed image')
+    write_tree(root, ['cache/new.png'])
+    os.remove(os.path.join(root, 'boot/menu/a.png'))
+    stats = importer.import_tree(root)
+    assert (stats['added'], stats['changed'], stats['removed']) == (1, 1, 1)
+    paths = [path for _, path, _, _ in records()]
+    assert 'boot/menu/a.png' not in paths and 'cache/new.png' in paths
+    assert [r['Путь'] for r in db_helpers.search_public('menu')] == ['boot/menu/b.png']
+
+def test_existing_records_are_adopted(db, make_table):
+    root = os.path.join(db, 'img')
+    write_tree(root, ['boot/a.png', 'boot/b.png'])
+    make_table('boot', [('boot/a.png', 'img/boot/a.png', 'kept')])
+    stats = importer.import_tree(root)
+    assert (stats['added'], stats['adopted']) == (1, 1)
+    assert db_helpers.count_records('boot') == 2
+    assert db_helpers.get_record_tags('boot', 1) == ['kept']
+
+def test_deleted_records_stay_deleted(db):
+    root = os.path.join(db, 'img')
+    write_tree(root, TREE)
+    importer.import_tree(root)
+    keys = db_helpers.get_record_keys('boot')
+    db_helpers.delete_records(keys[:1])
+    assert importer.import_tree(root)['added'] == 0
+    assert db_helpers.count_records('boot') == len(keys) - 1
+
+def test_new_tables_get_all_triggers(db):
+    root = os.path.join(db, 'img')
+    write_tree(root, TREE)
+    importer.import_tree(root)
+    conn = db_helpers.get_db_connection()
+    triggers = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'boot'")}
+    assert {f'boot__{kind}_{event}' for kind in ('search', 'photo', 'tree') for event in ('ai', 'ad', 'au')} <= triggers
+    # Дерево каталогов заполнено той же транзакцией, что и записи
+    assert db_helpers.get_path_children('boot') == [('boot/menu', 2, 2)]
+    assert db_helpers.count_path_records('boot') == 4
+
+    with db_helpers.get_write_connection() as write_conn:
+        db_helpers.register_photo(write_conn.cursor(), 'img/.store/ab/abc.png', 'abc', 5)
+        write_conn.execute('UPDATE boot SET "Фото" = ? WHERE rowid = 1', ('img/.store/ab/abc.png',))
+    assert conn.execute(f'SELECT refcount FROM {PHOTO_STORE_TABLE}').fetchone()[0] == 1
+
+def test_dry_run_writes_nothing(db, monkeypatch):
+    root = os.path.join(db, 'img')
+    write_tree(root, TREE)
+    importer.import_tree(root)
+    write_tree(root, ['boot/new.png', 'fresh/a.png'])
+    db_helpers._get_pool().close()
+    with open(db_helpers.DB_FILE, 'rb') as f:
+        before = f.read()
+    stats = importer.import_tree(root, dry_run=True)
+    assert (stats['added'], stats['changed'], stats['removed']) == (2, 0, 0)
+    db_helpers._get_pool().close()
+    with open(db_helpers.DB_FILE, 'rb') as f:
+        assert f.read() == before
+    assert 'fresh' not in db_helpers.get_table_names()
+
+    # Без базы пробный запуск считает все файлы новыми и базу не создает
+    missing = os.path.join(db, 'missing.db')
+    monkeypatch.setattr(db_helpers, 'DB_FILE', missing)
+    assert importer.import_tree(root, dry_run=True)['added'] == 7
+    assert not os.path.exists(missing)
+
+def test_service_table_names_are_not_imported(db):
+    root = os.path.join(db, 'img')
+    write_tree(root, ['boot/a.png', 'users/evil.png', 'Tags/x.png', 'sqlite_stat1/y.png'])
+    stats = importer.import_tree(root)
+    assert stats['skipped_dirs'] == ['Tags', 'sqlite_stat1', 'users']
+    assert (stats['scanned'], stats['added']) == (1, 1)
+    assert db_helpers.get_table_names() == ['boot']
+    conn = db_helpers.get_db_connection()
+    assert [column[1] for column in conn.execute('PRAGMA table_info(users)')] == ['username', 'password', 'name', 'admin']
@@ -0,0 +1,58 @@
+import pytest
+from code import db_helpers
+from code.db_helpers import KeySet
+
+@pytest.fixture
+def tables(make_table):
+    # 7 + 0 + 5 записей: страницы пересекают границу таблиц и пропускают пустую
+    make_table('boot', [(f'boot/menu/{i}.png', None, 'ui') for i in range(7)])
+    make_table('cache', [])
+    make_table('render', [(f'render/menu/{i}.png', None, 'ui') for i in range(5)])
+
+def paths(rows):
+    return [row['Путь'] for row in rows]
+
+def test_keyset_page_crosses_tables():
+    keyset = KeySet({'b': [5, 1, 3], 'a': [2], 'c': [9, 8]})
+    order = ['a', 'b', 'c']
+    assert keyset.keys(order) == [('a', 2), ('b', 1), ('b', 3), ('b', 5), ('c', 8), ('c', 9)]
+    assert keyset.page(0, 2, order) == [('a', 2), ('b', 1)]
+    assert keyset.page(2, 3, order) == [('b', 3), ('b', 5), ('c', 8)]
+    assert keyset.page(5, 10, order) == [('c', 9)]
+    assert keyset.page(6, 10, order) == []
+    # Таблица вне порядка (например, удаленная) пропускается
+    assert keyset.page(0, 10, ['c', 'missing']) == [('c', 8), ('c', 9)]
+
+@pytest.mark.parametrize('per_page', [1, 4, 5, 7, 12, 50])
+def test_public_pages_match_full_result(tables, per_page):
+    full = paths(db_helpers.search_public('menu'))
+    assert len(full) == db_helpers.count_search_public('menu') == 12
+    pages = [paths(db_helpers.search_public_page('menu', page=page, per_page=per_page)) for page in range(1, 14)]
+    assert sum(pages, []) == full
+    assert all(len(page) == per_page for page in pages[:len(full) // per_page])
+
+def test_out_of_range_pages(tables):
+    assert paths(db_helpers.search_public_page('menu', page=0, per_page=5)) == paths(db_helpers.search_public_page('menu', page=1, per_page=5))
+    assert db_helpers.search_public_page('menu', page=4, per_page=5) == []
+    assert db_helpers.search_public_page('', [], page=1) == []
+    assert db_helpers.count_search_public('') == 0
+
+def test_admin_table_pages(tables):
+    rows = [paths(db_helpers.get_records_page('boot', page=page, per_page=3)) for page in (1, 2, 3, 4)]
+    assert rows == [[f'boot/menu/{i}.png' for i in range(0, 3)], [f'boot/menu/{i}.png' for i in range(3, 6)], ['boot/menu/6.png'], []]
+    assert db_helpers.count_records('boot') == 7
+    assert db_helpers.get_records_page('missing') == [] and db_helpers.count_records('missing') == 0
+
+def test_admin_search_and_global_pages(tables):
+    assert paths(db_helpers.get_records_page('render', 'menu/4', page=1, per_page=3)) == ['render/menu/4.png']
+    assert db_helpers.count_records('render', 'menu') == 5
+    global_pages = [paths(db_helpers.global_search_records_page('menu', page=page, per_page=5)) for page in (1, 2, 3)]
+    assert [len(page) for page in global_pages] == [5, 5, 2]
+    assert sum(global_pages, []) == paths(db_helpers.global_search_records('menu'))
+    assert db_helpers.count_global_search_records('menu') == 12
+
+def test_count_follows_deletes(tables):
+    assert db_helpers.count_records('boot') == 7
+    db_helpers.delete_records([('boot', 1), ('boot', 2)])
+    assert db_helpers.count_records('boot') == 5
+    assert paths(db_helpers.get_records_page('boot', page=2, per_page=3)) == ['boot/menu/5.png', 'boot/menu/6.png']
@@ -0,0 +1,51 @@
+from code import db_helpers
+from code.db_helpers import PATH_TREE_TABLE
+
+def tree_state():
+    """{(таблица, каталог): (родитель, записей, с фото)} по path_tree."""
+    conn = db_helpers.get_db_connection()
+    return {(row[0], row[1]): tuple(row[2:]) for row in conn.execute(f'SELECT source_table, dir, parent, records, photos FROM {PATH_TREE_TABLE}')}
+
+def expected_state():
+    """То же дерево, посчитанное по "Путь" и "Фото" таблиц записей."""
+    conn = db_helpers.get_db_connection()
+    tree = {}
+    for table in db_helpers.get_table_names(conn):
+        for path, photo in conn.execute(f'SELECT "Путь", "Фото" FROM "{table}"'):
+            for position, char in enumerate(path or ''):
+                if char != '/' or position == 0: continue
+                directory = path[:position]
+                parent, records, photos = tree.get((table, directory), (directory.rpartition('/')[0], 0, 0))
+                tree[(table, directory)] = (parent, records + 1, photos + bool(photo))
+    return tree
+
+def test_tree_follows_record_changes(make_table):
+    make_table('boot', [('boot/menu/a.png', 'img/boot/menu/a.png', None), ('boot/menu/deep/b.png', None, None), ('boot/c.png', '', None)])
+    make_table('cache', [('cache/x/y.png', None, None)])
+    assert tree_state() == expected_state()
+    assert tree_state()[('boot', 'boot/menu')] == ('boot', 2, 1)
+
+    with db_helpers.get_write_connection() as conn:
+        conn.execute('INSERT INTO boot ("Путь", "Фото") VALUES (?, ?)', ('boot/menu/new.png', 'img/x.png'))
+        conn.execute('UPDATE boot SET "Путь" = ? WHERE rowid = 2', ('boot/moved/b.png',))
+        conn.execute('UPDATE boot SET "Фото" = ? WHERE rowid = 3', ('img/boot/c.png',))
+        conn.execute('DELETE FROM cache WHERE rowid = 1')
+    assert tree_state() == expected_state()
+    assert ('boot', 'boot/menu/deep') not in tree_state()
+    assert not any(table == 'cache' for table, _ in tree_state())
+
+def test_tree_follows_bulk_operations(make_table):
+    make_table('boot', [(f'boot/d{i % 2}/{i}.png', f'img/{i}.png', None) for i in range(6)])
+    db_helpers.bulk_update_records([('boot', 1), ('boot', 2)], detach_photo=True)
+    assert tree_state() == expected_state()
+    db_helpers.delete_records([('boot', 3), ('boot', 5)])
+    assert tree_state() == expected_state()
+    assert db_helpers.get_path_children('boot') == [('boot/d0', 1, 0), ('boot/d1', 3, 2)]
+    assert db_helpers.count_path_records('boot/d1') == 3
+
+def test_tree_is_rebuilt_for_new_tables(make_table):
+    make_table('boot', [('boot/a/b/c.png', None, None)])
+    with db_helpers.get_write_connection() as conn:
+        conn.execute('DROP TABLE boot')
+    make_table('boot', [('boot/z.png', None, None)])
+    assert tree_state() == expected_state() == {('boot', 'boot'): ('', 1, 0)}
@@ -0,0 +1,88 @@
+import os
+import pytest
+from code import db_helpers, photo_index
+from code.photo_index import scan_img_tree, reconcile, find_orphans, find_dangling
+
+def write(root, path, data=b'png'):
+    full_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'wb') as f:
+        f.write(data)
+
+@pytest.fixture
+def img(db, monkeypatch):
+    monkeypatch.setattr(photo_index, 'BASE_DIR', str(db))
+    monkeypatch.setattr(photo_index, 'SKIP_DIRS', {os.path.join(db, 'img', '.store', 'tmp')})
+    return os.path.join(db, 'img')
+
+def scan(img):
+    return scan_img_tree(img, workers=4)
+
+def test_scan_matches_walk(img):
+    for i in range(30):
+        write(img, os.path.join(*[f'd{j}' for j in range(i % 6)], f'{i}.png'), b'x' * i)
+    write(img, '.store/tmp/upload.part')
+    write(img, '.store/ab/abcdef.png')
+    os.symlink(os.path.join(img, '0.png'), os.path.join(img, 'link.png'))
+    expected = {}
+    for directory, dirnames, names in os.walk(img):
+        dirnames[:] = [name for name in dirnames if os.path.join(directory, name) not in photo_index.SKIP_DIRS]
+        for name in names:
+            full_path = os.path.join(directory, name)
+            if os.path.islink(full_path): continue
+            stat = os.stat(full_path)
+            expected['img/' + os.path.relpath(full_path, img).replace(os.sep, '/')] = (stat.st_size, stat.st_mtime_ns)
+    files = scan(img)
+    assert files == expected
+    assert len(files) == 31 and 'img/.store/ab/abcdef.png' in files
+    assert files['img/d0/d1/d2/9.png'][0] == 9
+
+def test_missing_root_is_empty(img):
+    assert scan_img_tree(os.path.join(img, 'nowhere')) == {}
+
+def test_reconcile_is_incremental(img):
+    write(img, 'a.png')
+    write(img, 'b/b.png')
+    assert photo_index.last_scan_time() is None
+    assert reconcile(scan(img)) == (2, 0)
+    assert photo_index.last_scan_time() is not None
+    assert reconcile(scan(img)) == (0, 0)
+    write(img, 'a.png', b'changed')
+    os.remove(os.path.join(img, 'b', 'b.png'))
+    assert reconcile(scan(img)) == (1, 1)
+    assert db_helpers.get_photo_files(['img/a.png', 'img/b/b.png']) == {'img/a.png': scan(img)['img/a.png']}
+
+def test_file_created_after_scan_is_kept(img):
+    write(img, 'late.png')
+    reconcile(scan(img))
+    files = scan(img)
+    del files['img/late.png']            # обход каталога прошел раньше, чем файл появился снова
+    reconcile(files)
+    assert 'img/late.png' in db_helpers.get_photo_files(['img/late.png'])
+
+def test_index_answers_without_disk(img):
+    write(img, 'a.png')
+    reconcile(scan(img))
+    os.remove(os.path.join(img, 'a.png'))
+    # До следующей сверки индекс не знает об удалении мимо приложения
+    assert 'img/a.png' in db_helpers.get_photo_files(['img/a.png'])
+
+def test_orphans_and_dangling(img, make_table):
+    for name in ('used.png', 'shared.png', 'orphan.png', 'imported/original.png', 'deep/orphan.png'):
+        write(img, name)
+    make_table('boot', [('boot/a', 'img/used.png', None), ('boot/b', 'img/shared.png', None), ('boot/c', 'img/gone.png', None), ('boot/d', None, None), ('boot/e', '', None)])
+    make_table('cache', [('cache/a', 'img/shared.png', None), ('cache/b', 'img/also_gone.png', None)])
+    with db_helpers.get_write_connection() as conn:
+        db_helpers.ensure_import_manifest(conn)
+        conn.execute(f"INSERT INTO {db_helpers.IMPORT_MANIFEST_TABLE} VALUES ('imported/original.png', 'boot', 1, 3, 0)")
+    reconcile(scan(img))
+    assert find_orphans() == ['img/deep/orphan.png', 'img/orphan.png']
+    assert sorted(find_dangling()) == [('boot', 3, 'img/gone.png'), ('cache', 2, 'img/also_gone.png')]
+    write(img, 'gone.png')
+    reconcile(scan(img))
+    assert find_dangling() == [('cache', 2, 'img/also_gone.png')]
+
+def test_without_record_tables_everything_is_orphan(img):
+    write(img, 'a.png')
+    reconcile(scan(img))
+    assert find_orphans() == ['img/a.png'] and find_dangling() == []
@@ -0,0 +1,114 @@
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from PIL import Image, ImageDraw
+from PIL.PngImagePlugin import PngInfo
+from code import db_helpers, photo_optimizer
+from code.photo_optimizer import optimize_photos
+
+def screenshot(seed, mode='RGB'):
+    rng = random.Random(seed)
+    img = Image.new('RGB', (320, 200), 'white')
+    draw = ImageDraw.Draw(img)
+    for _ in range(10):
+        x, y = rng.randrange(280), rng.randrange(160)
+        draw.rectangle([x, y, x + rng.randint(10, 80), y + rng.randint(10, 60)], fill=tuple(rng.randrange(256) for _ in range(3)))
+    draw.text((10, 10), f'screen {seed}', fill='black')
+    return img.convert(mode)
+
+def pixels(path):
+    with Image.open(path) as img:
+        return img.convert('RGBA').tobytes()
+
+@pytest.fixture
+def corpus(db, make_table, monkeypatch):
+    """Несжатые PNG в img/ (compress_level=0) и записи, которые на них ссылаются."""
+    monkeypatch.setattr(photo_optimizer, 'BASE_DIR', str(db))
+    monkeypatch.setattr(photo_optimizer, 'TMP_DIR', os.path.join(db, 'img', '.store', 'tmp'))
+    monkeypatch.setattr(photo_optimizer, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    screenshot(1).save(db / 'img' / 'a.png', compress_level=0)
+    screenshot(2, 'RGBA').save(db / 'img' / 'b.png', compress_level=0)
+    screenshot(3, 'P').save(db / 'img' / 'c.png', compress_level=0)
+    make_table('boot', [('boot/a', 'img/a.png', None), ('boot/a2', 'img/a.png', None), ('boot/b', 'img/b.png', None), ('boot/none', None, None)])
+    make_table('cache', [('cache/c', 'img/c.png', None), ('cache/missing', 'img/missing.png', None)])
+    return db
+
+def photos(table):
+    return [row[0] for row in db_helpers.get_db_connection().execute(f'SELECT "Фото" FROM "{table}" ORDER BY rowid')]
+
+def test_converted_photos_are_pixel_identical(corpus):
+    before = {name: pixels(corpus / 'img' / name) for name in ('a.png', 'b.png', 'c.png')}
+    sizes = sum(os.path.getsize(corpus / 'img' / name) for name in before)
+    stats = optimize_photos(workers=2)
+    assert (stats['photos'], stats['converted'], stats['records']) == (3, 3, 4)
+    assert stats['bytes_before'] == sizes and 0 < stats['bytes_after'] < sizes * 0.5
+    boot, cache = photos('boot'), photos('cache')
+    assert boot[0] == boot[1] and boot[3] is None and cache[1] == 'img/missing.png'
+    for source, target in (('a.png', boot[0]), ('b.png', boot[2]), ('c.png', cache[0])):
+        assert target.startswith('img/.store/') and os.path.splitext(target)[1] in ('.webp', '.png')
+        assert pixels(corpus / target) == before[source]
+        assert not os.path.exists(corpus / 'img' / source)
+    assert os.listdir(photo_optimizer.TMP_DIR) == []
+
+def test_second_run_skips_processed(corpus):
+    optimize_photos()
+    stats = optimize_photos()
+    assert (stats['photos'], stats['converted'], stats['records']) == (0, 0, 0)
+
+def test_dry_run_changes_nothing(corpus):
+    files = sorted(os.listdir(corpus / 'img'))
+    stats = optimize_photos(dry_run=True)
+    assert stats['converted'] == 3 and stats['records'] == 0 and stats['bytes_saved'] > 0
+    assert photos('boot')[:3] == ['img/a.png', 'img/a.png', 'img/b.png']
+    assert sorted(os.listdir(corpus / 'img')) == files
+    assert not db_helpers.get_db_connection().execute("SELECT 1 FROM sqlite_master WHERE name = ?", (db_helpers.PHOTO_RECOMPRESS_TABLE,)).fetchone()
+
+def test_unsafe_or_small_gains_are_kept(corpus):
+    # gAMA, отличная от sRGB: браузер покажет WebP иначе, чем исходный PNG
+    chunks = PngInfo()
+    chunks.add(b'gAMA', (70000).to_bytes(4, 'big'))
+    screenshot(4).save(corpus / 'img' / 'gamma.png', compress_level=0, pnginfo=chunks)
+    noise = Image.frombytes('RGB', (200, 200), random.Random(5).randbytes(200 * 200 * 3))
+    noise.save(corpus / 'img' / 'noise.png', optimize=True)
+    with db_helpers.get_write_connection() as conn:
+        conn.executemany('INSERT INTO boot ("Путь", "Фото") VALUES (?, ?)', [('boot/gamma', 'img/gamma.png'), ('boot/noise', 'img/noise.png')])
+    stats = optimize_photos(target_format='png')
+    assert stats['kept'] == 2
+    assert photos('boot')[-2:] == ['img/gamma.png', 'img/noise.png']
+
+def test_import_tree_file_is_relinked(corpus):
+    with db_helpers.get_write_connection() as conn:
+        db_helpers.ensure_import_manifest(conn)
+        stat = os.stat(corpus / 'img' / 'b.png')
+        conn.execute(f'INSERT INTO {db_helpers.IMPORT_MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?)', ('b.png', 'boot', 3, stat.st_size, stat.st_mtime_ns))
+    optimize_photos(target_format='webp')
+    target = photos('boot')[2]
+    assert target.endswith('.webp')
+    # Вместо исходного PNG в дереве импорта — жесткая ссылка на объект хранилища с новым расширением
+    assert not os.path.exists(corpus / 'img' / 'b.png')
+    assert os.path.samefile(corpus / 'img' / 'b.webp', corpus / target)
+    manifest = db_helpers.get_db_connection().execute(f'SELECT path, size FROM {db_helpers.IMPORT_MANIFEST_TABLE}').fetchall()
+    assert [tuple(row) for row in manifest] == [('b.webp', os.path.getsize(corpus / target))]
+
+def test_failed_batch_rolls_back(corpus, monkeypatch):
+    bump = photo_optimizer.bump_data_generation
+    def fail(conn): raise RuntimeError('interrupted')
+    monkeypatch.setattr(photo_optimizer, 'bump_data_generation', fail)
+    with pytest.raises(RuntimeError):
+        optimize_photos()
+    assert photos('boot')[:3] == ['img/a.png', 'img/a.png', 'img/b.png']
+    assert all(os.path.exists(corpus / 'img' / name) for name in ('a.png', 'b.png', 'c.png'))
+    assert os.listdir(photo_optimizer.TMP_DIR) == []
+    monkeypatch.setattr(photo_optimizer, 'bump_data_generation', bump)
+    assert optimize_photos()['converted'] == 3
+
+def test_stale_tmp_files_are_removed(corpus):
+    os.makedirs(photo_optimizer.TMP_DIR, exist_ok=True)
+    ours, fresh, old = (os.path.join(photo_optimizer.TMP_DIR, name) for name in (photo_optimizer.TMP_PREFIX + 'x', 'upload-new', 'upload-old'))
+    for path in (ours, fresh, old):
+        open(path, 'wb').close()
+    os.utime(old, (time.time() - photo_optimizer.STALE_TMP_AGE_S - 60,) * 2)
+    assert photo_optimizer._clear_stale_tmp() == 2
+    assert os.listdir(photo_optimizer.TMP_DIR) == ['upload-new']
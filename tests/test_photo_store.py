@@ -0,0 +1,71 @@
+import io
+import os
+from code import db_helpers, importer, photo_store
+from code.db_helpers import PHOTO_STORE_TABLE
+
+def refcounts():
+    """{объект хранилища: счетчик} по photo_store."""
+    return dict(db_helpers.get_db_connection().execute(f'SELECT path, refcount FROM {PHOTO_STORE_TABLE}').fetchall())
+
+def expected_refcounts():
+    """{объект хранилища: число ссылок} по колонке "Фото" таблиц записей."""
+    conn = db_helpers.get_db_connection()
+    counts = dict.fromkeys(refcounts(), 0)
+    for table in db_helpers.get_table_names(conn):
+        for (photo,) in conn.execute(f'SELECT "Фото" FROM "{table}"'):
+            if photo in counts: counts[photo] += 1
+    return counts
+
+def upload(table, rowid, data, filename='shot.png'):
+    return photo_store.save_uploaded_photo(table, rowid, '', '', io.BytesIO(data), filename)
+
+def test_uploads_share_one_object(db, make_table):
+    make_table('boot', [(f'boot/{i}.png', None, None) for i in range(3)])
+    first = upload('boot', 1, b'same bytes')
+    second = upload('boot', 2, b'same bytes', 'other.PNG')
+    assert first == second and first.startswith('img/.store/') and first.endswith('.png')
+    assert refcounts() == expected_refcounts() == {first: 2}
+    assert os.listdir(photo_store.TMP_DIR) == []
+
+def test_refcounts_follow_updates_and_deletes(db, make_table):
+    make_table('boot', [(f'boot/{i}.png', None, None) for i in range(4)])
+    make_table('cache', [('cache/0.png', None, None)])
+    shared = upload('boot', 1, b'shared')
+    upload('boot', 2, b'shared')
+    upload('cache', 1, b'shared')
+    single = upload('boot', 3, b'single')
+    assert refcounts() == expected_refcounts() == {shared: 3, single: 1}
+
+    # Замена фото освобождает старый объект вместе с файлом
+    replacement = upload('boot', 3, b'replacement')
+    assert refcounts() == expected_refcounts() == {shared: 3, replacement: 1}
+    assert not os.path.exists(os.path.join(db, single))
+
+    db_helpers.bulk_update_records([('boot', 1), ('boot', 2)], detach_photo=True)
+    assert refcounts() == expected_refcounts() == {shared: 1, replacement: 1}
+    db_helpers.delete_records([('cache', 1), ('boot', 3)])
+    assert refcounts() == expected_refcounts() == {}
+    assert not os.path.exists(os.path.join(db, shared))
+
+def test_dedupe_before_import_does_not_duplicate(db):
+    for rel_path in ('boot/a.png', 'boot/sub/b.png'):
+        os.makedirs(os.path.join(db, 'img', os.path.dirname(rel_path)), exist_ok=True)
+        with open(os.path.join(db, 'img', rel_path), 'wb') as f:
+            f.write(b'duplicate content')
+    with db_helpers.get_write_connection() as conn:
+        conn.execute('CREATE TABLE boot ("Путь" TEXT, "Подфайл" TEXT, "Комментарий" TEXT, "Фото" TEXT, "tags" TEXT)')
+        conn.executemany('INSERT INTO boot ("Путь", "Фото") VALUES (?, ?)', [('boot/a.png', 'img/boot/a.png'), ('boot/sub/b.png', 'img/boot/sub/b.png')])
+    db_helpers.init_db()
+
+    stats = photo_store.dedupe_photos()
+    assert (stats['files'], stats['unique'], stats['records']) == (2, 1, 2)
+    assert list(refcounts().values()) == [2]
+    assert importer.import_tree(os.path.join(db, 'img'))['added'] == 0
+    assert db_helpers.count_records('boot') == 2
+
+    # Удаление записи удаляет и жесткую ссылку в дереве, иначе место не освободится
+    db_helpers.delete_records([('boot', 1)])
+    assert not os.path.exists(os.path.join(db, 'img', 'boot', 'a.png'))
+    db_helpers.delete_records([('boot', 2)])
+    assert not os.path.exists(os.path.join(db, 'img', 'boot', 'sub', 'b.png'))
+    assert refcounts() == {}
@@ -0,0 +1,78 @@
+import os
+import threading
+import types
+import pytest
+from PIL import Image
+from code import profiling, thumbnails
+from code.thumbnails import LIST_THUMB_SIZE, EDIT_THUMB_SIZE
+
+@pytest.fixture
+def gated(db, monkeypatch):
+    """Три фото; подготовка миниатюр ждет gate, вызовы записываются в calls."""
+    monkeypatch.setattr(thumbnails, 'BASE_DIR', str(db))
+    monkeypatch.setattr(thumbnails, 'THUMB_DIR', os.path.join(db, 'thumbs'))
+    for name in ('a', 'b', 'c'):
+        Image.new('RGB', (60, 40), 'teal').save(os.path.join(db, 'img', f'{name}.png'))
+    gate, calls = threading.Event(), []
+    prepare = thumbnails._prepare_thumbnail
+    def slow_prepare(path, size, file_info):
+        calls.append((path, size))
+        gate.wait(5)
+        return prepare(path, size, file_info)
+    monkeypatch.setattr(thumbnails, '_prepare_thumbnail', slow_prepare)
+    yield types.SimpleNamespace(gate=gate, calls=calls)
+    gate.set()
+
+def wait_idle():
+    """Ждет снятия задач из _inflight: колбэк завершения выполняется после пробуждения ожидающих result()."""
+    for _ in range(500):
+        if not thumbnails._inflight: return True
+        threading.Event().wait(0.01)
+    return False
+
+def test_duplicates_and_empty_paths_are_collapsed(gated):
+    futures = thumbnails.prefetch_thumbnails(['img/a.png', '', None, 'img/a.png', 'img/b.png'])
+    assert list(futures) == ['img/a.png', 'img/b.png']
+    gated.gate.set()
+    assert all(future.result(5) for future in futures.values())
+    assert sorted(gated.calls) == [('img/a.png', LIST_THUMB_SIZE), ('img/b.png', LIST_THUMB_SIZE)]
+
+def test_inflight_work_is_shared_between_reruns(gated):
+    # Текущая страница и упреждающая загрузка следующей пересекаются по фото
+    page = thumbnails.prefetch_thumbnails(['img/a.png', 'img/b.png'])
+    following = thumbnails.prefetch_thumbnails(['img/b.png', 'img/c.png'])
+    assert following['img/b.png'] is page['img/b.png']
+    other_size = thumbnails.prefetch_thumbnails(['img/b.png'], EDIT_THUMB_SIZE)
+    assert other_size['img/b.png'] is not page['img/b.png']
+    gated.gate.set()
+    for future in [*page.values(), *following.values(), *other_size.values()]:
+        future.result(5)
+    assert len(gated.calls) == 4
+    assert wait_idle()
+
+def test_finished_keys_are_not_resubmitted_after_forget(gated):
+    gated.gate.set()
+    first = thumbnails.prefetch_thumbnails(['img/a.png'])['img/a.png']
+    key = first.result(5)
+    assert wait_idle()
+    second = thumbnails.prefetch_thumbnails(['img/a.png'])['img/a.png']
+    # Новая задача после завершения первой, но миниатюра уже на диске
+    assert second is not first and second.result(5) == key
+    assert os.path.exists(thumbnails._thumbnail_file(key))
+
+def test_missing_photos_do_not_reach_the_pool(gated):
+    futures = thumbnails.prefetch_thumbnails(['img/missing.png'])
+    assert futures['img/missing.png'].done() and futures['img/missing.png'].result() is None
+    assert gated.calls == []
+
+def test_fragment_reruns_are_profiled_separately(monkeypatch):
+    started = []
+    monkeypatch.setattr(profiling, 'begin_run', started.append)
+    ctx = types.SimpleNamespace(fragment_ids_this_run=[])
+    monkeypatch.setattr(profiling, 'get_script_run_ctx', lambda: ctx)
+    profiling.begin_fragment_run('Main_Page')
+    ctx.fragment_ids_this_run = ['results']
+    profiling.begin_fragment_run('Main_Page')
+    monkeypatch.setattr(profiling, 'get_script_run_ctx', lambda: None)
+    profiling.begin_fragment_run('Main_Page')
+    assert started == ['Main_Page']
@@ -0,0 +1,35 @@
+import pytest
+from code import db_helpers, profiling
+
+@pytest.fixture
+def profiler(monkeypatch):
+    monkeypatch.setattr(profiling, '_enabled', True)
+    profiling.clear()
+    yield profiling
+    profiling._local.run = None
+    profiling.clear()
+
+def test_run_events_are_capped(profiler, monkeypatch):
+    monkeypatch.setattr(profiling, 'MAX_EVENTS', 10)
+    profiler.begin_run('Main_Page')
+    for i in range(25):
+        with profiler.stage(f'step{i}'):
+            pass
+    run = profiler._runs[-1]
+    assert len(run['events']) == 10
+    assert [event['name'] for event in run['events']][-1] == 'step24'
+
+def test_real_caches_are_counted(profiler, make_table):
+    make_table('boot', [('boot/menu/a.png', None, 'menu')])
+    db_helpers._result_cache.clear()
+    profiler.clear()
+    db_helpers.search_public('menu')
+    db_helpers.search_public('menu')
+    stats = profiler.get_cache_stats()
+    assert stats['result_cache']['hits'] >= 1 and stats['result_cache']['misses'] >= 1
+    assert stats['schema_catalog']['calls'] >= 1
+
+def test_nothing_is_counted_when_disabled(monkeypatch):
+    monkeypatch.setattr(profiling, '_enabled', False)
+    profiling.count_cache('probe', True)
+    assert 'probe' not in profiling.get_cache_stats()
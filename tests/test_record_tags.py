@@ -0,0 +1,49 @@
+from code import db_helpers
+from code.db_helpers import RECORD_TAGS_TABLE
+
+def tags_state():
+    """(таблица, rowid, тег) по record_tags."""
+    conn = db_helpers.get_db_connection()
+    return sorted(tuple(row) for row in conn.execute(f'SELECT rt.source_table, rt.record_rowid, t.name FROM {RECORD_TAGS_TABLE} rt JOIN tags t ON t.id = rt.tag_id'))
+
+def expected_state():
+    """(таблица, rowid, тег) по колонке tags таблиц записей."""
+    conn = db_helpers.get_db_connection()
+    return sorted({
+        (table, rowid, name)
+        for table in db_helpers.get_table_names(conn)
+        for rowid, tags in conn.execute(f'SELECT rowid, tags FROM "{table}"')
+        for name in db_helpers._split_tags(tags)
+    })
+
+def tag_id(name):
+    return db_helpers.get_db_connection().execute('SELECT id FROM tags WHERE name = ?', (name,)).fetchone()[0]
+
+def test_existing_tags_are_migrated(make_table):
+    make_table('boot', [('boot/a.png', None, 'menu, ui'), ('boot/b.png', None, ''), ('boot/c.png', None, 'ui')])
+    assert tags_state() == expected_state() == [('boot', 1, 'menu'), ('boot', 1, 'ui'), ('boot', 3, 'ui')]
+
+def test_update_record(make_table):
+    make_table('boot', [('boot/a.png', None, 'menu')])
+    db_helpers.update_record('boot', 1, 'comment', 'ui, ui, dialog', None)
+    assert tags_state() == expected_state() == [('boot', 1, 'dialog'), ('boot', 1, 'ui')]
+    assert db_helpers.get_record_tags('boot', 1) == ['dialog', 'ui']
+
+def test_tag_rename_and_delete(make_table):
+    make_table('boot', [('boot/a.png', None, 'menu,ui'), ('boot/b.png', None, 'menu')])
+    make_table('cache', [('cache/a.png', None, 'menu')])
+    db_helpers.update_tag(tag_id('menu'), 'main_menu', '')
+    assert tags_state() == expected_state()
+    assert {name for _, _, name in expected_state()} == {'main_menu', 'ui'}
+    db_helpers.delete_tag(tag_id('main_menu'))
+    assert tags_state() == expected_state() == [('boot', 1, 'ui')]
+
+def test_bulk_update_and_delete(make_table):
+    make_table('boot', [(f'boot/{i}.png', None, 'menu') for i in range(4)])
+    make_table('cache', [(f'cache/{i}.png', None, 'ui') for i in range(2)])
+    keys = [('boot', 1), ('boot', 2), ('cache', 1)]
+    assert db_helpers.bulk_update_records(keys, add_tags=['new'], remove_tags=['menu']) == 3
+    assert tags_state() == expected_state()
+    assert [key for key in tags_state() if key[2] == 'new'] == [('boot', 1, 'new'), ('boot', 2, 'new'), ('cache', 1, 'new')]
+    db_helpers.delete_records([('boot', 1), ('cache', 2)])
+    assert tags_state() == expected_state()
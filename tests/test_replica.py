@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import threading
+import time
+import pytest
+from code import replica
+from code.db_helpers import ConnectionPool
+
+@pytest.fixture
+def primary(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'app.db'), str(tmp_path / 'replicas' / 'replica.db'))
+    with pool.writer() as conn:
+        conn.execute('CREATE TABLE items (name TEXT)')
+        conn.execute("INSERT INTO items VALUES ('first')")
+    yield pool
+    pool.close()
+
+def publish(pool):
+    source = sqlite3.connect(pool.db_file)
+    try:
+        replica.publish_snapshot(source, pool.replica_file)
+    finally:
+        source.close()
+
+def names(conn):
+    return [row[0] for row in conn.execute('SELECT name FROM items ORDER BY rowid')]
+
+def add(pool, name):
+    with pool.writer() as conn:
+        conn.execute('INSERT INTO items VALUES (?)', (name,))
+
+def test_snapshot_is_standalone_file(primary):
+    publish(primary)
+    replica_dir = os.path.dirname(primary.replica_file)
+    assert os.listdir(replica_dir) == ['replica.db']
+    conn = sqlite3.connect(f'file:{primary.replica_file}?mode=ro&immutable=1', uri=True)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    assert names(conn) == ['first']
+    conn.close()
+
+def test_reads_fall_back_to_primary_until_published(primary):
+    primary.use_replica(True)
+    assert names(primary.reader()) == ['first']
+    assert primary.stats()['replicas_opened'] == 0
+
+def test_new_snapshot_is_picked_up_on_next_run(primary):
+    publish(primary)
+    primary.use_replica(True)
+    old = primary.reader()
+    add(primary, 'second')
+    assert names(old) == ['first']                       # снимок не видит новых записей
+    publish(primary)
+    assert primary.reader() is old and names(old) == ['first']   # до начала следующего запуска
+    primary.use_replica(True)
+    assert names(primary.reader()) == ['first', 'second']
+    assert primary.stats()['replicas_opened'] == 2
+    primary.use_replica(False)
+    add(primary, 'third')
+    assert names(primary.reader()) == ['first', 'second', 'third']
+
+def test_replica_connections_are_reused_per_snapshot(primary):
+    publish(primary)
+    def run():
+        primary.use_replica(True)
+        names(primary.reader())
+        primary.use_replica(False)
+    for _ in range(3):
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+    stats = primary.stats()
+    assert (stats['replica_checkouts'], stats['replicas_opened']) == (3, 1)
+
+def test_failed_publish_keeps_previous_snapshot(primary, monkeypatch):
+    publish(primary)
+    add(primary, 'second')
+    def broken_replace(src, dst): raise OSError('file in use')
+    monkeypatch.setattr(replica.os, 'replace', broken_replace)
+    with pytest.raises(OSError):
+        publish(primary)
+    assert os.listdir(os.path.dirname(primary.replica_file)) == ['replica.db']
+    primary.use_replica(True)
+    assert names(primary.reader()) == ['first']
+
+def test_publisher_follows_primary_changes(primary):
+    stop = threading.Event()
+    thread = threading.Thread(target=replica.run_publisher, args=(primary.db_file, primary.replica_file, 0.02, stop))
+    thread.start()
+    try:
+        add(primary, 'second')
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            primary.use_replica(True)
+            if names(primary.reader()) == ['first', 'second'] and primary.stats()['replicas_opened']:
+                break
+            time.sleep(0.02)
+        assert primary.stats()['replicas_opened'] and names(primary.reader()) == ['first', 'second']
+    finally:
+        stop.set()
+        thread.join(5)
+    assert not thread.is_alive()
+
+def test_cli_publishes_once(primary, tmp_path):
+    assert replica.main(['--db', primary.db_file, '--replica-dir', str(tmp_path / 'cli'), '--once']) == 0
+    assert os.path.exists(tmp_path / 'cli' / 'replica.db')
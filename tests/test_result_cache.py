@@ -0,0 +1,63 @@
+import sqlite3
+from code import db_helpers
+from code.db_helpers import ResultCache
+
+def test_lru_by_bytes():
+    cache = ResultCache(max_bytes=100)
+    cache.put('a', 1, 'A', 40)
+    cache.put('b', 1, 'B', 40)
+    assert cache.get('a', 1) == 'A'          # a становится самым свежим
+    cache.put('c', 1, 'C', 40)               # вытесняется b
+    assert (cache.get('a', 1), cache.get('b', 1), cache.get('c', 1)) == ('A', None, 'C')
+    cache.put('huge', 1, 'H', 101)           # больше всего кэша — не кладется
+    assert cache.get('huge', 1) is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (2, 80, 1)
+
+def test_other_generation_is_a_miss():
+    cache = ResultCache(max_bytes=100)
+    cache.put('key', 1, 'old', 10)
+    assert cache.get('key', 2) is None
+    cache.put('key', 2, 'new', 10)
+    assert cache.get('key', 2) == 'new' and cache.stats()['bytes'] == 10
+
+def external_write(*statements, bump=True):
+    """Запись из другого соединения (как из другого процесса приложения)."""
+    conn = sqlite3.connect(db_helpers.DB_FILE)
+    try:
+        for sql in statements:
+            conn.execute(sql)
+        if bump:
+            db_helpers.bump_data_generation(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_app_writes_invalidate_results(make_table):
+    make_table('boot', [('boot/menu/a.png', None, 'ui'), ('boot/menu/b.png', None, '')])
+    assert db_helpers.count_search_public('', ['ui']) == 1
+    db_helpers.update_record('boot', 2, '', 'ui', None)
+    assert db_helpers.count_search_public('', ['ui']) == 2
+    db_helpers.delete_records([('boot', 1)])
+    assert [row['Путь'] for row in db_helpers.search_public('menu')] == ['boot/menu/b.png']
+
+def test_external_writes_are_seen_after_generation_bump(make_table):
+    make_table('boot', [('boot/menu/a.png', None, None)])
+    assert db_helpers.count_search_public('menu') == 1
+    hits = db_helpers.get_result_cache_stats()['hits']
+    assert db_helpers.count_search_public('menu') == 1
+    assert db_helpers.get_result_cache_stats()['hits'] == hits + 1
+
+    external_write('INSERT INTO boot ("Путь") VALUES (\'boot/menu/b.png\')')
+    assert db_helpers.count_search_public('menu') == 2
+
+def test_results_are_reused_without_bump(make_table):
+    make_table('boot', [('boot/menu/a.png', None, None)])
+    generation = db_helpers.get_data_version()[0]
+    assert db_helpers.count_search_public('menu') == 1
+    # Запись мимо bump_data_generation не видна: кэш действительно отвечает без запроса
+    external_write('INSERT INTO boot ("Путь") VALUES (\'boot/menu/b.png\')', bump=False)
+    assert db_helpers.count_search_public('menu') == 1
+    external_write()
+    assert db_helpers.get_data_version()[0] == generation + 1
+    assert db_helpers.count_search_public('menu') == 2
@@ -0,0 +1,66 @@
+import sqlite3
+import pytest
+from code import db_helpers
+
+@pytest.fixture
+def loads(db, monkeypatch):
+    """Счетчик перестроек каталога."""
+    calls = []
+    load = db_helpers._load_schema_catalog
+    monkeypatch.setattr(db_helpers, '_load_schema_catalog', lambda conn, version: calls.append(version) or load(conn, version))
+    return calls
+
+def external_ddl(sql):
+    """DDL из другого соединения, как из другого процесса."""
+    conn = sqlite3.connect(db_helpers.DB_FILE)
+    try:
+        conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_catalog_is_reused_until_schema_changes(loads, make_table):
+    make_table('boot', [('boot/a.png', None, None)])
+    first = db_helpers.get_schema_catalog()
+    loads.clear()
+    for _ in range(5):
+        assert db_helpers.get_schema_catalog() is first
+    assert loads == []
+
+    external_ddl('CREATE TABLE cache ("Путь" TEXT)')
+    second = db_helpers.get_schema_catalog()
+    assert loads == [second.version]
+    assert second is not first and second.version > first.version
+    assert second.tables == ['boot', 'cache']
+
+def test_columns_follow_alter_and_drop(db):
+    external_ddl('CREATE TABLE partial ("Путь" TEXT)')
+    catalog = db_helpers.get_schema_catalog()
+    assert not catalog.has_column('partial', 'Фото')
+    assert 'NULL AS "Фото"' in catalog.public_columns['partial']
+
+    external_ddl('ALTER TABLE partial ADD COLUMN "Фото" TEXT')
+    catalog = db_helpers.get_schema_catalog()
+    assert catalog.has_column('partial', 'Фото')
+    assert 'NULL AS "Фото"' not in catalog.public_columns['partial']
+
+    external_ddl('DROP TABLE partial')
+    assert 'partial' not in db_helpers.get_table_names()
+
+def test_non_record_and_service_tables_are_skipped(db):
+    external_ddl('CREATE TABLE notes (body TEXT)')
+    catalog = db_helpers.get_schema_catalog()
+    assert catalog.tables == []
+    assert catalog.skipped == ['notes']
+    assert not set(catalog.tables) & set(db_helpers.SERVICE_TABLES)
+
+def test_catalog_is_per_database(db, tmp_path, monkeypatch, make_table):
+    make_table('boot')
+    assert db_helpers.get_table_names() == ['boot']
+    other = tmp_path / 'other.db'
+    external = sqlite3.connect(other)
+    external.execute('CREATE TABLE render ("Путь" TEXT)')
+    external.commit(); external.close()
+    # Другая база с тем же schema_version не должна получить чужой каталог
+    monkeypatch.setattr(db_helpers, 'DB_FILE', str(other))
+    assert db_helpers.get_table_names() == ['render']
@@ -0,0 +1,55 @@
+from code import db_helpers
+from code.db_helpers import SEARCH_INDEX_TABLE, SEARCH_KEYS_TABLE
+
+def index_state():
+    """(таблица, rowid, путь) по search_keys + search_index."""
+    conn = db_helpers.get_db_connection()
+    return sorted(tuple(row) for row in conn.execute(f'''
+        SELECT k.source_table, k.record_rowid, s.path FROM {SEARCH_KEYS_TABLE} k JOIN {SEARCH_INDEX_TABLE} s ON s.rowid = k.id
+    '''))
+
+def expected_state():
+    """(таблица, rowid, путь) по самим таблицам записей."""
+    conn = db_helpers.get_db_connection()
+    return sorted((table, row[0], row[1]) for table in db_helpers.get_table_names(conn) for row in conn.execute(f'SELECT rowid, "Путь" FROM "{table}"'))
+
+def assert_index_consistent():
+    conn = db_helpers.get_db_connection()
+    assert index_state() == expected_state()
+    # Ни ключей без строки индекса, ни строк индекса без ключа
+    assert conn.execute(f'SELECT COUNT(*) FROM {SEARCH_KEYS_TABLE}').fetchone()[0] == len(expected_state())
+    assert conn.execute(f'SELECT COUNT(*) FROM {SEARCH_INDEX_TABLE}').fetchone()[0] == len(expected_state())
+
+def test_existing_rows_are_indexed(make_table):
+    make_table('boot', [('boot/menu/a.png', None, None), ('boot/b.png', None, None)])
+    assert_index_consistent()
+    assert [r['Путь'] for r in db_helpers.search_public('menu')] == ['boot/menu/a.png']
+
+def test_insert_update_delete(make_table):
+    make_table('boot', [('boot/a.png', None, None)])
+    with db_helpers.get_write_connection() as conn:
+        conn.execute('INSERT INTO boot ("Путь") VALUES (?)', ('boot/new/b.png',))
+    assert_index_consistent()
+    with db_helpers.get_write_connection() as conn:
+        conn.execute('UPDATE boot SET "Путь" = ? WHERE rowid = 1', ('boot/renamed.png',))
+    assert_index_consistent()
+    with db_helpers.get_write_connection() as conn:
+        conn.execute('DELETE FROM boot WHERE rowid = 2')
+    assert_index_consistent()
+    assert [r['Путь'] for r in db_helpers.search_public('renamed')] == ['boot/renamed.png']
+    assert db_helpers.search_public('new') == []
+
+def test_bulk_delete_across_tables(make_table):
+    make_table('boot', [(f'boot/{i}.png', None, None) for i in range(5)])
+    make_table('cache', [(f'cache/{i}.png', None, None) for i in range(5)])
+    assert db_helpers.delete_records([('boot', 1), ('boot', 3), ('cache', 2)]) == 3
+    assert_index_consistent()
+    assert db_helpers.count_search_public('png') == 7
+
+def test_recreated_table_drops_stale_keys(make_table):
+    make_table('boot', [('boot/old.png', None, None)])
+    with db_helpers.get_write_connection() as conn:
+        conn.execute('DROP TABLE boot')
+    make_table('boot', [('boot/fresh.png', None, None)])
+    assert_index_consistent()
+    assert db_helpers.search_public('old') == []
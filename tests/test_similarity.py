@@ -0,0 +1,78 @@
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from code import db_helpers, similarity
+from code.similarity import HashIndex, dhash, _to_signed
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def test_index_distances_match_popcount():
+    rng = random.Random(14)
+    values = [rng.getrandbits(64) for _ in range(200)] + [0, (1 << 64) - 1, 1 << 63]
+    index = HashIndex({'boot': [(rowid, _to_signed(value)) for rowid, value in enumerate(values, 1)]})
+    query = values[0] ^ 0b1011  # расстояние 3 до первой записи
+    hits = index.search(query, max_distance=64, limit=len(values))
+    assert [distance for _, _, distance in hits] == sorted(hamming(query, value) for value in values)
+    assert hits[0] == ('boot', 1, 3)
+    assert all(distance == hamming(query, values[rowid - 1]) for _, rowid, distance in hits)
+
+def test_index_limit_threshold_and_exclude():
+    index = HashIndex({'a': [(1, 0b0), (2, 0b1)], 'b': [(7, 0b11), (8, 0b1111)]})
+    assert index.search(0, max_distance=2) == [('a', 1, 0), ('a', 2, 1), ('b', 7, 2)]
+    assert index.search(0, max_distance=2, limit=2, exclude=('a', 1)) == [('a', 2, 1), ('b', 7, 2)]
+    assert HashIndex({}).search(0) == []
+
+def test_signed_storage_roundtrip():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = _to_signed(value)
+        assert -(1 << 63) <= signed < (1 << 63)
+        assert np.array([signed], dtype=np.int64).view(np.uint64)[0] == value
+
+def screenshot(path, seed, size=(640, 360)):
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rng.randrange(size[0] - 60), rng.randrange(size[1] - 40)
+        draw.rectangle([x0, y0, x0 + rng.randint(40, 200), y0 + rng.randint(20, 120)], fill=tuple(rng.randrange(256) for _ in range(3)))
+    img.save(path)
+    return img
+
+def test_dhash_tolerates_rescale_and_recompression(tmp_path):
+    img = screenshot(tmp_path / 'a.png', seed=1)
+    img.resize((320, 180)).save(tmp_path / 'small.png')
+    img.save(tmp_path / 'lossy.jpg', quality=60)
+    screenshot(tmp_path / 'other.png', seed=2)
+    original = dhash(tmp_path / 'a.png')
+    assert dhash(tmp_path / 'a.png') == original
+    assert hamming(original, dhash(tmp_path / 'small.png')) <= 4
+    assert hamming(original, dhash(tmp_path / 'lossy.jpg')) <= 4
+    assert hamming(original, dhash(tmp_path / 'other.png')) > similarity.DEFAULT_MAX_DISTANCE
+
+@pytest.fixture
+def photos(db, make_table, monkeypatch):
+    monkeypatch.setattr(similarity, 'BASE_DIR', str(db))
+    # Пул процессов заменен потоками: хэши считаются в этом процессе с подмененным BASE_DIR
+    monkeypatch.setattr(similarity, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    img = screenshot(os.path.join(db, 'img', 'a.png'), seed=1)
+    img.resize((320, 180)).save(os.path.join(db, 'img', 'a_small.png'))
+    screenshot(os.path.join(db, 'img', 'b.png'), seed=2)
+    make_table('boot', [('boot/a.png', 'img/a.png', None), ('boot/a_small.png', 'img/a_small.png', None), ('boot/b.png', 'img/b.png', None), ('boot/none.png', None, None)])
+
+def test_build_is_incremental_and_search_finds_copies(photos, db):
+    assert similarity.build_photo_hashes(workers=1)['hashed'] == 3
+    assert similarity.build_photo_hashes(workers=1)['hashed'] == 0
+    similar = similarity.find_similar_records('img/a.png', exclude=('boot', 1))
+    assert [(record['Путь'], distance <= 4) for record, distance in similar] == [('boot/a_small.png', True)]
+
+    # Замена файла пересчитывает только его хэш, а индекс поиска видит изменение
+    screenshot(os.path.join(db, 'img', 'b.png'), seed=1)
+    assert similarity.build_photo_hashes(workers=1)['hashed'] == 1
+    assert {record['Путь'] for record, _ in similarity.find_similar_records('img/a.png', exclude=('boot', 1))} == {'boot/a_small.png', 'boot/b.png'}
+
+    db_helpers.delete_records([('boot', 3)])
+    assert similarity.build_photo_hashes(workers=1)['removed'] == 1
@@ -0,0 +1,44 @@
+from code import db_helpers
+from code.db_helpers import RECORD_TAGS_TABLE, TAG_COUNTS_TABLE
+
+def counts_state():
+    """{tag_id: записей} по tag_counts (нулевые счетчики не в счет)."""
+    conn = db_helpers.get_db_connection()
+    return dict(conn.execute(f'SELECT tag_id, records FROM {TAG_COUNTS_TABLE} WHERE records != 0').fetchall())
+
+def expected_state():
+    """{tag_id: записей} по record_tags."""
+    conn = db_helpers.get_db_connection()
+    return dict(conn.execute(f'SELECT tag_id, COUNT(*) FROM {RECORD_TAGS_TABLE} GROUP BY tag_id').fetchall())
+
+def tag_id(name):
+    return db_helpers.get_db_connection().execute('SELECT id FROM tags WHERE name = ?', (name,)).fetchone()[0]
+
+def test_counts_follow_record_changes(make_table):
+    make_table('boot', [('boot/a.png', None, 'menu,ui'), ('boot/b.png', None, 'menu')])
+    make_table('cache', [('cache/a.png', None, 'ui')])
+    assert counts_state() == expected_state()
+    assert db_helpers.get_tag_counts() == {'menu': 2, 'ui': 2}
+
+    db_helpers.update_record('boot', 2, '', 'ui', None)
+    assert counts_state() == expected_state()
+    db_helpers.bulk_update_records([('boot', 1), ('cache', 1)], add_tags=['new'], remove_tags=['ui'])
+    assert counts_state() == expected_state()
+    db_helpers.delete_records([('boot', 1)])
+    assert counts_state() == expected_state()
+    assert db_helpers.get_tag_counts() == {'menu': 0, 'ui': 1, 'new': 1}
+
+def test_counts_follow_tag_rename_and_delete(make_table):
+    make_table('boot', [('boot/a.png', None, 'menu,ui'), ('boot/b.png', None, 'menu')])
+    db_helpers.update_tag(tag_id('menu'), 'main_menu', '')
+    assert counts_state() == expected_state()
+    assert db_helpers.get_tag_counts() == {'main_menu': 2, 'ui': 1}
+    deleted_id = tag_id('main_menu')
+    db_helpers.delete_tag(deleted_id)
+    assert counts_state() == expected_state()
+    assert db_helpers.get_db_connection().execute(f'SELECT 1 FROM {TAG_COUNTS_TABLE} WHERE tag_id = ?', (deleted_id,)).fetchone() is None
+
+def test_facets_match_counts(make_table):
+    make_table('boot', [('boot/menu/a.png', None, 'menu,ui'), ('boot/menu/b.png', None, 'menu'), ('boot/c.png', None, 'ui')])
+    assert db_helpers.get_tag_facets('menu') == {'menu': 2, 'ui': 1}
+    assert db_helpers.get_tag_facets(tag_list=['ui']) == {'menu': 1, 'ui': 2}
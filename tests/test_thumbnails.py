@@ -0,0 +1,69 @@
+import os
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from code import thumbnails
+from code.thumbnails import LIST_THUMB_SIZE, EDIT_THUMB_SIZE, thumbnail_key, get_thumbnail_path
+
+@pytest.fixture
+def photo(db, monkeypatch):
+    """Фото 900×600 в img/ временного BASE_DIR; миниатюры пишутся в tmp_path/thumbs."""
+    monkeypatch.setattr(thumbnails, 'BASE_DIR', str(db))
+    monkeypatch.setattr(thumbnails, 'THUMB_DIR', os.path.join(db, 'thumbs'))
+    Image.new('RGB', (900, 600), 'navy').save(os.path.join(db, 'img', 'shot.png'))
+    return 'img/shot.png'
+
+def cache_files(root):
+    return sorted(os.path.relpath(os.path.join(directory, name), root) for directory, _, names in os.walk(root) for name in names)
+
+class TestKey:
+    def test_depends_on_file_version_and_size(self, photo):
+        key = thumbnail_key(photo)
+        stat = os.stat(os.path.join(thumbnails.BASE_DIR, photo))
+        assert key == thumbnail_key(photo, LIST_THUMB_SIZE, (stat.st_size, stat.st_mtime_ns))
+        assert key != thumbnail_key(photo, EDIT_THUMB_SIZE)
+        assert key != thumbnail_key(photo, LIST_THUMB_SIZE, (stat.st_size, stat.st_mtime_ns + 1))
+        assert key != thumbnail_key(photo, LIST_THUMB_SIZE, (stat.st_size + 1, stat.st_mtime_ns))
+
+    def test_missing_photo_has_no_key(self, photo):
+        assert thumbnail_key('img/missing.png') is None
+        assert get_thumbnail_path('img/missing.png') is None
+        assert get_thumbnail_path('') is None
+
+    def test_replaced_photo_gets_new_thumbnail(self, photo):
+        first = get_thumbnail_path(photo)
+        full_path = os.path.join(thumbnails.BASE_DIR, photo)
+        Image.new('RGB', (300, 300), 'red').save(full_path)
+        os.utime(full_path, ns=(1, 1))
+        second = get_thumbnail_path(photo)
+        assert first != second and os.path.exists(first) and os.path.exists(second)
+
+class TestRender:
+    def test_thumbnail_fits_box(self, photo):
+        destination = get_thumbnail_path(photo)
+        assert destination == os.path.join(thumbnails.THUMB_DIR, thumbnail_key(photo)[:2], f'{thumbnail_key(photo)}.webp')
+        with Image.open(destination) as img:
+            assert img.format == 'WEBP' and img.size == (300, 200)
+
+    def test_failed_write_leaves_no_files(self, photo, monkeypatch):
+        def broken_save(self, fp, *args, **kwargs):
+            with open(fp, 'wb') as f: f.write(b'partial')
+            raise OSError('disk full')
+        monkeypatch.setattr(Image.Image, 'save', broken_save)
+        assert get_thumbnail_path(photo) is None
+        assert cache_files(thumbnails.THUMB_DIR) == []
+
+    def test_concurrent_renders_produce_one_file(self, photo):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = set(pool.map(lambda _: get_thumbnail_path(photo), range(16)))
+        assert len(results) == 1
+        key = thumbnail_key(photo)
+        assert cache_files(thumbnails.THUMB_DIR) == [os.path.join(key[:2], f'{key}.webp')]
+
+    def test_unreadable_photo_is_not_cached(self, photo):
+        with open(os.path.join(thumbnails.BASE_DIR, 'img', 'broken.png'), 'wb') as f:
+            f.write(b'not an image')
+        assert get_thumbnail_path('img/broken.png') is None
+        future = thumbnails.prefetch_thumbnails(['img/broken.png', photo, 'img/missing.png'])
+        assert future['img/broken.png'].result() is None and future['img/missing.png'].result() is None
+        assert future[photo].result() == thumbnail_key(photo)